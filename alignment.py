@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Assign diarization speakers to transcription segments
+
+The diarization is turned into sorted NumPy start/end/label arrays once and
+every segment is matched against the turns it can overlap in a single
+vectorized sweep, instead of rescanning all turns for each segment. Turns
+are grouped into classes of similar length (within a factor of two), so
+that in each class the turns a segment can overlap start no earlier than
+the class's longest turn before it; one long turn does not widen the
+search for the short ones.
+"""
+
+import numpy as np
+
+UNKNOWN_SPEAKER = "SPEAKER_UNKNOWN"
+
+# Segments are aligned in blocks so the (segment, turn) pair arrays stay small
+BLOCK_SIZE = 4096
+
+
+def diarization_turns(diarization):
+    """
+    Return diarization turns as a list of (start, end, speaker) tuples
+
+    Accepts a pyannote Annotation (anything with ``itertracks``) or an
+    iterable that already yields (start, end, speaker) tuples.
+    """
+    if hasattr(diarization, "itertracks"):
+        return [
+            (turn.start, turn.end, speaker)
+            for turn, _, speaker in diarization.itertracks(yield_label=True)
+        ]
+    return [(start, end, speaker) for start, end, speaker in diarization]
+
+
+def turns_to_arrays(turns):
+    """
+    Convert (start, end, speaker) turns to arrays sorted by start time
+
+    Returns (starts, ends, codes, order, labels): ``codes`` index into
+    ``labels`` and ``order`` holds each sorted turn's original position.
+    """
+    label_index = {}
+    codes = np.empty(len(turns), dtype=np.int64)
+    starts = np.empty(len(turns), dtype=np.float64)
+    ends = np.empty(len(turns), dtype=np.float64)
+    for i, (start, end, speaker) in enumerate(turns):
+        starts[i] = start
+        ends[i] = end
+        codes[i] = label_index.setdefault(speaker, len(label_index))
+
+    order = np.argsort(starts, kind="stable")
+    labels = list(label_index)
+    return starts[order], ends[order], codes[order], order, labels
+
+
+def assign_speakers(segments, diarization, unknown=UNKNOWN_SPEAKER):
+    """
+    Find the dominant speaker of every segment
+
+    A segment's speaker is the one with the largest total overlap, ties going
+    to the speaker whose overlapping turn comes first, and ``unknown`` when
+    no turn overlaps it -- the same result as scanning every turn per segment.
+    """
+    seg_starts = np.array([segment["start"] for segment in segments], dtype=np.float64)
+    seg_ends = np.array([segment["end"] for segment in segments], dtype=np.float64)
+
+    turns = diarization_turns(diarization)
+    if not turns or not len(seg_starts):
+        return [unknown] * len(seg_starts)
+
+    starts, ends, codes, order, labels = turns_to_arrays(turns)
+    classes = _duration_classes(starts, ends)
+
+    speakers = []
+    for offset in range(0, len(seg_starts), BLOCK_SIZE):
+        block_starts = seg_starts[offset:offset + BLOCK_SIZE]
+        block_ends = seg_ends[offset:offset + BLOCK_SIZE]
+        best = _dominant_codes(block_starts, block_ends, starts, ends, codes,
+                               order, classes, len(labels))
+        speakers.extend(labels[code] if code >= 0 else unknown for code in best)
+    return speakers
+
+
+def _duration_classes(starts, ends):
+    """
+    Group start-sorted turns by length into powers of two
+
+    Returns (indices, longest) per class: the class's turns (still sorted by
+    start) and its longest duration.
+    """
+    durations = np.maximum(ends - starts, 0.0)
+    _, exponents = np.frexp(durations)
+    classes = []
+    for exponent in np.unique(exponents):
+        indices = np.flatnonzero(exponents == exponent)
+        classes.append((indices, durations[indices].max()))
+    return classes
+
+
+def _candidate_pairs(seg_starts, seg_ends, starts, classes):
+    """(segment, turn) index pairs of every turn that can overlap each segment"""
+    seg_pairs, turn_pairs = [], []
+    for indices, longest in classes:
+        class_starts = starts[indices]
+        # A turn of this class that ends after the segment starts began after this
+        earliest = np.nextafter(seg_starts - longest, -np.inf)
+        lo = np.searchsorted(class_starts, earliest, side="left")
+        hi = np.searchsorted(class_starts, seg_ends, side="left")
+        counts = np.clip(hi - lo, 0, None)
+
+        first_pair = np.cumsum(counts) - counts
+        local = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(first_pair, counts)
+        seg_pairs.append(np.repeat(np.arange(len(seg_starts)), counts))
+        turn_pairs.append(indices[local])
+    return np.concatenate(seg_pairs), np.concatenate(turn_pairs)
+
+
+def _dominant_codes(seg_starts, seg_ends, starts, ends, codes, order, classes, n_labels):
+    """Return the dominant label code per segment, or -1 when none overlaps"""
+    n_segments = len(seg_starts)
+    seg_idx, turn_idx = _candidate_pairs(seg_starts, seg_ends, starts, classes)
+
+    overlap = (np.minimum(seg_ends[seg_idx], ends[turn_idx])
+               - np.maximum(seg_starts[seg_idx], starts[turn_idx]))
+    keep = overlap > 0
+    seg_idx, turn_idx, overlap = seg_idx[keep], turn_idx[keep], overlap[keep]
+
+    # Accumulate in the original turn order so float sums match a linear scan
+    original = order[turn_idx]
+    pair_order = np.lexsort((original, seg_idx))
+    seg_idx, original, overlap = seg_idx[pair_order], original[pair_order], overlap[pair_order]
+    keys = seg_idx * n_labels + codes[turn_idx[pair_order]]
+
+    totals = np.bincount(keys, weights=overlap, minlength=n_segments * n_labels)
+    first_seen = np.full(n_segments * n_labels, len(order), dtype=np.int64)
+    np.minimum.at(first_seen, keys, original)
+
+    totals = totals.reshape(n_segments, n_labels)
+    first_seen = first_seen.reshape(n_segments, n_labels)
+    present = first_seen < len(order)
+    best_total = np.where(present, totals, -np.inf).max(axis=1, keepdims=True)
+    tied = present & (totals == best_total)
+    best = np.argmin(np.where(tied, first_seen, len(order)), axis=1)
+    return np.where(present.any(axis=1), best, -1)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Decode audio once to 16 kHz mono float32 and share it across stages
+
+Whisper takes the NumPy samples directly and pyannote gets a torch view of
+the same memory, so the file is decoded a single time per run.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+import warnings
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from audio_stream import audio_info, decode_audio, decode_channels, downmix, resample
+from instrumentation import span
+
+SAMPLE_RATE = 16000
+
+
+class AudioBuffer:
+    """
+    Mono float32 samples at ``sample_rate`` plus decode statistics
+
+    ``bytes_copied`` counts sample bytes copied after the decoder produced
+    them (downmix, resampling, moving into shared memory). ``offset`` is
+    where the samples start in the source file, for buffers holding a
+    window of it.
+    """
+
+    def __init__(self, samples, sample_rate, source, decode_seconds=0.0, bytes_copied=0, offset=0.0):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.source = source
+        self.offset = offset
+        self.decode_seconds = decode_seconds
+        self.bytes_copied = bytes_copied
+        self._shm = None
+        self._owner = False
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def as_torch(self):
+        """Return a 1-D torch tensor sharing memory with ``samples``"""
+        import torch
+
+        with warnings.catch_warnings():
+            # Decoder output is read-only; the engines never write to their input
+            warnings.simplefilter("ignore", UserWarning)
+            return torch.from_numpy(self.samples)
+
+    def as_pyannote(self):
+        """Return the in-memory audio dict pyannote pipelines accept"""
+        return {
+            "waveform": self.as_torch().unsqueeze(0),
+            "sample_rate": self.sample_rate
+        }
+
+    def share(self):
+        """
+        Move the samples into shared memory
+
+        Afterwards the buffer pickles as a reference to the shared block, so
+        worker processes attach to it instead of receiving a copy.
+        """
+        if self._shm is not None:
+            return self
+        shm = shared_memory.SharedMemory(create=True, size=max(self.samples.nbytes, 1))
+        shared = np.ndarray(self.samples.shape, dtype=self.samples.dtype, buffer=shm.buf)
+        shared[:] = self.samples
+        self.bytes_copied += self.samples.nbytes
+        self.samples = shared
+        self._shm = shm
+        self._owner = True
+        return self
+
+    def close(self):
+        """Release the shared memory block, if any"""
+        if self._shm is None:
+            return
+        self.samples = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def report(self):
+        return (f"Decoded {self.duration:.1f}s of audio from {self.source} in "
+                f"{self.decode_seconds:.2f}s ({self.bytes_copied} bytes copied)")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._shm is not None:
+            state["samples"] = (self._shm.name, len(self.samples))
+        state["_shm"] = None
+        state["_owner"] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.samples, tuple):
+            name, length = self.samples
+            self._shm = _attach(name)
+            self.samples = np.ndarray((length,), dtype=np.float32, buffer=self._shm.buf)
+
+
+def _attach(name):
+    """Attach to a shared block owned (and unlinked) by the parent process"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Pool workers share the parent's resource tracker, so registering again is harmless
+    return shared_memory.SharedMemory(name=name)
+
+
+def load_audio(audio_file, sample_rate=SAMPLE_RATE):
+    """
+    Decode an audio file to mono float32 at ``sample_rate``
+
+    Uses ffmpeg when available; otherwise WAV files (and FLAC files, with
+    soundfile installed) go through the streaming front-end in
+    audio_stream and anything else is decoded with torchaudio. Raises
+    ValueError if the file cannot be decoded or contains no audio.
+    """
+    if not os.path.exists(audio_file):
+        raise FileNotFoundError(f"Audio file '{audio_file}' not found")
+
+    start = time.perf_counter()
+    with span("decode", source=audio_file):
+        if shutil.which("ffmpeg"):
+            samples, bytes_copied = _decode_ffmpeg(audio_file, sample_rate)
+        elif audio_info(audio_file) is not None:
+            samples, bytes_copied = decode_audio(audio_file, sample_rate)
+        else:
+            samples, bytes_copied = _decode_torchaudio(audio_file, sample_rate)
+
+    if not len(samples):
+        raise ValueError(f"No audio could be decoded from '{audio_file}'")
+
+    return AudioBuffer(samples, sample_rate, audio_file,
+                       decode_seconds=time.perf_counter() - start,
+                       bytes_copied=bytes_copied)
+
+
+def load_channels(audio_file, sample_rate=SAMPLE_RATE):
+    """
+    Decode each channel of an audio file to its own float32 AudioBuffer at ``sample_rate``
+
+    Uses the same decoders as load_audio, without the downmix. Raises
+    ValueError if the file cannot be decoded or contains no audio.
+    """
+    if not os.path.exists(audio_file):
+        raise FileNotFoundError(f"Audio file '{audio_file}' not found")
+
+    start = time.perf_counter()
+    with span("decode", source=audio_file, channels=True):
+        if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+            channels, bytes_copied = _decode_ffmpeg_channels(audio_file, sample_rate)
+        elif audio_info(audio_file) is not None:
+            channels, bytes_copied = decode_channels(audio_file, sample_rate)
+        else:
+            channels, bytes_copied = _decode_torchaudio_channels(audio_file, sample_rate)
+
+    if not channels or not len(channels[0]):
+        raise ValueError(f"No audio could be decoded from '{audio_file}'")
+
+    decode_seconds = time.perf_counter() - start
+    return [AudioBuffer(samples, sample_rate, audio_file, decode_seconds=decode_seconds,
+                        bytes_copied=bytes_copied // len(channels))
+            for samples in channels]
+
+
+def probe_duration(audio_file):
+    """Return the duration in seconds without decoding, or None if unknown"""
+    info = audio_info(audio_file)
+    if info is not None:
+        return info[1] / info[0]
+
+    if not shutil.which("ffprobe"):
+        return None
+    cmd = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", audio_file
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        return float(proc.stdout.strip())
+    except ValueError:
+        return None
+
+
+def _decode_ffmpeg(audio_file, sample_rate):
+    """Let ffmpeg downmix and resample; its output buffer is used as-is"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", audio_file,
+        "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(sample_rate), "-"
+    ]
+    proc = subprocess.run(cmd, capture_output=True)
+    if proc.returncode != 0:
+        raise ValueError(f"Failed to decode '{audio_file}': {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.float32), 0
+
+
+def _decode_ffmpeg_channels(audio_file, sample_rate):
+    """Let ffmpeg resample every channel; the interleaved output is split into channels"""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=channels",
+        "-of", "default=noprint_wrappers=1:nokey=1", audio_file
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        count = int(proc.stdout.split()[0])
+    except (ValueError, IndexError):
+        raise ValueError(f"Failed to read the channel count of '{audio_file}'") from None
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", audio_file,
+        "-f", "f32le", "-ac", str(count), "-acodec", "pcm_f32le", "-ar", str(sample_rate), "-"
+    ]
+    proc = subprocess.run(cmd, capture_output=True)
+    if proc.returncode != 0:
+        raise ValueError(f"Failed to decode '{audio_file}': {proc.stderr.decode(errors='replace').strip()}")
+    interleaved = np.frombuffer(proc.stdout, dtype=np.float32)
+    frames = interleaved[:len(interleaved) // count * count].reshape(-1, count)
+    channels = [np.ascontiguousarray(frames[:, c]) for c in range(count)]
+    return channels, sum(samples.nbytes for samples in channels)
+
+
+def _decode_torchaudio(audio_file, sample_rate):
+    """Decode with torchaudio; downmix and resample with the cached front-end filters"""
+    import torchaudio
+
+    try:
+        waveform, source_rate = torchaudio.load(audio_file)
+    except Exception as e:
+        raise ValueError(f"Failed to decode '{audio_file}': {e}") from e
+
+    samples = downmix(waveform.numpy().T)
+    bytes_copied = samples.nbytes
+    if source_rate != sample_rate:
+        with span("resample", source_rate=source_rate, target_rate=sample_rate):
+            samples = resample(samples, source_rate, sample_rate)
+        bytes_copied += samples.nbytes
+    return samples, bytes_copied
+
+
+def _decode_torchaudio_channels(audio_file, sample_rate):
+    """Decode with torchaudio and resample each channel with the cached front-end filters"""
+    import torchaudio
+
+    try:
+        waveform, source_rate = torchaudio.load(audio_file)
+    except Exception as e:
+        raise ValueError(f"Failed to decode '{audio_file}': {e}") from e
+
+    channels = [np.ascontiguousarray(channel, dtype=np.float32) for channel in waveform.numpy()]
+    if source_rate != sample_rate:
+        with span("resample", source_rate=source_rate, target_rate=sample_rate):
+            channels = [resample(samples, source_rate, sample_rate) for samples in channels]
+    return channels, sum(samples.nbytes for samples in channels)
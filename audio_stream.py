@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Streaming downmix and resampling front-end
+
+WAV files are memory-mapped and read a block at a time; other formats
+(FLAC, Ogg, AIFF) are decoded block by block with the optional soundfile
+package. Each block is averaged to float32 mono and resampled with a
+windowed-sinc filter built the way torchaudio's default Resample builds
+its own (sinc_interp_hann, lowpass_filter_width=6, rolloff=0.99); whether
+the output really matches torchaudio's is what bench_resample_torchaudio.py
+checks, and it has not yet been run with torchaudio. Filter kernels
+are cached per rate pair and the resampler carries its input tail from
+block to block, so the streamed output equals resampling the whole signal
+at once while memory stays at about one block.
+"""
+
+import math
+import os
+import struct
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# torchaudio.transforms.Resample defaults
+LOWPASS_FILTER_WIDTH = 6
+ROLLOFF = 0.99
+
+# Source audio read per block
+BLOCK_SECONDS = 10.0
+
+# WAVE_FORMAT_* tags
+PCM = 0x0001
+IEEE_FLOAT = 0x0003
+EXTENSIBLE = 0xFFFE
+
+
+@lru_cache(maxsize=None)
+def sinc_kernel(orig_freq, new_freq, lowpass_filter_width=LOWPASS_FILTER_WIDTH, rolloff=ROLLOFF):
+    """
+    Return (kernel, width) for resampling ``orig_freq`` to ``new_freq``
+
+    The rates must already be divided by their GCD. ``kernel`` holds one
+    row of ``2 * width + orig_freq`` taps per output phase. This is a port
+    of torchaudio's _get_sinc_resample_kernel, computed in float64 and
+    stored as float32 like torchaudio does.
+    """
+    base_freq = min(orig_freq, new_freq) * rolloff
+    width = math.ceil(lowpass_filter_width * orig_freq / base_freq)
+    idx = np.arange(-width, width + orig_freq, dtype=np.float64) / orig_freq
+    # torchaudio computes the phase offsets in float32 before adding them
+    phases = (np.arange(0, -new_freq, -1) / new_freq).astype(np.float32).astype(np.float64)
+    t = (phases[:, None] + idx) * base_freq
+    t = np.clip(t, -lowpass_filter_width, lowpass_filter_width)
+    window = np.cos(t * math.pi / lowpass_filter_width / 2) ** 2
+    t *= math.pi
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kernel = np.where(t == 0, 1.0, np.sin(t) / t)
+    kernel *= window * (base_freq / orig_freq)
+    kernel = kernel.astype(np.float32)
+    kernel.flags.writeable = False
+    return kernel, width
+
+
+class StreamingResampler:
+    """
+    Resample a mono float32 stream block by block
+
+    Feed blocks to ``process`` and call ``flush`` after the last one. The
+    concatenated output is the same as resampling the whole signal in one
+    go: input that the filter still needs is kept for the next block.
+    """
+
+    def __init__(self, orig_freq, new_freq):
+        gcd = math.gcd(orig_freq, new_freq)
+        self.orig = orig_freq // gcd
+        self.new = new_freq // gcd
+        self.received = 0
+        self.emitted = 0
+        if self.orig == self.new:
+            self.kernel, self.width = None, 0
+        else:
+            self.kernel, self.width = sinc_kernel(self.orig, self.new)
+        # Input not yet consumed by an output frame, starting with the filter's left padding
+        self._pending = np.zeros(self.width, dtype=np.float32)
+
+    def output_length(self, input_length):
+        """Number of output samples for ``input_length`` input samples"""
+        return -(-self.new * input_length // self.orig)
+
+    def process(self, block):
+        """Return the output samples that ``block`` completes"""
+        block = np.asarray(block, dtype=np.float32)
+        self.received += len(block)
+        if self.kernel is None:
+            self.emitted += len(block)
+            return block
+        self._pending = np.concatenate([self._pending, block])
+        return self._run()
+
+    def flush(self):
+        """Return the remaining output, padding the end of the signal with zeros"""
+        if self.kernel is None:
+            return np.empty(0, dtype=np.float32)
+        remaining = self.output_length(self.received) - self.emitted
+        self._pending = np.concatenate([self._pending, np.zeros(self.width + self.orig, dtype=np.float32)])
+        out = self._run()[:remaining]
+        self.emitted = self.output_length(self.received)
+        self._pending = np.zeros(self.width, dtype=np.float32)
+        return out
+
+    def _run(self):
+        taps = 2 * self.width + self.orig
+        frames = (len(self._pending) - taps) // self.orig + 1
+        if frames <= 0:
+            return np.empty(0, dtype=np.float32)
+        # Frame j covers pending[j * orig : j * orig + taps] and yields ``new`` samples
+        windows = sliding_window_view(self._pending, taps)[::self.orig][:frames]
+        out = (windows @ self.kernel.T).reshape(-1)
+        self._pending = self._pending[frames * self.orig:]
+        self.emitted += len(out)
+        return out
+
+
+def resample(samples, orig_freq, new_freq, block_seconds=BLOCK_SECONDS):
+    """
+    Resample a whole mono signal
+
+    Uses the filter of ``torchaudio.functional.resample(samples, orig_freq,
+    new_freq)`` with its defaults, processed in blocks to bound temporary
+    memory.
+    """
+    resampler = StreamingResampler(orig_freq, new_freq)
+    if resampler.kernel is None:
+        return np.asarray(samples, dtype=np.float32)
+    step = max(int(block_seconds * orig_freq), 1)
+    out = np.empty(resampler.output_length(len(samples)), dtype=np.float32)
+    position = 0
+    for i in range(0, len(samples), step):
+        block = resampler.process(samples[i:i + step])
+        out[position:position + len(block)] = block
+        position += len(block)
+    block = resampler.flush()
+    out[position:position + len(block)] = block
+    return out
+
+
+def downmix(block, out=None):
+    """
+    Average a (frames, channels) block to mono float32 in [-1, 1)
+
+    Integer PCM is converted one block at a time, so the multichannel
+    signal is never held at full precision. ``out`` receives the result
+    if given.
+    """
+    if block.ndim == 3:
+        block = _int24(block)
+    mono = np.mean(block, axis=1, dtype=np.float32, out=out)
+    if block.dtype == np.uint8:
+        mono -= np.float32(128)
+        mono /= np.float32(128)
+    elif block.dtype.kind == "i":
+        mono /= np.float32(2 ** (8 * block.dtype.itemsize - 1))
+    return mono
+
+
+def _int24(block):
+    """Widen 24-bit PCM stored as (frames, channels, 3) bytes to int32"""
+    wide = np.zeros(block.shape[:2] + (4,), dtype=np.uint8)
+    wide[..., 1:] = block
+    return wide.view("<i4")[..., 0]
+
+
+def open_wav(path):
+    """
+    Memory-map the sample data of a WAV file
+
+    Returns (frames, sample_rate), where ``frames`` is a read-only
+    (n, channels) array over the file (24-bit PCM comes as
+    (n, channels, 3) bytes), or None if this is not a WAV file in a
+    supported encoding: 8/16/24/32-bit PCM or 32/64-bit float.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+            if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WAVE":
+                return None
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    return None
+                name, size = struct.unpack("<4sI", chunk)
+                if name == b"fmt ":
+                    fmt = f.read(size)
+                    f.seek(size % 2, os.SEEK_CUR)
+                elif name == b"data":
+                    offset = f.tell()
+                    break
+                else:
+                    f.seek(size + size % 2, os.SEEK_CUR)
+    except OSError:
+        return None
+    if fmt is None or len(fmt) < 16:
+        return None
+
+    tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if tag == EXTENSIBLE and len(fmt) >= 26:
+        tag = struct.unpack("<H", fmt[24:26])[0]
+    if tag == PCM:
+        dtype = {8: np.uint8, 16: np.dtype("<i2"), 24: np.uint8, 32: np.dtype("<i4")}.get(bits)
+    elif tag == IEEE_FLOAT:
+        dtype = {32: np.dtype("<f4"), 64: np.dtype("<f8")}.get(bits)
+    else:
+        dtype = None
+    if dtype is None or not channels or not sample_rate or block_align != channels * bits // 8:
+        return None
+
+    # Streamed WAV files may leave the data size unset; trust the file length
+    size = min(size, os.path.getsize(path) - offset)
+    count = size // block_align
+    shape = (count, channels, 3) if bits == 24 else (count, channels)
+    if not count:
+        return np.empty(shape, dtype=dtype), sample_rate
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape), sample_rate
+
+
+def _soundfile_info(path):
+    try:
+        import soundfile
+    except ImportError:
+        return None
+    try:
+        info = soundfile.info(path)
+    except Exception:
+        return None
+    return info.samplerate, info.frames
+
+
+def _soundfile_blocks(path, block_frames):
+    import soundfile
+
+    with soundfile.SoundFile(path) as f:
+        yield from f.blocks(block_frames, dtype="float32", always_2d=True)
+
+
+def audio_info(path):
+    """
+    Return (sample_rate, frames) if the front-end can read ``path``, else None
+
+    WAV is always supported; other formats need soundfile.
+    """
+    wav = open_wav(path)
+    if wav is not None:
+        return wav[1], len(wav[0])
+    return _soundfile_info(path)
+
+
+def _read_blocks(data, step):
+    """
+    Read a memory-mapped WAV's frames ``step`` at a time with plain file reads
+
+    Pages touched through the map stay in the process's resident set until
+    the map is closed, so a pass over a long file would grow it to the
+    file's size; read blocks are released as soon as they are used.
+    """
+    if not isinstance(data, np.memmap):
+        yield from (data[i:i + step] for i in range(0, len(data), step))
+        return
+    frame_shape = data.shape[1:]
+    frame_bytes = data.dtype.itemsize * int(np.prod(frame_shape))
+    with open(data.filename, "rb") as f:
+        f.seek(data.offset)
+        for first in range(0, len(data), step):
+            count = min(step, len(data) - first)
+            yield np.frombuffer(f.read(count * frame_bytes), dtype=data.dtype).reshape((count, *frame_shape))
+
+
+def _source_blocks(path, block_seconds, mapped=True):
+    """
+    Return (sample_rate, frames, iterator of (n, channels) blocks)
+
+    WAV blocks are views of a memory map, or with ``mapped=False`` read
+    from the file one at a time.
+    """
+    wav = open_wav(path)
+    if wav is not None:
+        data, sample_rate = wav
+        step = max(int(block_seconds * sample_rate), 1)
+        if not mapped:
+            return sample_rate, len(data), _read_blocks(data, step)
+        return sample_rate, len(data), (data[i:i + step] for i in range(0, len(data), step))
+    info = _soundfile_info(path)
+    if info is None:
+        raise ValueError(f"'{path}' is not a supported WAV file, and soundfile cannot read it")
+    sample_rate, frames = info
+    return sample_rate, frames, _soundfile_blocks(path, max(int(block_seconds * sample_rate), 1))
+
+
+def stream_audio(path, sample_rate, block_seconds=BLOCK_SECONDS):
+    """Yield mono float32 blocks of the file at ``sample_rate``, in memory bounded by the block size"""
+    source_rate, _, blocks = _source_blocks(path, block_seconds, mapped=False)
+    resampler = StreamingResampler(source_rate, sample_rate)
+    for block in blocks:
+        out = resampler.process(downmix(block))
+        if len(out):
+            yield out
+    out = resampler.flush()
+    if len(out):
+        yield out
+
+
+def decode_audio(path, sample_rate):
+    """
+    Decode the whole file to mono float32 at ``sample_rate``
+
+    Returns (samples, bytes_copied). Blocks at the target rate are
+    downmixed straight into the result; resampled blocks are copied into it.
+    """
+    source_rate, frames, blocks = _source_blocks(path, BLOCK_SECONDS)
+    resampler = StreamingResampler(source_rate, sample_rate)
+    samples = np.empty(resampler.output_length(frames), dtype=np.float32)
+    position = 0
+    bytes_copied = 0
+    for block in blocks:
+        if resampler.kernel is None:
+            block = block[:len(samples) - position]
+            downmix(block, out=samples[position:position + len(block)])
+            position += len(block)
+            continue
+        out = resampler.process(downmix(block))[:len(samples) - position]
+        samples[position:position + len(out)] = out
+        position += len(out)
+        bytes_copied += out.nbytes
+    out = resampler.flush()[:len(samples) - position]
+    samples[position:position + len(out)] = out
+    position += len(out)
+    bytes_copied += out.nbytes
+    return samples[:position], bytes_copied
+
+
+def decode_channels(path, sample_rate):
+    """
+    Decode each channel of the file separately to float32 at ``sample_rate``
+
+    Returns (list of per-channel arrays, bytes_copied); every channel has
+    its own resampler, so each matches decoding that channel alone.
+    """
+    source_rate, frames, blocks = _source_blocks(path, BLOCK_SECONDS)
+    resamplers = channels = None
+    position = 0
+    bytes_copied = 0
+    for block in blocks:
+        if channels is None:
+            resamplers = [StreamingResampler(source_rate, sample_rate) for _ in range(block.shape[1])]
+            length = resamplers[0].output_length(frames)
+            channels = [np.empty(length, dtype=np.float32) for _ in resamplers]
+        for samples, resampler, c in zip(channels, resamplers, range(len(channels))):
+            out = resampler.process(downmix(block[:, c:c + 1]))[:len(samples) - position]
+            samples[position:position + len(out)] = out
+            bytes_copied += out.nbytes
+        position += len(out)
+    if channels is None:
+        return [], 0
+    end = position
+    for samples, resampler in zip(channels, resamplers):
+        out = resampler.flush()[:len(samples) - position]
+        samples[position:position + len(out)] = out
+        bytes_copied += out.nbytes
+        end = position + len(out)
+    return [samples[:end] for samples in channels], bytes_copied
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Transcribe a directory or manifest of recordings with a pool of workers
+
+Each worker process loads the models once and keeps them for every file it
+is given. Files are scheduled longest first so one long recording does not
+end up running alone at the end, files whose output already exists are
+skipped, and a JSON summary with per-file timings and errors is written
+at the end.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from audio_io import load_audio, probe_duration
+from transcribe_only import save_transcription, transcription_path
+from transcriber import results_path, save_results, transcribe_with_speakers
+from worker import DEFAULT_LOADER, resolve_loader
+from writers import FORMATS, parse_formats
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".webm", ".mp4")
+
+# Rough bytes per second of a 128 kbps file, for ordering when duration is unknown
+BYTES_PER_SECOND_ESTIMATE = 16000
+
+MODES = ("speakers", "transcribe")
+
+# Loads only the Whisper engine; used instead of DEFAULT_LOADER in transcribe mode
+TRANSCRIBE_LOADER = "transcriber:load_transcription_models"
+
+# Per-process state set up by _init_worker
+_models = None
+_hf_token = None
+_started = None
+
+
+def find_audio_files(source):
+    """
+    List the audio files in a directory, or the paths listed in a manifest
+
+    A manifest is a text file with one path per line; blank lines and lines
+    starting with '#' are ignored and relative paths are resolved against
+    the manifest's directory.
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(AUDIO_EXTENSIONS)
+        )
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        paths = [line.strip() for line in f]
+    return [os.path.join(base_dir, path) for path in paths if path and not path.startswith("#")]
+
+
+def output_path(audio_file, output_format, mode):
+    """Return the file a job writes, used to skip completed work"""
+    if mode == "speakers":
+        return results_path(audio_file, output_format)
+    return transcription_path(audio_file, output_format)
+
+
+def is_done(audio_file, output_format, mode):
+    """True when every output of a job (one format or a list) already exists"""
+    formats = [output_format] if isinstance(output_format, str) else output_format
+    return all(os.path.exists(output_path(audio_file, fmt, mode)) for fmt in formats)
+
+
+def schedule(audio_files):
+    """Return (audio_file, estimated_seconds) pairs, longest first"""
+    jobs = []
+    for audio_file in audio_files:
+        duration = probe_duration(audio_file)
+        if duration is None:
+            duration = os.path.getsize(audio_file) / BYTES_PER_SECOND_ESTIMATE
+        jobs.append((audio_file, duration))
+    return sorted(jobs, key=lambda job: job[1], reverse=True)
+
+
+def _init_worker(loader_spec, hf_token, started):
+    """Pool initializer: load the models once per worker process"""
+    global _models, _hf_token, _started
+    _hf_token = hf_token
+    _started = started
+    _models = resolve_loader(loader_spec)(hf_token)
+
+
+def _run_job(audio_file, output_format, mode, concurrency):
+    """Process one file inside a worker and return its summary record"""
+    # Written before any work, so the parent knows which files a dead worker was running
+    _started.put(audio_file)
+    record = {"audio_file": audio_file, "worker": os.getpid()}
+    start = time.perf_counter()
+    try:
+        if mode == "speakers":
+            result = transcribe_with_speakers(audio_file, _hf_token, concurrency, _models)
+            record["output_file"] = save_results(result, audio_file, output_format)
+        else:
+            audio = load_audio(audio_file)
+            result = _models.transcribe(audio)
+            record["output_file"] = save_transcription(result, audio_file, output_format)
+        record["status"] = "done"
+        record["segments"] = len(result["segments"])
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def _run_pool(jobs, workers, loader_spec, hf_token, output_format, mode, concurrency, on_record):
+    """
+    Run jobs in one worker pool, handing each finished record to on_record
+
+    A worker process that dies (e.g. killed for running out of memory)
+    breaks the whole pool and fails every job still in it. Returns
+    (crashed, unstarted, any_started): the jobs that were running when that
+    happened, the jobs that never started, and whether any job started at
+    all.
+    """
+    context = multiprocessing.get_context("spawn")
+    started = context.SimpleQueue()
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(loader_spec, hf_token, started)
+    )
+    broken = []
+    with executor:
+        futures = {
+            executor.submit(_run_job, audio_file, output_format, mode, concurrency): (audio_file, duration)
+            for audio_file, duration in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+                continue
+            on_record(futures[future], record)
+
+    running = set()
+    while not started.empty():
+        running.add(started.get())
+    crashed = [job for job in broken if job[0] in running]
+    unstarted = [job for job in broken if job[0] not in running]
+    return crashed, unstarted, bool(running)
+
+
+def run_batch(audio_files, output_format="txt", mode="speakers", workers=1,
+              loader_spec=DEFAULT_LOADER, hf_token=None, concurrency="sequential",
+              overwrite=False):
+    """
+    Process many files across a pool of workers and return the summary
+
+    If a worker process dies, only the file it was running fails: the pool
+    is rebuilt and the files that had not started are run again. When
+    several files were running at the time, each is retried alone to find
+    the one that killed its worker.
+    """
+    start = time.perf_counter()
+    records = []
+    pending = []
+    for audio_file, duration in schedule(audio_files):
+        if not overwrite and is_done(audio_file, output_format, mode):
+            records.append({"audio_file": audio_file, "status": "skipped",
+                            "audio_seconds": round(duration, 3)})
+        else:
+            pending.append((audio_file, duration))
+    if mode == "transcribe" and loader_spec == DEFAULT_LOADER:
+        # No diarization in this mode, so the workers don't load pyannote
+        loader_spec = TRANSCRIBE_LOADER
+
+    def add_record(job, record):
+        audio_file, duration = job
+        record["audio_seconds"] = round(duration, 3)
+        records.append(record)
+        print(f"[{len(records)}/{len(audio_files)}] {record['status']}: {audio_file}")
+
+    def worker_died(job, error):
+        add_record(job, {"audio_file": job[0], "status": "failed", "error": error})
+
+    print(f"{len(pending)} file(s) to process, {len(records)} already done, {workers} worker(s)")
+    run = lambda jobs, count: _run_pool(jobs, count, loader_spec, hf_token, output_format, mode,
+                                        concurrency, add_record)
+    while pending:
+        crashed, pending, any_started = run(pending, workers)
+        if not any_started:
+            # The workers died before running anything, e.g. while loading the models
+            for job in pending:
+                worker_died(job, "BrokenProcessPool: the worker processes died before starting a job")
+            break
+        if pending or crashed:
+            print(f"A worker process died; {len(crashed)} file(s) were running, "
+                  f"{len(pending)} will be retried")
+        if len(crashed) > 1:
+            # Only one of them killed its worker: run each alone to tell which
+            crashed = [job for job in crashed if any(run([job], 1)[:2])]
+        for job in crashed:
+            worker_died(job, "BrokenProcessPool: the worker process died while running this file")
+
+    counts = {status: sum(r["status"] == status for r in records)
+              for status in ("done", "skipped", "failed")}
+    return {
+        "mode": mode,
+        "output_format": output_format,
+        "workers": workers,
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        **counts,
+        "files": records
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe many recordings with a pool of workers")
+    parser.add_argument("source", help="directory of audio files, or a manifest with one path per line")
+    parser.add_argument("--format", dest="output_format", default=["txt"], type=parse_formats,
+                        help=f"output format, or several separated by commas; one of {', '.join(FORMATS)} "
+                             "(default: txt)")
+    parser.add_argument("--mode", default="speakers", choices=MODES,
+                        help="transcribe with speaker labels (default) or transcription only")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes, each holding its own models (default: 1)")
+    parser.add_argument("--concurrency", default="sequential", choices=["sequential", "thread"],
+                        help="how each job runs its two stages (default: sequential)")
+    parser.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"),
+                        help="HuggingFace token (default: $HF_TOKEN)")
+    parser.add_argument("--loader", default=DEFAULT_LOADER,
+                        help="model loader as module:function, e.g. stub_engines:load_stub_models")
+    parser.add_argument("--overwrite", action="store_true", help="redo files whose output already exists")
+    parser.add_argument("--summary", default="batch_summary.json",
+                        help="where to write the JSON summary (default: batch_summary.json)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"Error: '{args.source}' not found")
+        sys.exit(1)
+
+    audio_files = find_audio_files(args.source)
+    missing = [path for path in audio_files if not os.path.exists(path)]
+    if missing:
+        print(f"Error: {len(missing)} listed file(s) not found, e.g. '{missing[0]}'")
+        sys.exit(1)
+
+    summary = run_batch(audio_files, args.output_format, args.mode, args.workers,
+                        args.loader, args.hf_token, args.concurrency, args.overwrite)
+    with open(args.summary, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\nDone: {summary['done']}, skipped: {summary['skipped']}, failed: {summary['failed']} "
+          f"in {summary['wall_seconds']:.1f}s")
+    print(f"Summary saved to: {args.summary}")
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
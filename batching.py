@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Transcribe many short clips with few engine calls
+
+Clips are grouped by length into batches, and each batch is laid end to end
+with a short silence between the clips. The combined buffer goes through
+Whisper (and optionally the diarizer) once, and the results are split back
+per clip: words and turns are assigned to the clip they fall in and shifted
+to that clip's own timeline. This saves the fixed cost an engine pays on
+every call (padding to a 30 s window, language detection, pipeline setup);
+the concatenating and splitting cost about 1 ms per clip, so batching only
+wins when that fixed cost is larger. Whisper detects the language once per
+call, so a batch of several clips needs the language to be given.
+"""
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from alignment import assign_speakers
+from audio_io import SAMPLE_RATE, AudioBuffer
+from instrumentation import span
+
+# Silence between clips, so no Whisper segment or speaker turn straddles two of them
+GAP_SECONDS = 1.0
+
+# Clips up to this long are batched; longer ones gain little and run alone
+BATCH_CLIP_SECONDS = 30.0
+MAX_BATCH = 16
+# Upper bound on a batch's combined length, gaps included
+MAX_BATCH_SECONDS = 300.0
+
+
+def plan_batches(clips, max_batch=MAX_BATCH, max_batch_seconds=MAX_BATCH_SECONDS,
+                 max_clip_seconds=BATCH_CLIP_SECONDS, gap_seconds=GAP_SECONDS):
+    """
+    Group (item, duration) pairs into batches of items
+
+    Short clips are sorted by length and packed in that order, so clips of
+    similar length end up together and every batch but the last is close to
+    full. Clips that are long or of unknown length get a batch of their own.
+    """
+    batches = []
+    short = []
+    for index, (item, duration) in enumerate(clips):
+        if duration is None or duration > max_clip_seconds:
+            batches.append([item])
+        else:
+            short.append((duration, index, item))
+
+    current = []
+    total = 0.0
+    for duration, _, item in sorted(short):
+        if current and (len(current) >= max_batch or total + gap_seconds + duration > max_batch_seconds):
+            batches.append(current)
+            current = []
+            total = 0.0
+        total += duration + (gap_seconds if current else 0.0)
+        current.append(item)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def concatenate(buffers, gap_seconds=GAP_SECONDS, sample_rate=SAMPLE_RATE):
+    """
+    Join AudioBuffers with silence between them
+
+    Returns the combined AudioBuffer and each clip's (start, end) in it.
+    """
+    gap = int(gap_seconds * sample_rate)
+    total = sum(len(buffer.samples) for buffer in buffers) + gap * max(len(buffers) - 1, 0)
+    samples = np.zeros(total, dtype=np.float32)
+    spans = []
+    position = 0
+    for buffer in buffers:
+        samples[position:position + len(buffer.samples)] = buffer.samples
+        spans.append((position / sample_rate, (position + len(buffer.samples)) / sample_rate))
+        position += len(buffer.samples) + gap
+    combined = AudioBuffer(samples, sample_rate, f"batch of {len(buffers)} clip(s)",
+                           bytes_copied=samples.nbytes)
+    return combined, spans
+
+
+def _clip_index(start, end, spans, clip_starts):
+    """The clip a word lies in: the one it overlaps most, or the nearest if it lies in a gap"""
+    middle = bisect_right(clip_starts, (start + end) / 2) - 1
+    best, best_key = None, None
+    for i in (middle - 1, middle, middle + 1):
+        if not 0 <= i < len(spans):
+            continue
+        clip_start, clip_end = spans[i]
+        overlap = min(end, clip_end) - max(start, clip_start)
+        key = (max(overlap, 0.0), min(overlap, 0.0))
+        if best_key is None or key > best_key:
+            best, best_key = i, key
+    return best
+
+
+def _clip_segment(segment, words, clip_span, whole):
+    """Shift a segment, or the given run of its words, to clip time inside the clip"""
+    offset, duration = clip_span[0], clip_span[1] - clip_span[0]
+
+    def clip_time(seconds):
+        # Times Whisper placed in the silence are pulled inside the clip
+        return min(max(seconds - offset, 0.0), duration)
+
+    piece = dict(segment)
+    if words is not None:
+        words = [{**word, "start": clip_time(word["start"]), "end": clip_time(word["end"])} for word in words]
+        piece["words"] = words
+    if whole:
+        piece["start"], piece["end"] = clip_time(segment["start"]), clip_time(segment["end"])
+    else:
+        piece["start"], piece["end"] = words[0]["start"], words[-1]["end"]
+        piece["text"] = "".join(word["word"] for word in words)
+    piece["end"] = max(piece["end"], piece["start"])
+    return piece
+
+
+def split_segments(segments, spans):
+    """
+    Split a combined transcription into per-clip segment lists in clip time
+
+    Segments are only cut at the silences between clips: each word goes to
+    the clip it overlaps most (the nearest one if it lies in a gap), and a
+    segment is cut where its words move to another clip. A segment without
+    word timestamps that overlaps several clips cannot be cut; those clips
+    are left empty and their indices returned, for the caller to transcribe
+    them alone. Returns (per_clip, unsplit).
+    """
+    clip_starts = [start for start, _ in spans]
+    clip_ends = [end for _, end in spans]
+    per_clip = [[] for _ in spans]
+    unsplit = set()
+    for segment in segments:
+        words = segment.get("words")
+        if words:
+            pieces = []
+            for word in words:
+                clip = _clip_index(word["start"], word["end"], spans, clip_starts)
+                if pieces and pieces[-1][0] == clip:
+                    pieces[-1][1].append(word)
+                else:
+                    pieces.append((clip, [word]))
+        else:
+            first = bisect_right(clip_ends, segment["start"])
+            last = bisect_left(clip_starts, segment["end"])
+            if last - first > 1:
+                unsplit.update(range(first, last))
+                continue
+            pieces = [(_clip_index(segment["start"], segment["end"], spans, clip_starts), None)]
+        for clip, clip_words in pieces:
+            per_clip[clip].append(_clip_segment(segment, clip_words, spans[clip], len(pieces) == 1))
+
+    for clip in unsplit:
+        per_clip[clip] = []
+    return per_clip, sorted(unsplit)
+
+
+def split_turns(turns, spans):
+    """
+    Split combined diarization turns per clip, in clip time
+
+    Speakers are renumbered per clip in order of first appearance, since
+    one diarizer run labels the voices of all clips together.
+    """
+    per_clip = []
+    for start, end in spans:
+        labels = {}
+        clip_turns = []
+        for turn_start, turn_end, speaker in turns:
+            if turn_end <= start or turn_start >= end:
+                continue
+            label = labels.setdefault(speaker, f"SPEAKER_{len(labels):02d}")
+            clip_turns.append((max(turn_start, start) - start, min(turn_end, end) - start, label))
+        per_clip.append(clip_turns)
+    return per_clip
+
+
+def transcribe_batch(buffers, transcribe, diarize=None, gap_seconds=GAP_SECONDS, language=None):
+    """
+    Transcribe AudioBuffers with one ``transcribe`` call (and one ``diarize`` call)
+
+    Without ``diarize``, returns one Whisper-shaped result per buffer; with
+    it, one transcribe_with_speakers-shaped result. Every clip is decoded
+    in ``language``: Whisper detects the language once per call, from the
+    start of the audio, so several clips without a language raise
+    ValueError instead of being decoded in the first clip's language.
+    Clips whose segments cannot be split apart (an engine without word
+    timestamps) are transcribed again on their own.
+    """
+    if not buffers:
+        return []
+    if language is None and len(buffers) > 1:
+        raise ValueError("Clips batched into one engine call share its language detection; "
+                         "give the language of the clips")
+
+    options = {"word_timestamps": True, "condition_on_previous_text": False}
+    if language is not None:
+        options["language"] = language
+    combined, spans = concatenate(buffers, gap_seconds)
+    with span("transcription", clips=len(buffers), audio_seconds=round(combined.duration, 3)):
+        # Earlier clips must not steer the decoding of later ones
+        result = transcribe(combined, **options)
+    language = language or result.get("language", "unknown")
+    per_clip, unsplit = split_segments(result["segments"], spans)
+    for clip in unsplit:
+        with span("transcription", clips=1, audio_seconds=round(buffers[clip].duration, 3)):
+            per_clip[clip] = transcribe(buffers[clip], **options)["segments"]
+
+    if diarize is None:
+        return [{
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": [{**segment, "id": i} for i, segment in enumerate(segments)],
+            "language": language
+        } for segments in per_clip]
+
+    with span("diarization", clips=len(buffers), audio_seconds=round(combined.duration, 3)):
+        turns = diarize(combined)
+
+    results = []
+    for segments, clip_turns in zip(per_clip, split_turns(turns, spans)):
+        with span("alignment", segments=len(segments), turns=len(clip_turns)):
+            speakers = assign_speakers(segments, clip_turns)
+        results.append({
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": [{
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": segment["text"],
+                "speaker": speaker
+            } for segment, speaker in zip(segments, speakers)],
+            "language": language
+        })
+    return results
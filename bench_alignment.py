@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for speaker alignment: vectorized sweep vs nested turn scan
+"""
+
+import random
+import sys
+import time
+
+from alignment import assign_speakers
+
+
+def nested_scan(segments, turns, unknown="SPEAKER_UNKNOWN"):
+    """The original per-segment scan over every diarization turn"""
+    speakers = []
+    for segment in segments:
+        speaker_time = {}
+        for turn_start, turn_end, speaker in turns:
+            overlap_start = max(segment["start"], turn_start)
+            overlap_end = min(segment["end"], turn_end)
+            if overlap_start < overlap_end:
+                speaker_time[speaker] = speaker_time.get(speaker, 0) + overlap_end - overlap_start
+        speakers.append(max(speaker_time, key=speaker_time.get) if speaker_time else unknown)
+    return speakers
+
+
+def synthetic(n_segments, n_turns, n_speakers=8, seed=0, long_turn=False):
+    """
+    Build a meeting-like timeline of Whisper segments and diarization turns
+
+    ``long_turn`` adds one turn at the start that spans the whole recording,
+    such as a background speaker or music labelled as one long turn.
+    """
+    rng = random.Random(seed)
+    duration = n_turns * 1.5
+    turns = []
+    t = 0.0
+    for _ in range(n_turns):
+        length = rng.uniform(0.2, 2.8)
+        # Occasional overlapping speech
+        start = max(0.0, t - rng.uniform(0, 0.5)) if rng.random() < 0.1 else t
+        turns.append((start, start + length, f"SPEAKER_{rng.randrange(n_speakers):02d}"))
+        t = start + length + rng.uniform(0, 0.3)
+    segments = []
+    step = duration / n_segments
+    for i in range(n_segments):
+        start = i * step + rng.uniform(0, step * 0.2)
+        segments.append({"start": start, "end": start + rng.uniform(0.5, step * 1.5)})
+    if long_turn:
+        turns.insert(0, (0.0, duration, "SPEAKER_LONG"))
+    return segments, turns
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main():
+    sizes = [(100, 500), (1000, 5000), (2000, 10000), (10000, 50000)]
+    cases = [(n_segments, n_turns, False) for n_segments, n_turns in sizes]
+    cases += [(n_segments, n_turns, True) for n_segments, n_turns in sizes[1:]]
+    # The nested scan is quadratic; skip it above this many pairs
+    scan_limit = int(sys.argv[1]) if len(sys.argv) > 1 else 2 * 10**7
+
+    print(f"{'segments':>9} {'turns':>7} {'long turn':>10} {'sweep (s)':>10} {'scan (s)':>10} {'speedup':>8}")
+    for n_segments, n_turns, long_turn in cases:
+        segments, turns = synthetic(n_segments, n_turns, long_turn=long_turn)
+        fast, fast_time = timed(assign_speakers, segments, turns)
+        row = f"{n_segments:>9} {n_turns:>7} {'yes' if long_turn else 'no':>10} {fast_time:>10.4f}"
+        if n_segments * n_turns <= scan_limit:
+            slow, slow_time = timed(nested_scan, segments, turns)
+            assert fast == slow, "sweep and nested scan disagree"
+            print(f"{row} {slow_time:>10.4f} {slow_time / fast_time:>7.0f}x")
+        else:
+            print(f"{row} {'skipped':>10} {'':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Check that batch.py survives a worker process that dies mid-file
+
+Writes a directory of short synthetic WAV files, one of them named so
+that stub_engines.load_crashing_models kills the worker process that
+transcribes it (as an out-of-memory kill would). Runs the batch with one
+and with several workers, in both modes, and checks that only that file
+fails and every other file is written.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from batch import find_audio_files, run_batch
+from synthetic_audio import synthesize, write_wav
+
+LOADER = "stub_engines:load_crashing_models"
+
+
+def write_files(directory, count, seconds):
+    for i in range(count):
+        samples, _ = synthesize(seconds + i, 2, 0.1, seed=i)
+        name = "crash.wav" if i == count // 2 else f"clip{i:02d}.wav"
+        write_wav(os.path.join(directory, name), samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check batch.py recovery from a dead worker process")
+    parser.add_argument("--files", type=int, default=8, help="files in the batch (default: 8)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the shortest file (default: 10)")
+    args = parser.parse_args()
+
+    failures = 0
+    for mode in ("speakers", "transcribe"):
+        for workers in (1, 3):
+            with tempfile.TemporaryDirectory() as tmp:
+                write_files(tmp, args.files, args.seconds)
+                audio_files = find_audio_files(tmp)
+                start = time.perf_counter()
+                # Progress, including the workers' (which inherit the descriptor), goes to stderr
+                sys.stdout.flush()
+                saved = os.dup(1)
+                os.dup2(2, 1)
+                try:
+                    summary = run_batch(audio_files, "txt", mode, workers, LOADER)
+                finally:
+                    sys.stdout.flush()
+                    os.dup2(saved, 1)
+                    os.close(saved)
+                seconds = time.perf_counter() - start
+
+                failed = [os.path.basename(r["audio_file"]) for r in summary["files"] if r["status"] == "failed"]
+                ok = (failed == ["crash.wav"] and summary["done"] == args.files - 1
+                      and len(summary["files"]) == args.files)
+                failures += not ok
+                print(f"{'ok' if ok else 'FAIL'}: {mode}, {workers} worker(s): {summary['done']} done, "
+                      f"failed {failed or 'none'} in {seconds:.1f}s")
+
+    if failures:
+        print(f"\n{failures} case(s) failed")
+        sys.exit(1)
+    print("\nOnly the file that killed its worker failed")
+
+
+if __name__ == "__main__":
+    main()
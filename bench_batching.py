@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Clips per second of batched vs one-at-a-time transcription of short clips
+
+Generates voicemail-like synthetic clips of 5-30 s and transcribes them
+one file per engine call (as transcribe_audio does) and packed into
+batches (as transcribe_many does). The stub engines have no per-call cost
+of their own, so ``--call-overhead`` adds a fixed delay per engine call to
+stand in for the model setup a real engine pays on every call. With no
+overhead batching is slower, by the cost of concatenating and splitting;
+the table is followed by the per-call cost above which it wins.
+
+It first checks that no words cross from one clip to another: with an
+engine whose word timestamps start early, in the silence before a clip,
+and with one that gives no word timestamps and joins clips into one
+segment (those clips are transcribed again alone).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from audio_io import load_audio
+from batching import MAX_BATCH, plan_batches, transcribe_batch
+from stub_engines import stub_diarize, stub_transcribe, voiced_transcribe
+from synthetic_audio import synthesize, write_wav
+
+
+def with_overhead(engine, seconds):
+    """Wrap an engine so every call costs at least ``seconds`` extra"""
+    def call(*args, **kwargs):
+        time.sleep(seconds)
+        return engine(*args, **kwargs)
+    return call
+
+
+def early_words(audio, **options):
+    """voiced_transcribe with every word starting 0.6 s early, in the silence before it"""
+    result = voiced_transcribe(audio, **options)
+    for segment in result["segments"]:
+        segment["start"] = max(segment["start"] - 0.6, 0.0)
+        for word in segment.get("words", []):
+            word["start"] = max(word["start"] - 0.6, 0.0)
+    return result
+
+
+def wordless(audio, **options):
+    """voiced_transcribe without word timestamps, with its words joined into 20 s segments"""
+    segments = []
+    for segment in voiced_transcribe(audio)["segments"]:
+        if segments and segment["start"] < segments[-1]["start"] + 20.0:
+            segments[-1]["end"] = segment["end"]
+            segments[-1]["text"] += segment["text"]
+        else:
+            segments.append(dict(segment))
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": "en"}
+
+
+def check_splitting(audio_files):
+    """Return the number of engines whose batched words land in the wrong clip"""
+    buffers = [load_audio(audio_file) for audio_file in audio_files]
+    expected = [len(voiced_transcribe(buffer)["segments"]) for buffer in buffers]
+    failures = 0
+    for name, engine in (("early word timestamps", early_words), ("no word timestamps", wordless)):
+        calls = []
+
+        def transcribe(audio, **options):
+            calls.append(audio)
+            return engine(audio, **options)
+
+        results = transcribe_batch(buffers, transcribe, language="en")
+        words = [sum(segment["text"].count(" speech") for segment in result["segments"])
+                 for result in results]
+        ok = words == expected
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL'}: {name}: {sum(words)} of {sum(expected)} words in their own clip, "
+              f"{len(calls)} engine call(s) for {len(buffers)} clips")
+    return failures
+
+
+def one_at_a_time(audio_files, transcribe, diarize):
+    for audio_file in audio_files:
+        audio = load_audio(audio_file)
+        transcribe(audio)
+        if diarize is not None:
+            diarize(audio)
+
+
+def batched(audio_files, durations, transcribe, diarize, max_batch):
+    for batch in plan_batches(list(zip(audio_files, durations)), max_batch):
+        transcribe_batch([load_audio(audio_file) for audio_file in batch], transcribe, diarize,
+                         language="en")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batched and per-file transcription of short clips")
+    parser.add_argument("--clips", type=int, default=200)
+    parser.add_argument("--call-overhead", type=float, nargs="+", default=[0.0, 0.1],
+                        help="simulated fixed cost per engine call, in seconds (default: 0 0.1)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--speakers", action="store_true", help="diarize the clips as well")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    durations = [round(float(d), 2) for d in rng.uniform(5.0, 30.0, args.clips)]
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_files = []
+        for i, duration in enumerate(durations):
+            samples, _ = synthesize(duration, seed=i)
+            audio_files.append(write_wav(os.path.join(tmp, f"clip{i:05d}.wav"), samples))
+        failures = check_splitting(audio_files[:args.max_batch])
+        calls = len(plan_batches(list(zip(audio_files, durations)), args.max_batch))
+        print(f"\n{args.clips} clips, {sum(durations) / 60:.1f} min of audio, "
+              f"{calls} batched engine call(s)\n")
+
+        print(f"{'overhead/call':>13} {'one-at-a-time':>15} {'batched':>15} {'speedup':>8}")
+        seconds = {}
+        for overhead in args.call_overhead:
+            transcribe = with_overhead(stub_transcribe, overhead)
+            diarize = with_overhead(stub_diarize, overhead) if args.speakers else None
+            rates = []
+            for run in (lambda: one_at_a_time(audio_files, transcribe, diarize),
+                        lambda: batched(audio_files, durations, transcribe, diarize, args.max_batch)):
+                start = time.perf_counter()
+                with redirect_stdout(sys.stderr):
+                    run()
+                rates.append(args.clips / (time.perf_counter() - start))
+            seconds[overhead] = [args.clips / rate for rate in rates]
+            print(f"{overhead * 1000:>10.0f} ms {rates[0]:>10.1f} clips/s {rates[1]:>7.1f} clips/s "
+                  f"{rates[1] / rates[0]:>7.1f}x")
+
+    if 0.0 in seconds:
+        # Batching saves (clips - calls) engine calls and pays for concatenating and splitting
+        single, packed = seconds[0.0]
+        saved_calls = (args.clips - calls) * (2 if args.speakers else 1)
+        print(f"\nWith no per-call cost batching runs at {single / packed:.2f}x: it pays "
+              f"{(packed - single) / args.clips * 1000:.2f} ms per clip to join and split the audio. "
+              f"It wins once an engine call costs more than "
+              f"{max(packed - single, 0.0) / saved_calls * 1000:.2f} ms.")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Per-channel transcription vs downmix plus diarization on a two-channel call
+
+Generates a synthetic call with one speaker per channel (and a little
+bleed between channels), then runs both paths on it: the usual
+transcribe_with_speakers, which downmixes and diarizes, and
+channels.transcribe_channels with and without per-channel energy VAD.
+Segments are scored as speaker turns against the ground truth (DER), and
+per-stage times come from the instrumentation spans. The stand-in engines
+(stub_engines.load_voiced_models) cost almost nothing, so
+``--transcribe-rtf`` and ``--diarize-rtf`` add a sleep per audio second to
+model real engines; sleeping engines overlap in threads as engines that
+run on their own cores or a GPU would.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import instrumentation
+from channels import transcribe_channels
+from stub_engines import load_voiced_models
+from synthetic_audio import diarization_error_rate, synthesize_call, write_wav
+from transcriber import Models, transcribe_with_speakers
+
+
+def with_cost(function, seconds_per_audio_second):
+    """Wrap an engine function so it also sleeps in proportion to its input"""
+    def run(audio, **options):
+        time.sleep(seconds_per_audio_second * audio.duration)
+        return function(audio, **options)
+    return run
+
+
+def as_turns(result):
+    return [(segment["start"], segment["end"], segment["speaker"]) for segment in result["segments"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-channel transcription with diarization")
+    parser.add_argument("--minutes", type=float, default=30.0, help="call length (default: 30)")
+    parser.add_argument("--silence", type=float, default=0.2, help="silence ratio of the call (default: 0.2)")
+    parser.add_argument("--bleed", type=float, default=0.03,
+                        help="level of each speaker on the other channel (default: 0.03)")
+    parser.add_argument("--transcribe-rtf", type=float, default=0.0,
+                        help="modelled transcription seconds per audio second (default: 0)")
+    parser.add_argument("--diarize-rtf", type=float, default=0.0,
+                        help="modelled diarization seconds per audio second (default: 0)")
+    args = parser.parse_args()
+
+    voiced = load_voiced_models()
+    models = Models(with_cost(voiced.transcribe, args.transcribe_rtf),
+                    with_cost(voiced.diarize, args.diarize_rtf), "voiced", "pitch")
+    samples, reference = synthesize_call(args.minutes * 60, args.silence, args.bleed, seed=0)
+    print(f"{args.minutes:.0f} min call, {len(reference)} turns, {args.silence:.0%} silence, "
+          f"bleed {args.bleed:g}, modelled RTF transcribe {args.transcribe_rtf:g} / "
+          f"diarize {args.diarize_rtf:g}, {os.cpu_count()} CPU(s)\n")
+
+    runs = [
+        ("downmix + diarization", lambda path: transcribe_with_speakers(path, None, "sequential", models)),
+        ("downmix + diarization (thread)", lambda path: transcribe_with_speakers(path, None, "thread", models)),
+        ("per channel", lambda path: transcribe_channels(path, "thread", models)),
+        ("per channel + energy VAD", lambda path: transcribe_channels(path, "thread", models, vad="energy")),
+    ]
+    print(f"{'mode':<32} {'total s':>8} {'transcribe s':>13} {'diarize s':>10} {'segments':>9} {'DER':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_wav(os.path.join(tmp, "call.wav"), samples)
+        for name, run in runs:
+            tracer = instrumentation.enable()
+            with redirect_stdout(sys.stderr):
+                start = time.perf_counter()
+                result = run(path)
+                total = time.perf_counter() - start
+            instrumentation.disable()
+            totals = tracer.totals()
+            transcribe = totals.get("transcription", {}).get("wall_seconds", 0.0)
+            diarize = totals.get("diarization", {}).get("wall_seconds", 0.0)
+            print(f"{name:<32} {total:>8.2f} {transcribe:>13.2f} {diarize:>10.2f} "
+                  f"{len(result['segments']):>9} {diarization_error_rate(reference, as_turns(result)):>7.2%}")
+    print("\ntranscribe s sums the channels' transcription spans, which overlap in time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Peak memory of whole-file vs chunked processing on synthetic recordings
+
+Generates silent-ish 16 kHz mono WAV files of the requested lengths and
+runs each mode in a fresh process with the stub engines, so the numbers
+reflect this project's own buffering rather than model memory. Then checks
+that a chunked run whose transcription fails returns at once instead of
+waiting for the background diarization.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from instrumentation import peak_rss_mb
+
+SAMPLE_RATE = 16000
+
+
+def write_wav(path, hours, sample_rate=SAMPLE_RATE):
+    """Write a low-level noise WAV file block by block"""
+    rng = np.random.default_rng(0)
+    total = int(hours * 3600 * sample_rate)
+    block = sample_rate * 60
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        for start in range(0, total, block):
+            n = min(block, total - start)
+            w.writeframes(rng.integers(-300, 300, n, dtype=np.int16).tobytes())
+
+
+def run_mode(mode, audio_file):
+    """Child process: run one mode and print 'seconds peak_rss_mb'"""
+    from chunked import transcribe_with_speakers_chunked
+    from stub_engines import load_stub_models
+    from transcriber import transcribe_with_speakers
+
+    models = load_stub_models()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            if mode == "full":
+                transcribe_with_speakers(audio_file, None, models=models)
+            else:
+                transcribe_with_speakers_chunked(audio_file, None, models)
+        finally:
+            sys.stdout = stdout
+    elapsed = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    print(f"{elapsed:.2f} {peak_mb:.0f}")
+
+
+def check_failure(audio_file, diarize_seconds=30.0):
+    """Fail the second transcription window while diarization is slow; returns seconds to the error"""
+    from chunked import transcribe_with_speakers_chunked
+    from stub_engines import stub_diarize, stub_transcribe
+    from transcriber import Models
+
+    calls = []
+
+    def transcribe(audio, **options):
+        calls.append(audio.offset)
+        if len(calls) == 2:
+            raise RuntimeError("transcription failed")
+        return stub_transcribe(audio, **options)
+
+    def diarize(audio):
+        time.sleep(diarize_seconds)
+        return stub_diarize(audio)
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            transcribe_with_speakers_chunked(audio_file, None, Models(transcribe, diarize))
+        except RuntimeError:
+            pass
+        finally:
+            sys.stdout = stdout
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hours", type=float, nargs="+", default=[1.0, 6.0])
+    parser.add_argument("--run", nargs=2, metavar=("MODE", "AUDIO_FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(*args.run)
+        return
+
+    print(f"{'hours':>6} {'mode':>8} {'seconds':>8} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for hours in args.hours:
+            audio_file = os.path.join(tmp, f"synthetic_{hours:g}h.wav")
+            write_wav(audio_file, hours)
+            for mode in ("full", "chunked"):
+                out = subprocess.run([sys.executable, __file__, "--run", mode, audio_file],
+                                     capture_output=True, text=True, check=True).stdout
+                seconds, peak_mb = out.split()
+                print(f"{hours:>6g} {mode:>8} {seconds:>8} {peak_mb:>14}")
+            os.unlink(audio_file)
+
+        audio_file = os.path.join(tmp, "failing.wav")
+        write_wav(audio_file, 0.5)
+        seconds = check_failure(audio_file)
+        print(f"\n{'ok' if seconds < 5 else 'FAIL'}: a failed transcription window raised after "
+              f"{seconds:.1f}s, without waiting for the 30s diarization")
+        if seconds >= 5:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+DER and speed of windowed parallel diarization vs a single diarization call
+
+Generates a synthetic multi-speaker recording with known turns, diarizes
+it in one call and with parallel_diarization at several worker counts,
+and scores every result against the ground truth. The default diarizer is
+stub_engines.pitch_diarize, which labels each window on its own like a
+real one does, so the numbers measure the windowing and speaker linking;
+``--engine real`` uses pyannote. Timings include loading the diarizer,
+in every worker for the windowed runs. Each windowed run also diarizes
+the recording from a WAV file, which the workers get one window at a
+time from disk, and checks that it gives the same turns.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from audio_io import AudioBuffer
+from parallel_diarization import (DEFAULT_DIARIZER, DIARIZATION_OVERLAP_SECONDS, DIARIZATION_WINDOW_SECONDS,
+                                  load_windowed_diarizer)
+from synthetic_audio import diarization_error_rate, synthesize, write_wav
+from worker import resolve_loader
+
+LOADERS = {"stub": "stub_engines:load_pitch_diarizer", "real": DEFAULT_DIARIZER}
+
+
+def speakers(turns):
+    return len({speaker for _, _, speaker in turns})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare windowed parallel diarization with a single call")
+    parser.add_argument("--minutes", type=float, default=60.0, help="recording length (default: 60)")
+    parser.add_argument("--speakers", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--window", type=float, default=DIARIZATION_WINDOW_SECONDS)
+    parser.add_argument("--overlap", type=float, default=DIARIZATION_OVERLAP_SECONDS)
+    parser.add_argument("--engine", default="stub", choices=LOADERS,
+                        help="stub (pitch-based, no model) or real (pyannote)")
+    parser.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"))
+    args = parser.parse_args()
+
+    samples, reference = synthesize(args.minutes * 60, speakers=args.speakers, seed=0)
+    print(f"{args.minutes:.0f} min, {args.speakers} speakers, {len(reference)} turns, "
+          f"{os.cpu_count()} CPU(s), {args.window:.0f}s windows with {args.overlap:.0f}s overlap\n")
+    print(f"{'mode':<20} {'seconds':>8} {'speedup':>8} {'speakers':>9} {'DER':>7} {'vs single':>10}")
+
+    audio = AudioBuffer(samples, 16000, "synthetic")
+    with redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        single = resolve_loader(LOADERS[args.engine])(args.hf_token)(audio)
+        single_seconds = time.perf_counter() - start
+    print(f"{'single call':<20} {single_seconds:>8.2f} {1.0:>7.1f}x {speakers(single):>9} "
+          f"{diarization_error_rate(reference, single):>7.2%} {0.0:>10.2%}")
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_file = write_wav(os.path.join(tmp, "recording.wav"), samples)
+        for workers in args.workers:
+            with load_windowed_diarizer(args.hf_token, workers, LOADERS[args.engine],
+                                        args.window, args.overlap) as diarize, redirect_stdout(sys.stderr):
+                start = time.perf_counter()
+                turns = diarize(audio)
+                seconds = time.perf_counter() - start
+                from_file = diarize(audio_file)
+            print(f"{f'{workers} workers':<20} {seconds:>8.2f} {single_seconds / seconds:>7.1f}x "
+                  f"{speakers(turns):>9} {diarization_error_rate(reference, turns):>7.2%} "
+                  f"{diarization_error_rate(single, turns):>10.2%}")
+            if diarization_error_rate(turns, from_file) > 0.001:
+                print(f"FAIL: {workers} workers: diarizing the file from disk gave different turns")
+                failures += 1
+    audio.close()
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
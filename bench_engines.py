@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Transcription throughput of each installed engine on the same synthetic input
+
+Every engine runs in a fresh process on one synthetic multi-speaker WAV
+file, and the table reports model load time, transcription time, real-time
+factor and peak memory. Engines that are not installed are listed as skipped.
+First it checks that the options this project passes to engines (the
+chunked prompt, the loop guard's re-decode) map onto whisper.cpp's
+parameters, which needs no engine installed.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import stub_engines  # registers the "stub" engine as a baseline
+from engines import ENGINES, is_available, whispercpp_params
+from instrumentation import peak_rss_mb
+from loop_guard import REDECODE_OPTIONS
+from synthetic_audio import synthesize, write_wav
+
+
+def run_engine(name, audio_file, repeat):
+    """Child process: load one engine and time it on the file"""
+    from audio_io import load_audio
+    from engines import load_engine
+
+    with redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        transcribe, model = load_engine(name)
+        load_seconds = time.perf_counter() - start
+
+        audio = load_audio(audio_file)
+        # The first call can include one-off warm-up, so the best run is kept
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = transcribe(audio)
+            times.append(time.perf_counter() - start)
+
+    peak_mb = peak_rss_mb()
+    return {
+        "engine": name,
+        "model": model,
+        "load_seconds": round(load_seconds, 3),
+        "transcribe_seconds": round(min(times), 4),
+        "real_time_factor": round(min(times) / audio.duration, 6),
+        "segments": len(result["segments"]),
+        "peak_rss_mb": round(peak_mb, 1)
+    }
+
+
+def check_whispercpp_options():
+    """Return the number of option mappings that are wrong"""
+    failures = 0
+    cases = [
+        ("chunked prompt", {"word_timestamps": True, "initial_prompt": " the last words"},
+         {"initial_prompt": " the last words", "n_max_text_ctx": 16384, "temperature": 0.0}),
+        ("loop guard re-decode", REDECODE_OPTIONS,
+         {"initial_prompt": "", "n_max_text_ctx": 0, "temperature": 0.2, "temperature_inc": 0.2}),
+        ("thresholds", {"language": "de", "no_speech_threshold": 0.5, "logprob_threshold": -0.8,
+                        "temperature": 0.4},
+         {"language": "de", "no_speech_thold": 0.5, "logprob_thold": -0.8, "temperature_inc": 0.0}),
+    ]
+    for name, options, expected in cases:
+        params = whispercpp_params(options)
+        ok = all(abs(params[key] - value) < 1e-9 if isinstance(value, float) else params[key] == value
+                 for key, value in expected.items())
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL'}: whisper.cpp options: {name}")
+    try:
+        whispercpp_params({"beam_size": 5})
+        ok = False
+    except TypeError:
+        ok = True
+    failures += not ok
+    print(f"{'ok' if ok else 'FAIL'}: whisper.cpp options: an unsupported option raises\n")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare transcription engines on the same input")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="synthetic audio length in seconds (default: 60)")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per engine; the best is kept")
+    parser.add_argument("--output", help="also write the results as JSON")
+    parser.add_argument("--run", nargs=2, metavar=("ENGINE", "AUDIO_FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_engine(args.run[0], args.run[1], args.repeat)))
+        return
+
+    if check_whispercpp_options():
+        sys.exit(1)
+
+    results = []
+    print(f"{'engine':<16} {'load (s)':>9} {'run (s)':>9} {'RTF':>9} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_file = write_wav(os.path.join(tmp, "synthetic.wav"), synthesize(args.duration)[0])
+        for name in args.engines:
+            if not is_available(name):
+                print(f"{name:<16} skipped (not installed)")
+                continue
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", name, audio_file,
+                                   "--repeat", str(args.repeat)], capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{name:<16} failed: {proc.stderr.strip().splitlines()[-1:]}")
+                continue
+            result = json.loads(proc.stdout)
+            results.append(result)
+            print(f"{name:<16} {result['load_seconds']:>9.2f} {result['transcribe_seconds']:>9.3f} "
+                  f"{result['real_time_factor']:>9.5f} {result['peak_rss_mb']:>14.0f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"audio_seconds": args.duration, "engines": results}, f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Repetition-loop guard on a stand-in engine that loops after long silences
+
+First feeds LoopMonitor hand-made segment streams: a repeated segment, a
+phrase loop, a run of laughter that only the compression ratio catches, a
+stalled timestamp, and ordinary speech and short real repeats ("Yes."
+three times) that must not trip it. A decode that really is repetitive
+must come through the guard unchanged, and a re-decode must always move
+the decode on. Then builds
+synthetic speech with long silences and transcribes it with
+stub_engines.looping_transcribe, which repeats its last segment for a
+minute after each long silence, as Whisper does when conditioned on its
+own previous text. Each run is scored against a decode without
+conditioning (no loops): word recall, junk segments and decode time. The
+stand-in costs ``--segment-cost`` seconds per segment, as real decoding
+is paid per token. The guard is run on the streaming engine (stopped as
+soon as the loop shows) and on a copy that returns everything at once, as
+MLX Whisper does.
+"""
+
+import argparse
+import sys
+import time
+from contextlib import redirect_stdout
+from functools import partial
+
+import numpy as np
+
+import instrumentation
+from audio_io import AudioBuffer
+from loop_guard import LoopMonitor, _redecode, with_loop_guard
+from stub_engines import looping_transcribe, voiced_transcribe
+from synthetic_audio import SAMPLE_RATE, synthesize
+
+SPEECH = ("so the plan for next quarter is to move the billing service over first and then "
+          "look at the search cluster once we know how much headroom we have left after that "
+          "we can talk about hiring but not before the numbers are in")
+
+
+def segments_of(texts, step=2.0, length=1.8):
+    return [{"start": i * step, "end": i * step + length, "text": text} for i, text in enumerate(texts)]
+
+
+def detector_cases():
+    words = SPEECH.split()
+    speech = [" ".join(words[i:i + 6]) for i in range(0, len(words), 6)]
+    stalled = [{"start": 12.0, "end": 12.0, "text": f"item {i}"} for i in range(5)]
+    return [
+        ("repeated segment", segments_of(speech[:3] + ["thank you"] * 6), "repetition"),
+        ("repeated answers", segments_of(speech[:3] + ["Yes."] * 3 + speech[3:]), None),
+        ("repeated question", segments_of(speech[:3] + ["Hello?"] * 4 + speech[3:], step=1.0, length=0.8),
+         None),
+        ("phrase loop", segments_of(speech[:3] + ["and then we go and then we go and then we go"] * 2),
+         "repetition"),
+        ("laughter", segments_of(speech[:3] + ["ha" * 40, "ha" * 45, "ha" * 50]), "compression"),
+        ("stalled timestamps", segments_of(speech[:3]) + stalled, "stall"),
+        ("ordinary speech", segments_of(speech), None),
+    ]
+
+
+def check_detectors():
+    failures = 0
+    for name, segments, expected in detector_cases():
+        monitor = LoopMonitor()
+        reason = None
+        for segment in segments:
+            reason = monitor.feed(segment)
+            if reason:
+                break
+        ok = reason == expected
+        failures += not ok
+        where = f", loop from segment {monitor.first}" if reason else ""
+        print(f"{'ok' if ok else 'FAIL'}: {name}: {reason or 'no loop'}{where}")
+    return failures
+
+
+def check_real_repeats(audio):
+    """voiced_transcribe says " speech" for every word: re-decodes agree, so nothing may be dropped"""
+    plain = voiced_transcribe(audio)["segments"]
+    with redirect_stdout(sys.stderr):
+        guarded = with_loop_guard(voiced_transcribe)(audio)["segments"]
+    ok = [(s["start"], s["end"]) for s in guarded] == [(s["start"], s["end"]) for s in plain]
+    print(f"{'ok' if ok else 'FAIL'}: a repetitive decode that re-decodes the same keeps "
+          f"{len(guarded)} of {len(plain)} segments")
+    return not ok
+
+
+def check_resume_advances():
+    """A re-decode whose last segment starts at the window's start must still move on"""
+    audio = AudioBuffer(np.zeros(60 * SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE, "silence")
+
+    def transcribe(audio, on_segment=None, **options):
+        segments = [{"start": 0.0, "end": 0.0, "text": " um"},
+                    {"start": 0.0, "end": audio.duration, "text": " uh"}]
+        return {"text": " um uh", "segments": segments, "language": "en"}
+
+    with redirect_stdout(sys.stderr):
+        _, resume = _redecode(transcribe, audio, 10.0, 40.0, "stall", {}, cut=True, looped=[])
+    ok = resume > 10.0
+    print(f"{'ok' if ok else 'FAIL'}: a cut re-decode resumes at {resume:g}s after starting at 10s")
+    return not ok
+
+
+def build_audio(minutes, silences, silence_seconds):
+    """Synthetic speech with ``silences`` long pauses spread through it"""
+    piece = minutes * 60 / (silences + 1)
+    parts = []
+    for i in range(silences + 1):
+        samples, _ = synthesize(piece, 2, 0.1, seed=i)
+        parts.append(samples)
+        if i < silences:
+            parts.append(np.zeros(int(silence_seconds * SAMPLE_RATE), dtype=np.float32))
+    return AudioBuffer(np.concatenate(parts), SAMPLE_RATE, "synthetic")
+
+
+def _all_at_once(audio, on_segment=None, **options):
+    # Like MLX Whisper: segments only come back when the whole decode is done
+    return looping_transcribe(audio, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the repetition-loop guard on a looping stand-in")
+    parser.add_argument("--minutes", type=float, default=10.0, help="speech length (default: 10)")
+    parser.add_argument("--silences", type=int, default=6,
+                        help="long pauses that trigger loops (default: 6)")
+    parser.add_argument("--silence-seconds", type=float, default=10.0,
+                        help="length of each pause (default: 10)")
+    parser.add_argument("--segment-cost", type=float, default=0.02,
+                        help="modelled decode seconds per segment (default: 0.02)")
+    args = parser.parse_args()
+
+    failures = check_detectors()
+    audio = build_audio(args.minutes, args.silences, args.silence_seconds)
+    failures += check_real_repeats(audio)
+    failures += check_resume_advances()
+
+    cost = {"segment_cost": args.segment_cost}
+    reference = looping_transcribe(audio, condition_on_previous_text=False)
+    words = {segment["text"] for segment in reference["segments"]}
+    runs = [
+        ("no guard", partial(looping_transcribe, **cost)),
+        ("guard, streamed", partial(with_loop_guard(looping_transcribe), **cost)),
+        ("guard, all at once", partial(with_loop_guard(_all_at_once), **cost)),
+    ]
+    print(f"\n{audio.duration / 60:.1f} min with {args.silences} pauses of {args.silence_seconds:g}s, "
+          f"{len(words)} words, {args.segment_cost:g}s per segment\n")
+    print(f"{'run':<20} {'decode s':>9} {'saved':>7} {'segments':>9} {'junk':>6} {'recall':>7} {'loops':>6}")
+    baseline = None
+    for name, transcribe in runs:
+        tracer = instrumentation.enable()
+        with redirect_stdout(sys.stderr):
+            start = time.perf_counter()
+            result = transcribe(audio)
+            seconds = time.perf_counter() - start
+        instrumentation.disable()
+        baseline = baseline or seconds
+        texts = [segment["text"] for segment in result["segments"]]
+        junk = len(texts) - len(set(texts) & words)
+        recall = len(set(texts) & words) / len(words)
+        loops = sum(span["name"] == "loop_redecode" for span in tracer.spans)
+        print(f"{name:<20} {seconds:>9.2f} {1 - seconds / baseline:>7.0%} {len(texts):>9} {junk:>6} "
+              f"{recall:>7.1%} {loops:>6}")
+        if name != "no guard" and (junk or recall < 1.0 or not loops):
+            failures += 1
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        sys.exit(1)
+    print("\nThe guarded runs keep no looped segments and match the loop-free decode")
+
+
+if __name__ == "__main__":
+    main()
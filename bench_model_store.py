@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Check of the model store against a fake local model directory
+
+Builds a source directory laid out by repo id, with stand-in weight files
+for the stub engine and a pyannote pipeline whose config.yaml names a
+segmentation and an embedding model. It prefetches both into a fresh
+store with ``--from``, then checks the manifest hashes, the rewritten
+pipeline config, loading the stub engine through engines.load_engine,
+and that damaged files are caught. It reports the time of each step:
+resolving a stored model before a load, against re-hashing it.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+import instrumentation
+import stub_engines  # registers the "stub" engine
+from engines import load_engine
+from model_store import (DIARIZATION_KIND, STORE_ENV, ModelStore, file_hash, model_key,
+                         pipeline_config)
+from transcriber import DIARIZATION_MODEL
+
+PIPELINE_CONFIG = """version: 3.1.0
+
+pipeline:
+  name: pyannote.audio.pipelines.SpeakerDiarization
+  params:
+    clustering: AgglomerativeClustering
+    embedding: pyannote/wespeaker-voxceleb-resnet34-LM
+    embedding_batch_size: 32
+    embedding_exclude_overlap: true
+    segmentation: pyannote/segmentation-3.0
+    segmentation_batch_size: 32
+"""
+
+
+def write_fake_repo(source, repo_id, files):
+    folder = os.path.join(source, repo_id)
+    os.makedirs(folder, exist_ok=True)
+    for name, content in files.items():
+        with open(os.path.join(folder, name), "wb" if isinstance(content, bytes) else "w") as f:
+            f.write(content)
+
+
+def fake_source(source, megabytes):
+    """Lay out fake Whisper and pyannote repos under ``source``"""
+    rng = np.random.default_rng(0)
+    weights = lambda mb: rng.integers(0, 256, int(mb * 1024 ** 2), dtype=np.uint8).tobytes()
+    write_fake_repo(source, "stub-whisper", {"config.json": '{"n_mels": 80}', "weights.npz": weights(megabytes)})
+    write_fake_repo(source, DIARIZATION_MODEL, {"config.yaml": PIPELINE_CONFIG})
+    write_fake_repo(source, "pyannote/segmentation-3.0", {"pytorch_model.bin": weights(megabytes / 20)})
+    write_fake_repo(source, "pyannote/wespeaker-voxceleb-resnet34-LM",
+                    {"pytorch_model.bin": weights(megabytes / 4)})
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    return value, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the model store against a fake model directory")
+    parser.add_argument("--megabytes", type=float, default=200.0,
+                        help="size of the fake Whisper weights (default: 200)")
+    args = parser.parse_args()
+
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok' if condition else 'FAIL'}: {message}")
+        if not condition:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source")
+        fake_source(source, args.megabytes)
+        store = ModelStore(os.path.join(tmp, "store"))
+
+        with redirect_stdout(sys.stderr):
+            _, prefetch_seconds = timed(lambda: [store.prefetch("stub", "stub-whisper", source=source),
+                                                 store.prefetch(DIARIZATION_KIND, DIARIZATION_MODEL,
+                                                                source=source)])
+        entries = store.entries()
+        check(sorted(entries) == [model_key(DIARIZATION_KIND, DIARIZATION_MODEL), "stub/stub-whisper"],
+              "manifest lists the Whisper model and the pipeline")
+        pipeline = entries[model_key(DIARIZATION_KIND, DIARIZATION_MODEL)]
+        check(len(pipeline["files"]) == 3, "pipeline entry covers its config and both sub-models")
+        weights = os.path.join(source, "stub-whisper", "weights.npz")
+        stored = entries["stub/stub-whisper"]["files"]
+        check(any(info["sha256"] == file_hash(weights) for info in stored.values()),
+              "manifest hash matches the source weights")
+
+        config_path = store.resolve(DIARIZATION_KIND, DIARIZATION_MODEL)
+        resolved = pipeline_config(config_path)
+        with open(resolved) as f:
+            paths = [line.split(":", 1)[1].strip() for line in f
+                     if line.strip().startswith(("segmentation:", "embedding:"))]
+        os.remove(resolved)
+        check(len(paths) == 2 and all(os.path.isfile(path) for path in paths),
+              "pipeline config points at the stored sub-model checkpoints")
+
+        os.environ[STORE_ENV] = store.directory
+        tracer = instrumentation.enable()
+        load_engine("stub")
+        instrumentation.disable()
+        load_span = [s for s in tracer.spans if s["name"] == "load_whisper"][0]
+        check(load_span["source"] == "store", "engines.load_engine loads the stub model from the store")
+        check(store.resolve("stub", "stub-other") is None, "a model that is not stored resolves to None")
+
+        _, resolve_seconds = timed(store.resolve, "stub", "stub-whisper")
+        problems, verify_seconds = timed(store.verify)
+        check(not any(problems.values()), "verify passes on an intact store")
+
+        stored_weights = os.path.join(store.directory,
+                                      next(name for name in stored if name.endswith("weights.npz")))
+        with open(stored_weights, "r+b") as f:
+            f.write(b"\xff" * 16)
+        check(store.verify()["stub/stub-whisper"], "verify catches a same-size overwrite")
+        with open(stored_weights, "r+b") as f:
+            f.truncate(1024)
+        try:
+            store.resolve("stub", "stub-whisper")
+            check(False, "resolve refuses a truncated file")
+        except RuntimeError:
+            check(True, "resolve refuses a truncated file")
+
+        total = sum(entry["bytes"] for entry in entries.values()) / 1024 ** 2
+        print(f"\n{total:.0f} MB stored: prefetch {prefetch_seconds:.2f}s, "
+              f"resolve before load {resolve_seconds * 1000:.2f}ms, full verify {verify_seconds:.2f}s")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
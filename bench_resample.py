@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Accuracy, speed and memory of the streaming resampling front-end
+
+For each source rate, a synthetic stereo signal is downmixed and resampled
+to 16 kHz three ways: in one call, in blocks of random size (as the
+streaming decoder does), and with a direct float64 evaluation of
+torchaudio's sinc_interp_hann filter at every output sample. When
+torchaudio is installed, its own ``functional.resample`` is compared as
+well. Then a long stereo WAV file is decoded through the memory-mapped
+streaming path and through a whole-file path like the torchaudio
+fallback, reporting time and peak memory. Exits with status 1 if any
+difference exceeds the tolerance.
+"""
+
+import argparse
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+from audio_stream import (LOWPASS_FILTER_WIDTH, ROLLOFF, StreamingResampler, decode_audio, downmix,
+                          resample, sinc_kernel)
+from synthetic_audio import synthesize
+
+
+def reference_resample(samples, orig_freq, new_freq):
+    """
+    Evaluate the resampling filter directly, in float64, one output at a time
+
+    y[m] = sum_n x[n] * h(n / orig - m / new), with h the Hann-windowed sinc
+    torchaudio builds its kernels from.
+    """
+    gcd = math.gcd(orig_freq, new_freq)
+    orig, new = orig_freq // gcd, new_freq // gcd
+    base = min(orig, new) * ROLLOFF
+    reach = math.ceil(LOWPASS_FILTER_WIDTH * orig / base) + orig
+    x = samples.astype(np.float64)
+    m = np.arange(-(-new * len(x) // orig))
+    centre = m * orig // new
+    out = np.zeros(len(m))
+    for d in range(-reach, reach + 1):
+        n = centre + d
+        valid = (n >= 0) & (n < len(x))
+        t = np.clip((n / orig - m / new) * base, -LOWPASS_FILTER_WIDTH, LOWPASS_FILTER_WIDTH)
+        window = np.cos(t * math.pi / LOWPASS_FILTER_WIDTH / 2) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            h = np.where(t == 0, 1.0, np.sin(math.pi * t) / (math.pi * t)) * window * base / orig
+        out += np.where(valid, x[np.clip(n, 0, len(x) - 1)] * h, 0.0)
+    return out
+
+
+def stream_in_random_blocks(samples, orig_freq, new_freq, rng):
+    resampler = StreamingResampler(orig_freq, new_freq)
+    parts = []
+    position = 0
+    while position < len(samples):
+        size = int(rng.integers(1, 8000))
+        parts.append(resampler.process(samples[position:position + size]))
+        position += size
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+
+def torchaudio_resample(samples, orig_freq, new_freq):
+    try:
+        import torch
+        import torchaudio
+    except ImportError:
+        return None
+    return torchaudio.functional.resample(torch.from_numpy(samples), orig_freq, new_freq).numpy()
+
+
+def stereo(seconds, sample_rate, seed=0):
+    left, _ = synthesize(seconds, sample_rate=sample_rate, seed=seed)
+    right, _ = synthesize(seconds, sample_rate=sample_rate, seed=seed + 1)
+    return np.stack([left, right], axis=1)
+
+
+def write_stereo_wav(path, frames, sample_rate):
+    pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.tobytes())
+    return path
+
+
+def whole_file(path):
+    """Read every frame, downmix the full signal, then resample it: the old fallback's shape"""
+    with wave.open(path, "rb") as w:
+        sample_rate = w.getframerate()
+        pcm = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").reshape(-1, w.getnchannels())
+    waveform = pcm.T.astype(np.float32) / 32768
+    mono = waveform.mean(axis=0)
+    return resample(mono, sample_rate, SAMPLE_RATE, block_seconds=len(mono) / sample_rate + 1)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the streaming resampler")
+    parser.add_argument("--rates", type=int, nargs="+", default=[8000, 22050, 32000, 44100, 48000, 96000])
+    parser.add_argument("--seconds", type=float, default=600.0,
+                        help="length of the file for the speed and memory test (default: 600)")
+    parser.add_argument("--tolerance", type=float, default=1e-5,
+                        help="largest allowed absolute difference (default: 1e-5)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    failures = 0
+    print(f"{'rate':>6} {'taps':>5} {'streamed vs whole':>18} {'vs float64 filter':>18} {'vs torchaudio':>14}")
+    for rate in args.rates:
+        mono = downmix(stereo(3.0, rate))
+        whole = resample(mono, rate, SAMPLE_RATE)
+        diffs = [
+            np.abs(stream_in_random_blocks(mono, rate, SAMPLE_RATE, rng) - whole).max(),
+            np.abs(reference_resample(mono, rate, SAMPLE_RATE) - whole).max()
+        ]
+        theirs = torchaudio_resample(mono, rate, SAMPLE_RATE)
+        if theirs is not None:
+            diffs.append(np.abs(theirs - whole).max() if len(theirs) == len(whole) else math.inf)
+        failures += sum(diff > args.tolerance for diff in diffs)
+        gcd = math.gcd(rate, SAMPLE_RATE)
+        taps = sinc_kernel(rate // gcd, SAMPLE_RATE // gcd)[0].shape[1] if rate != SAMPLE_RATE else 0
+        cells = [f"{diff:.1e}" for diff in diffs] + ["not installed"] * (3 - len(diffs))
+        print(f"{rate:>6} {taps:>5} {cells[0]:>18} {cells[1]:>18} {cells[2]:>14}")
+
+    gcd = math.gcd(44100, SAMPLE_RATE)
+    sinc_kernel.cache_clear()
+    start = time.perf_counter()
+    sinc_kernel(44100 // gcd, SAMPLE_RATE // gcd)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    sinc_kernel(44100 // gcd, SAMPLE_RATE // gcd)
+    cached = time.perf_counter() - start
+    print(f"\n44.1 kHz kernel: built in {built * 1000:.2f} ms, cached lookup {cached * 1e6:.1f} us")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_stereo_wav(os.path.join(tmp, "long.wav"), stereo(args.seconds, 44100), 44100)
+        print(f"\n{args.seconds:.0f}s of 44.1 kHz stereo 16-bit WAV ({os.path.getsize(path) / 2**20:.0f} MB) "
+              f"to 16 kHz mono:")
+        print(f"{'path':<24} {'seconds':>8} {'x realtime':>11} {'peak MB':>8}")
+        outputs = []
+        for name, fn in (("whole file", lambda: whole_file(path)),
+                         ("streamed, memory-mapped", lambda: decode_audio(path, SAMPLE_RATE)[0])):
+            samples, seconds, peak = measure(fn)
+            outputs.append(samples)
+            print(f"{name:<24} {seconds:>8.2f} {args.seconds / seconds:>11.0f} {peak / 2**20:>8.1f}")
+        diff = np.abs(outputs[0] - outputs[1]).max()
+        failures += diff > args.tolerance
+        print(f"largest difference between the two: {diff:.1e}")
+
+    if failures:
+        print(f"\n{failures} comparison(s) over the {args.tolerance:g} tolerance")
+        raise SystemExit(1)
+    print(f"\nAll comparisons within {args.tolerance:g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Check the NumPy resampler against torchaudio's own resampling
+
+audio_stream.resample builds its windowed-sinc filter the way torchaudio's
+default does, so that decoding needs no torch; this script is what checks
+that the output actually matches. For each source rate, several test
+signals (synthetic speech, and at half of full scale white noise, a sweep
+up to the source's Nyquist frequency and isolated clicks) are resampled to
+16 kHz in one call and in random blocks, as the streaming decoder does,
+and compared with ``torchaudio.functional.resample`` and
+``torchaudio.transforms.Resample``. The lengths must match and the largest
+absolute difference must stay under the tolerance, or the script exits
+with status 1. Both sides sum the filter in float32, so each can be off
+the exact (float64) result by about 1e-5; the default tolerance is one
+step of 16-bit audio. Without torch and torchaudio it reports that the
+comparison was skipped and exits with 0.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+from audio_stream import resample
+from bench_resample import reference_resample, stream_in_random_blocks
+from synthetic_audio import synthesize
+
+
+def signals(sample_rate, seconds, rng):
+    """(name, float32 samples) test signals at ``sample_rate``"""
+    count = int(seconds * sample_rate)
+    t = np.arange(count) / sample_rate
+    speech, _ = synthesize(seconds, sample_rate=sample_rate, seed=0)
+    noise = rng.uniform(-0.5, 0.5, count)
+    # Linear sweep from 20 Hz to just under the source's Nyquist frequency
+    top = 0.49 * sample_rate
+    sweep = 0.5 * np.sin(2 * np.pi * (20.0 * t + (top - 20.0) * t ** 2 / (2 * seconds)))
+    clicks = np.zeros(count)
+    clicks[rng.integers(0, count, 50)] = rng.choice([-0.5, 0.5], 50)
+    return [(name, np.ascontiguousarray(samples, dtype=np.float32)) for name, samples in
+            (("speech", speech[:count]), ("noise", noise), ("sweep", sweep), ("clicks", clicks))]
+
+
+def compare(ours, theirs):
+    """Largest absolute difference, or infinity when the lengths differ"""
+    if len(ours) != len(theirs):
+        return np.inf
+    return float(np.abs(ours.astype(np.float64) - theirs.astype(np.float64)).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the NumPy resampler with torchaudio's")
+    parser.add_argument("--rates", type=int, nargs="+",
+                        default=[8000, 11025, 22050, 32000, 44100, 48000, 96000])
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of each test signal (default: 5)")
+    parser.add_argument("--tolerance", type=float, default=2 ** -15,
+                        help="largest allowed absolute difference (default: 2**-15, one 16-bit step)")
+    args = parser.parse_args()
+
+    try:
+        import torch
+        import torchaudio
+    except ImportError as e:
+        print(f"Skipped: torchaudio is not installed ({e}); the match with torchaudio is unchecked")
+        return
+
+    rng = np.random.default_rng(0)
+    failures = 0
+    worst = 0.0
+    print(f"torch {torch.__version__}, torchaudio {torchaudio.__version__}\n")
+    print(f"{'rate':>6} {'signal':<8} {'vs functional':>14} {'vs transform':>13} {'streamed vs functional':>23} "
+          f"{'ours vs float64':>16}")
+    for rate in args.rates:
+        transform = torchaudio.transforms.Resample(rate, SAMPLE_RATE)
+        for name, samples in signals(rate, args.seconds, rng):
+            tensor = torch.from_numpy(samples)
+            functional = torchaudio.functional.resample(tensor, rate, SAMPLE_RATE).numpy()
+            with torch.no_grad():
+                transformed = transform(tensor).numpy()
+            ours = resample(samples, rate, SAMPLE_RATE)
+            streamed = stream_in_random_blocks(samples, rate, SAMPLE_RATE, rng)
+            diffs = [compare(ours, functional), compare(ours, transformed), compare(streamed, functional)]
+            failures += sum(diff > args.tolerance for diff in diffs)
+            worst = max(worst, *diffs)
+            exact = compare(ours, reference_resample(samples, rate, SAMPLE_RATE))
+            print(f"{rate:>6} {name:<8} {diffs[0]:>14.1e} {diffs[1]:>13.1e} {diffs[2]:>23.1e} {exact:>16.1e}")
+
+    print(f"\nLargest difference: {worst:.1e} (tolerance {args.tolerance:g})")
+    if failures:
+        print(f"{failures} comparison(s) over the tolerance")
+        sys.exit(1)
+    print("The NumPy resampler matches torchaudio")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Size and speed of the result formats, with round-trip checks
+
+Builds a transcribe_with_speakers-shaped result with many segments and
+writes and re-reads it as indented JSON (what save_results writes for
+``json``), as JSON-Lines the old way (json.dumps per segment) and from a
+SegmentTable, and as .npz. Every format is read back and compared with
+the original, and the fast JSON-Lines output must match json.dumps byte
+for byte. A transcription-only result saved as .npz must also re-render
+to the same plain-layout files as the original run; exits with status 1
+if any check fails.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from render import render
+from segment_table import SegmentTable, jsonl_line
+from transcribe_only import save_transcription
+
+WORDS = ["the", "meeting", "budget", "quarter", "naïve", "café", "東京", "we", "should", "review", "🙂"]
+
+
+def make_result(segments, speakers=6, seed=0):
+    """A synthetic result with realistic-looking times, texts and speakers"""
+    rng = np.random.default_rng(seed)
+    starts = np.cumsum(rng.uniform(0.5, 6.0, segments))
+    lengths = rng.uniform(0.3, 5.0, segments)
+    word_counts = rng.integers(1, 20, segments)
+    picks = rng.integers(0, len(WORDS), int(word_counts.sum()))
+    labels = rng.integers(-1, speakers, segments)
+    result_segments = []
+    position = 0
+    for start, length, count, label in zip(starts.tolist(), lengths.tolist(), word_counts.tolist(),
+                                           labels.tolist()):
+        text = "".join(" " + WORDS[i] for i in picks[position:position + count])
+        position += count
+        result_segments.append({
+            "start": start,
+            "end": start + length,
+            "text": text,
+            "speaker": None if label < 0 else f"SPEAKER_{label:02d}"
+        })
+    return {
+        "text": "".join(segment["text"] for segment in result_segments),
+        "segments": result_segments,
+        "language": "en"
+    }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+
+def traced_size(fn):
+    tracemalloc.start()
+    value = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def write_json(result, path):
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_jsonl_dumps(result, path):
+    with open(path, "w") as f:
+        for segment in result["segments"]:
+            f.write(json.dumps(segment) + "\n")
+
+
+def write_jsonl_table(table, path):
+    with open(path, "w") as f:
+        f.writelines(table.jsonl_lines())
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def plain_render_matches(folder, segments=1000):
+    """Re-render a transcription-only .npz and compare with the files the run wrote"""
+    result = make_result(segments)
+    result["segments"] = [{key: value for key, value in segment.items() if key != "speaker"}
+                          for segment in result["segments"]]
+    formats = ["txt", "srt", "vtt"]
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        written = save_transcription(result, os.path.join(folder, "plain.wav"), formats + ["npz"])
+    original = []
+    for path in written[:-1]:
+        with open(path, "rb") as f:
+            original.append(f.read())
+        os.remove(path)
+    rendered = []
+    for path in render(written[-1], formats):
+        with open(path, "rb") as f:
+            rendered.append(f.read())
+    return rendered == original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare result formats by size and speed")
+    parser.add_argument("--segments", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    result, dict_bytes = traced_size(lambda: make_result(args.segments))
+    table, table_bytes = traced_size(lambda: SegmentTable.from_result(result))
+    print(f"{args.segments} segments in memory: list of dicts {dict_bytes / 2**20:.0f} MB, "
+          f"SegmentTable {table_bytes / 2**20:.0f} MB\n")
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {name: os.path.join(tmp, f"result.{ext}") for name, ext in
+                 (("json", "json"), ("jsonl_dumps", "jsonl"), ("jsonl_table", "table.jsonl"),
+                  ("npz", "npz"), ("npz_compressed", "z.npz"))}
+        rows = []
+
+        _, write = timed(lambda: write_json(result, paths["json"]))
+        loaded, read = timed(lambda: read_json(paths["json"]))
+        rows.append(("json, indent=2", paths["json"], write, read))
+        if loaded != result:
+            failures.append("json round trip")
+
+        _, write = timed(lambda: write_jsonl_dumps(result, paths["jsonl_dumps"]))
+        loaded, read = timed(lambda: read_jsonl(paths["jsonl_dumps"]))
+        rows.append(("jsonl, json.dumps", paths["jsonl_dumps"], write, read))
+        if loaded != result["segments"]:
+            failures.append("jsonl round trip")
+
+        _, write = timed(lambda: write_jsonl_table(table, paths["jsonl_table"]))
+        rows.append(("jsonl, SegmentTable", paths["jsonl_table"], write, read))
+        with open(paths["jsonl_dumps"], "rb") as a, open(paths["jsonl_table"], "rb") as b:
+            if a.read() != b.read():
+                failures.append("SegmentTable JSON-Lines differs from json.dumps")
+        if any(jsonl_line(segment) != json.dumps(segment) + "\n" for segment in result["segments"][:10000]):
+            failures.append("jsonl_line differs from json.dumps")
+
+        for name, compressed in (("npz", False), ("npz_compressed", True)):
+            _, write = timed(lambda: table.save_npz(paths[name], compressed=compressed))
+            loaded, read = timed(lambda: SegmentTable.load_npz(paths[name]))
+            _, rebuild = timed(loaded.to_result)
+            rows.append((f"npz{', compressed' if compressed else ''}", paths[name], write, read))
+            if loaded.to_result() != result:
+                failures.append(f"{name} round trip")
+        print(f"SegmentTable.to_result() rebuilds the dicts in {rebuild:.2f}s\n")
+        if not plain_render_matches(tmp):
+            failures.append("transcription-only npz re-render")
+
+        baseline = os.path.getsize(paths["json"])
+        print(f"{'format':<22} {'MB':>7} {'vs json':>8} {'write s':>8} {'read s':>7}")
+        for name, path, write, read in rows:
+            size = os.path.getsize(path)
+            print(f"{name:<22} {size / 2**20:>7.1f} {size / baseline:>7.0%} {write:>8.2f} {read:>7.2f}")
+
+    if failures:
+        print(f"\nFailed: {', '.join(failures)}")
+        raise SystemExit(1)
+    print("\nAll round trips match")
+
+
+if __name__ == "__main__":
+    main()
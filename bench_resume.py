@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Kill a journalled job with SIGKILL and check that rerunning it gives the same output
+
+Writes a synthetic recording and runs the chunked and the whole-file
+pipelines on it in child processes, with the stub engines slowed down to
+a fixed cost per call so each stage takes long enough to be interrupted.
+Each child is the same command, run three times: killed with SIGKILL
+while the windows are being transcribed, rerun and killed again while the
+speaker diarization runs, then rerun to the end. The TXT, SRT and JSON
+files it writes must be byte-identical to those of an uninterrupted run
+of a copy of the file.
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_audio import synthesize, write_wav
+
+FORMATS = ["txt", "srt", "json"]
+MODES = ("chunked", "whole")
+
+
+def slow_models(transcribe_cost, window, diarize_cost):
+    """Stub models that take a fixed time per ``window`` seconds transcribed or per diarization"""
+    from stub_engines import stub_diarize, stub_transcribe
+    from transcriber import Models
+
+    def transcribe(audio, **options):
+        time.sleep(transcribe_cost * audio.duration / window)
+        return stub_transcribe(audio, **options)
+
+    def diarize(audio):
+        time.sleep(diarize_cost)
+        return stub_diarize(audio)
+
+    return Models(transcribe, diarize, "stub-whisper", "stub-diarization")
+
+
+def run_child(mode, audio_file, jobs_dir, window, transcribe_cost, diarize_cost):
+    """Child process: one journalled run, written out the way speech-to-text-fixed.py does"""
+    from chunked import transcribe_with_speakers_chunked
+    from journal import open_journal
+    from transcriber import results_path, save_results, transcribe_with_speakers
+    from writers import open_streaming
+
+    models = slow_models(transcribe_cost, window, diarize_cost)
+    journal = open_journal(audio_file, {"bench": mode, "window": window}, jobs_dir)
+    if mode == "chunked":
+        output = open_streaming(FORMATS, lambda fmt: results_path(audio_file, fmt))
+        try:
+            result = transcribe_with_speakers_chunked(audio_file, None, models, window_seconds=window,
+                                                      on_segment=output.write_segment, journal=journal)
+        except BaseException:
+            output.abort()
+            raise
+        output.close(result)
+    else:
+        result = transcribe_with_speakers(audio_file, None, models=models, journal=journal)
+        save_results(result, audio_file, FORMATS)
+    journal.discard()
+
+
+def _journal_has(jobs_dir, name):
+    return any(os.path.exists(os.path.join(jobs_dir, job, f"{name}.json"))
+               for job in (os.listdir(jobs_dir) if os.path.isdir(jobs_dir) else []))
+
+
+def after(seconds, condition):
+    """A condition that holds ``seconds`` after ``condition`` first did"""
+    seen = []
+
+    def ready():
+        if not seen and condition():
+            seen.append(time.monotonic())
+        return bool(seen) and time.monotonic() - seen[0] >= seconds
+
+    return ready
+
+
+def run_until(command, jobs_dir, ready, timeout=120.0):
+    """
+    Start the command and SIGKILL it once ``ready()`` holds; returns the
+    journal units present at the kill, or None if the command finished first
+    """
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while proc.poll() is None and time.monotonic() < deadline:
+        if ready():
+            proc.send_signal(signal.SIGKILL)
+            proc.wait()
+            return sorted(name[:-5] for job in os.listdir(jobs_dir)
+                          for name in os.listdir(os.path.join(jobs_dir, job)) if name.endswith(".json"))
+        time.sleep(0.005)
+    proc.kill()
+    proc.wait()
+    return None
+
+
+def outputs(audio_file):
+    from transcriber import results_path
+
+    contents = {}
+    for fmt in FORMATS:
+        with open(results_path(audio_file, fmt), "rb") as f:
+            contents[fmt] = f.read()
+    return contents
+
+
+def check_mode(mode, source, tmp, args):
+    """Run one uninterrupted and one twice-killed job; returns the number of failed checks"""
+    failures = 0
+    files = {}
+    for name in ("reference", "killed"):
+        folder = os.path.join(tmp, mode, name)
+        os.makedirs(folder)
+        files[name] = shutil.copy(source, os.path.join(folder, "recording.wav"))
+    jobs_dir = os.path.join(tmp, mode, "jobs")
+
+    def command(audio_file):
+        return [sys.executable, os.path.abspath(__file__), "--child", mode, audio_file, jobs_dir,
+                "--window", str(args.window), "--transcribe-cost", str(args.transcribe_cost),
+                "--diarize-cost", str(args.diarize_cost)]
+
+    start = time.perf_counter()
+    subprocess.run(command(files["reference"]), stdout=subprocess.DEVNULL, check=True)
+    reference_seconds = time.perf_counter() - start
+
+    # The chunked run journals each window; the whole-file run its transcription as one
+    # unit, so it is killed halfway through that
+    transcribe_seconds = args.transcribe_cost * args.minutes * 60 / args.window
+    during_transcription = ((lambda: _journal_has(jobs_dir, "window-00002")) if mode == "chunked"
+                            else after(transcribe_seconds / 2, lambda: _journal_has(jobs_dir, "job")))
+    during_diarization = lambda: _journal_has(jobs_dir, "transcription")
+
+    killed = command(files["killed"])
+    start = time.perf_counter()
+    for phase, ready in (("transcription", during_transcription), ("diarization", during_diarization)):
+        units = run_until(killed, jobs_dir, ready)
+        if units is None:
+            print(f"FAIL: {mode}: the run finished before it could be killed during {phase}")
+            failures += 1
+            continue
+        # The kill must land in that phase: nothing after it may be journalled yet
+        in_phase = ("diarization" not in units and
+                    ("transcription" not in units if phase == "transcription" else "transcription" in units))
+        failures += not in_phase
+        held = [f"{sum(unit.startswith('window-') for unit in units)} window(s)"] if mode == "chunked" else []
+        held += ["the transcription"] if "transcription" in units else []
+        print(f"{'ok' if in_phase else 'FAIL'}: {mode}: killed during {phase}, journal held "
+              f"{', '.join(held) or 'no finished stage'}")
+    subprocess.run(killed, stdout=subprocess.DEVNULL, check=True)
+    killed_seconds = time.perf_counter() - start
+
+    same = outputs(files["reference"]) == outputs(files["killed"])
+    leftover = os.listdir(jobs_dir)
+    failures += not same or bool(leftover)
+    print(f"{'ok' if same else 'FAIL'}: {mode}: {', '.join(FORMATS)} output after two kills "
+          f"{'matches' if same else 'differs from'} the uninterrupted run "
+          f"({killed_seconds:.1f}s over three runs vs {reference_seconds:.1f}s)")
+    if leftover:
+        print(f"FAIL: {mode}: {len(leftover)} journal(s) left behind")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that SIGKILLed journalled jobs resume to the same output")
+    parser.add_argument("--minutes", type=float, default=10.0, help="recording length (default: 10)")
+    parser.add_argument("--window", type=float, default=30.0, help="chunked window seconds (default: 30)")
+    parser.add_argument("--transcribe-cost", type=float, default=0.1,
+                        help="transcription seconds per window of audio (default: 0.1)")
+    parser.add_argument("--diarize-cost", type=float, default=4.0,
+                        help="seconds per diarization call (default: 4)")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "AUDIO", "JOBS_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, audio_file, jobs_dir = args.child
+        run_child(mode, audio_file, jobs_dir, args.window, args.transcribe_cost, args.diarize_cost)
+        return
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        samples, _ = synthesize(args.minutes * 60, 2, 0.1, seed=0)
+        source = write_wav(os.path.join(tmp, "source.wav"), samples)
+        for mode in MODES:
+            failures += check_mode(mode, source, tmp, args)
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        sys.exit(1)
+    print("\nKilled and resumed jobs write the same bytes as uninterrupted ones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Check how service.py handles bad and large requests
+
+Starts `service.py` on localhost with the stub engines and sends it JSON
+bodies that are not a path to a regular file, a JSON body over the JSON
+limit, an upload over the upload limit (only the headers are sent), and a
+real upload. Bad requests must get 400 or 413 and leave the service
+running; the upload must be transcribed, and the peak memory of the
+service process (VmHWM, Linux only) is reported next to the file size.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from http.client import HTTPConnection
+
+import service
+from synthetic_audio import synthesize, write_wav
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(port):
+    """Start service.py with the stub engines; returns the process once it is listening"""
+    proc = subprocess.Popen([sys.executable, "service.py", "--port", str(port),
+                             "--loader", "stub_engines:load_stub_models"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL)
+    while proc.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return proc
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    raise RuntimeError("The service exited before it was listening")
+
+
+def post(port, body, content_type, headers=None):
+    """POST a body; returns (status, reply bytes)"""
+    conn = HTTPConnection("127.0.0.1", port)
+    try:
+        conn.request("POST", "/transcribe", body, {"Content-Type": content_type, **(headers or {})})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a process in MB, or None off Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return next(int(line.split()[1]) / 1024 for line in f if line.startswith("VmHWM:"))
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the service's request validation and upload limits")
+    parser.add_argument("--upload-minutes", type=float, default=20.0,
+                        help="length of the uploaded recording (default: 20)")
+    args = parser.parse_args()
+
+    port = free_port()
+    proc = start_service(port)
+    failures = 0
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cases = [
+                ("file descriptor", {"audio_file": 1}, 400),
+                ("list", {"audio_file": ["a.wav"]}, 400),
+                ("directory", {"audio_file": tmp}, 400),
+                ("device", {"audio_file": "/dev/zero"}, 400),
+                ("missing key", {"path": "a.wav"}, 400),
+                ("oversized JSON", {"audio_file": "x" * service.MAX_JSON_BYTES}, 413),
+            ]
+            for name, body, expected in cases:
+                status, reply = post(port, json.dumps(body), "application/json")
+                ok = status == expected and proc.poll() is None
+                failures += not ok
+                print(f"{'ok' if ok else 'FAIL'}: {name}: {status} {json.loads(reply)['error']}")
+
+            # Only the headers: the limit must be checked before any of the body is read
+            status, _ = post(port, b"", "application/octet-stream",
+                             {"Content-Length": str(service.MAX_BODY_BYTES + 1)})
+            failures += status != 413
+            print(f"{'ok' if status == 413 else 'FAIL'}: oversized upload: {status}")
+
+            samples, _ = synthesize(args.upload_minutes * 60, 2, 0.1, seed=0)
+            audio_file = write_wav(os.path.join(tmp, "upload.wav"), samples)
+            del samples
+            size = os.path.getsize(audio_file)
+            start = time.perf_counter()
+            events = list(service.stream_transcription(f"http://127.0.0.1:{port}", audio_file, upload=True))
+            seconds = time.perf_counter() - start
+            peak = peak_rss_mb(proc.pid)
+            done = events[-1]["event"] == "done"
+            failures += not done
+            print(f"{'ok' if done else 'FAIL'}: {size / 1024 ** 2:.0f} MB upload: "
+                  f"{sum(event['event'] == 'segment' for event in events)} segments in {seconds:.1f}s"
+                  + (f", service peak RSS {peak:.0f} MB" if peak else ""))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        sys.exit(1)
+    print("\nBad requests were refused and the upload was streamed to disk")
+
+
+if __name__ == "__main__":
+    main()
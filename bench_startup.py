@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Startup time of the command-line scripts, checked against a fixed budget
+
+Usage messages, argument errors and the missing-file check should never wait
+for MLX, torch or pyannote to import. Each case runs in a fresh interpreter;
+the median wall time must stay under the budget and none of the heavy
+modules may be imported (checked with ``python -X importtime``). Exits with
+status 1 if any case fails, so it can guard CI.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_BUDGET = 0.5
+
+# Top-level packages that take seconds to import and must stay lazy
+HEAVY_MODULES = ("torch", "torchaudio", "mlx", "mlx_whisper", "pyannote",
+                 "faster_whisper", "ctranslate2", "pywhispercpp")
+
+MISSING = "no-such-recording.wav"
+
+# (script, arguments, expected exit status)
+CASES = [
+    ("speech-to-text-fixed.py", ["--help"], 0),
+    ("speech-to-text-fixed.py", [], 2),
+    ("speech-to-text-fixed.py", [MISSING, "token"], 0),
+    ("transcribe_only.py", ["--help"], 0),
+    ("transcribe_only.py", [MISSING], 1),
+    ("batch.py", ["--help"], 0),
+    ("worker.py", ["--help"], 0),
+    ("speech-to-text.py", [], 1),
+    ("speech-to-text.py", [MISSING, "token"], 1),
+]
+
+
+def imported_modules(stderr):
+    """Top-level module names from -X importtime output"""
+    names = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            names.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return names
+
+
+def run_case(script, arguments, repeat):
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), script), *arguments]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+    traced = subprocess.run([sys.executable, "-X", "importtime", *cmd[1:]], capture_output=True, text=True)
+    heavy = sorted(imported_modules(traced.stderr) & set(HEAVY_MODULES))
+    return statistics.median(times), proc.returncode, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the scripts start within a time budget")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help=f"maximum median seconds per case (default: {DEFAULT_BUDGET})")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case (default: 5)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"])
+    print(f"Bare interpreter: {time.perf_counter() - start:.3f}s\n")
+
+    failures = 0
+    print(f"{'case':<52} {'seconds':>8} {'exit':>5}  result")
+    for script, arguments, expected in CASES:
+        seconds, status, heavy = run_case(script, arguments, args.repeat)
+        problems = []
+        if seconds > args.budget:
+            problems.append(f"over the {args.budget:g}s budget")
+        if status != expected:
+            problems.append(f"exit status {status}, expected {expected}")
+        if heavy:
+            problems.append(f"imported {', '.join(heavy)}")
+        failures += bool(problems)
+        name = " ".join([script, *arguments]) or script
+        print(f"{name:<52} {seconds:>8.3f} {status:>5}  {'; '.join(problems) or 'ok'}")
+
+    if failures:
+        print(f"\n{failures} case(s) failed")
+        sys.exit(1)
+    print("\nAll cases within budget")
+
+
+if __name__ == "__main__":
+    main()
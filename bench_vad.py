@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Audio skipped, speed and word timing of the voice-activity pre-pass
+
+Generates synthetic recordings with known speech turns at several silence
+ratios and transcribes each one whole and through vad.py. The stand-in
+engine (stub_engines.voiced_transcribe) emits one word for every run of
+voiced audio it hears, timed to 10 ms, and its cost grows with the audio
+it is given like Whisper's does.
+Each word is matched to the ground-truth turn it covers, so the table
+shows how much audio was sent, the engine time, how many turns were
+transcribed and how far word start times moved. Also scores the speech
+regions themselves against the turns. Then checks that an engine without
+word timestamps, whose segments run across the gaps between regions, still
+gets every word (those regions are transcribed again on their own). Exits
+with status 1 if a VAD run transcribes fewer turns than the full-file run,
+or its word start times are more than 50 ms further off.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from audio_io import AudioBuffer
+from bench_batching import wordless
+from stub_engines import voiced_transcribe
+from synthetic_audio import synthesize
+from vad import energy_regions, transcribe_regions, turn_regions
+
+STEP_SECONDS = 0.01
+MAX_TIMING_ERROR = 0.05
+
+
+class Metered:
+    """Wraps a transcribe function and counts the audio and time it is given"""
+
+    def __init__(self, transcribe):
+        self.transcribe = transcribe
+        self.seconds = 0.0
+        self.elapsed = 0.0
+
+    def __call__(self, audio, **options):
+        self.seconds += audio.duration
+        start = time.perf_counter()
+        result = self.transcribe(audio, **options)
+        self.elapsed += time.perf_counter() - start
+        return result
+
+
+def score_words(reference, segments):
+    """Return (turns with a word, mean and max start error in seconds)"""
+    errors = []
+    for start, end, _ in reference:
+        starts = [segment["start"] for segment in segments
+                  if min(segment["end"], end) - max(segment["start"], start) > 0.5 * (end - start)]
+        if starts:
+            errors.append(min(abs(word_start - start) for word_start in starts))
+    if not errors:
+        return 0, 0.0, 0.0
+    return len(errors), float(np.mean(errors)), float(np.max(errors))
+
+
+def score_regions(reference, regions, duration):
+    """Return (recall, precision) of speech regions against the reference turns"""
+    frames = int(duration / STEP_SECONDS) + 1
+    speech = np.zeros(frames, dtype=bool)
+    found = np.zeros(frames, dtype=bool)
+    for start, end, *_ in reference:
+        speech[int(start / STEP_SECONDS):int(end / STEP_SECONDS)] = True
+    for start, end in regions:
+        found[int(start / STEP_SECONDS):int(end / STEP_SECONDS)] = True
+    both = np.sum(speech & found)
+    return both / max(np.sum(speech), 1), both / max(np.sum(found), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the voice-activity pre-pass")
+    parser.add_argument("--minutes", type=float, default=10.0, help="recording length (default: 10)")
+    parser.add_argument("--silence", type=float, nargs="+", default=[0.1, 0.3, 0.5, 0.6],
+                        help="silence ratios to test")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'silence':>7} {'mode':<12} {'sent s':>8} {'saved':>6} {'engine s':>9} {'turns':>9} "
+          f"{'mean err':>9} {'max err':>8} {'recall':>7} {'precision':>9}")
+    for silence in args.silence:
+        samples, reference = synthesize(args.minutes * 60, speakers=3, silence_ratio=silence, seed=1)
+        audio = AudioBuffer(samples, 16000, "synthetic")
+        modes = [
+            ("full file", None),
+            ("energy", energy_regions(audio)),
+            ("diarization", turn_regions(reference, audio.duration)),
+        ]
+        for mode, regions in modes:
+            engine = Metered(voiced_transcribe)
+            if regions is None:
+                result = engine(audio)
+                regions_score = f"{'-':>7} {'-':>9}"
+            else:
+                result = transcribe_regions(audio, engine, regions)
+                recall, precision = score_regions(reference, regions, audio.duration)
+                regions_score = f"{recall:>7.1%} {precision:>9.1%}"
+            found, mean_error, max_error = score_words(reference, result["segments"])
+            print(f"{silence:>7.0%} {mode:<12} {engine.seconds:>8.1f} "
+                  f"{1 - engine.seconds / audio.duration:>6.0%} {engine.elapsed:>9.3f} "
+                  f"{f'{found}/{len(reference)}':>9} {mean_error * 1000:>7.1f}ms {max_error * 1000:>6.1f}ms "
+                  f"{regions_score}")
+            if regions is None:
+                full_found, full_error = found, max_error
+                continue
+            if found < full_found:
+                failures.append(f"{mode} at {silence:.0%} silence lost {full_found - found} turns")
+            if max_error > full_error + MAX_TIMING_ERROR:
+                failures.append(f"{mode} at {silence:.0%} silence moved a word by {max_error * 1000:.0f}ms")
+        if silence == args.silence[-1]:
+            # Segments without word times that span a gap cannot be cut there
+            regions = energy_regions(audio)
+            expected = sum(segment["text"].count(" speech")
+                           for segment in transcribe_regions(audio, voiced_transcribe, regions)["segments"])
+            words = sum(segment["text"].count(" speech")
+                        for segment in transcribe_regions(audio, wordless, regions)["segments"])
+            print(f"\n{silence:.0%} silence, engine without word timestamps: {words} of {expected} words")
+            if words != expected:
+                failures.append(f"the engine without word timestamps kept {words} of {expected} words")
+        audio.close()
+
+    if failures:
+        print("\nFailed: " + "; ".join(failures))
+        raise SystemExit(1)
+    print("\nThe VAD runs transcribe every turn the full-file run does, with word times "
+          f"within {MAX_TIMING_ERROR * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of transcribe_with_speakers -> save_results
+
+Runs the full pipeline on synthetic multi-speaker audio with the stub
+engines (default) or the real models, and records real-time factor,
+per-stage wall time and peak memory in a JSON file. With the stub engines
+the numbers measure this project's own overhead, so they can be tracked
+across commits on a CPU-only machine.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import instrumentation
+from synthetic_audio import synthesize, write_wav
+
+FORMATS = ("txt", "srt", "json")
+
+
+def run_case(audio_file, engine, hf_token=None, concurrency="sequential"):
+    """Child process: run the pipeline once and return its measurements"""
+    from transcriber import Models, save_results, transcribe_with_speakers
+
+    load_start = time.perf_counter()
+    with redirect_stdout(sys.stderr):
+        if engine == "stub":
+            from stub_engines import load_stub_models
+            models = load_stub_models()
+        else:
+            from transcriber import load_models
+            models = load_models(hf_token)
+    load_seconds = time.perf_counter() - load_start
+
+    times = {}
+
+    def transcribe(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return models.transcribe(*args, **kwargs)
+        finally:
+            times["transcription"] = time.perf_counter() - start
+
+    def diarize(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return models.diarize(*args, **kwargs)
+        finally:
+            times["diarization"] = time.perf_counter() - start
+
+    timed_models = Models(transcribe, diarize, models.transcribe_id, models.diarize_id)
+    tracer = instrumentation.enable()
+    with redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        result = transcribe_with_speakers(audio_file, hf_token, concurrency, timed_models)
+        pipeline_seconds = time.perf_counter() - start
+
+        write_start = time.perf_counter()
+        for output_format in FORMATS:
+            save_results(result, audio_file, output_format)
+        write_seconds = time.perf_counter() - write_start
+
+    peak_mb = instrumentation.peak_rss_mb()
+    engine_seconds = times.get("transcription", 0.0) + times.get("diarization", 0.0)
+    spans = {f"span_{name}_seconds": entry["wall_seconds"] for name, entry in tracer.totals().items()}
+    return {
+        "model_load_seconds": load_seconds,
+        "transcription_seconds": times.get("transcription", 0.0),
+        "diarization_seconds": times.get("diarization", 0.0),
+        # Decode and alignment: everything in the pipeline that is not an engine call
+        "pipeline_overhead_seconds": pipeline_seconds - engine_seconds
+        if concurrency == "sequential" else None,
+        "pipeline_seconds": pipeline_seconds,
+        "write_seconds": write_seconds,
+        "total_seconds": pipeline_seconds + write_seconds,
+        "segments": len(result["segments"]),
+        "peak_rss_mb": peak_mb,
+        **spans
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def summarize(runs, duration):
+    """Median of each measurement over repeated runs, plus real-time factor"""
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = round(statistics.median(values), 4) if values else None
+    summary["real_time_factor"] = round(summary["total_seconds"] / duration, 6)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transcription pipeline end to end")
+    parser.add_argument("--durations", type=float, nargs="+", default=[60.0, 600.0],
+                        help="synthetic audio lengths in seconds (default: 60 600)")
+    parser.add_argument("--speakers", type=int, default=3)
+    parser.add_argument("--engine", default="stub", choices=["stub", "real"],
+                        help="stub engines (default) or the real Whisper/pyannote models")
+    parser.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"))
+    parser.add_argument("--concurrency", default="sequential", choices=["sequential", "thread"])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per duration; the median is kept")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--run-case", nargs=3, help=argparse.SUPPRESS)
+    parser.add_argument("--make-audio", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make_audio:
+        audio_file, duration, speakers = args.make_audio
+        samples, turns = synthesize(float(duration), speakers=int(speakers))
+        write_wav(audio_file, samples)
+        print(len(turns))
+        return
+
+    if args.run_case:
+        audio_file, engine, concurrency = args.run_case
+        print(json.dumps(run_case(audio_file, engine, args.hf_token, concurrency)))
+        return
+
+    whisper_engine = None
+    if args.engine == "real":
+        # load_models auto-detects the Whisper engine, so check for the one it would pick
+        from engines import detect_engine
+
+        try:
+            whisper_engine = detect_engine()
+            if importlib.util.find_spec("pyannote.audio") is None:
+                raise RuntimeError("pyannote.audio is not installed")
+        except (RuntimeError, ImportError) as e:
+            print(f"Error: real engines unavailable ({e}); use --engine stub")
+            sys.exit(1)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": args.engine,
+        "whisper_engine": whisper_engine,
+        "concurrency": args.concurrency,
+        "cases": []
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in args.durations:
+            audio_file = os.path.join(tmp, f"synthetic_{duration:g}s.wav")
+            # Linux carries a process's peak RSS over into the children it starts, so
+            # the audio is synthesized in a child too and this process stays small
+            cmd = [sys.executable, os.path.abspath(__file__), "--make-audio", audio_file,
+                   str(duration), str(args.speakers)]
+            reference_turns = int(subprocess.run(cmd, capture_output=True, text=True,
+                                                 check=True).stdout)
+            runs = []
+            for _ in range(args.repeat):
+                # A fresh process per run keeps peak memory and import state independent
+                cmd = [sys.executable, os.path.abspath(__file__), "--run-case", audio_file,
+                       args.engine, args.concurrency]
+                # The token goes through the environment rather than the command line
+                env = dict(os.environ, HF_TOKEN=args.hf_token or "")
+                proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+                if proc.returncode != 0:
+                    print(proc.stderr)
+                    sys.exit(proc.returncode)
+                runs.append(json.loads(proc.stdout))
+
+            case = {"audio_seconds": duration, "speakers": args.speakers,
+                    "reference_turns": reference_turns, "runs": args.repeat, **summarize(runs, duration)}
+            report["cases"].append(case)
+            print(f"{duration:>8g}s  RTF {case['real_time_factor']:.5f}  "
+                  f"total {case['total_seconds']:.3f}s  peak {case['peak_rss_mb']:.0f} MB")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Per-channel transcription of recordings with one speaker per channel
+
+Call-centre systems record each side of a call on its own channel, which
+already says who spoke when. Here each channel is decoded on its own
+instead of being downmixed, the channels are transcribed in parallel, and
+every segment is labelled with its channel rather than a pyannote speaker.
+The channels' segments are merged in time order into the same result shape
+as transcribe_with_speakers, so save_results and the writers are unchanged.
+Diarization never runs.
+
+Each channel also picks up the other side faintly (crosstalk), loud enough
+for an energy detector and sometimes for Whisper. The energy VAD here is
+channel-aware: a frame is speech on a channel only when it is also within
+CROSSTALK_DB of the loudest channel, so one side's speech is not
+transcribed again from the other side's bleed.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from audio_io import load_channels
+from engines import describe, model_id
+from instrumentation import span
+from loop_guard import loop_guard_id, with_loop_guard
+from result_cache import audio_hash
+from transcriber import Models, load_whisper
+from vad import FRAME_SECONDS, frame_levels, frame_regions, speech_frames, transcribe_regions, vad_id
+
+# A channel more than this far below the loudest one is treated as crosstalk
+CROSSTALK_DB = 15.0
+
+
+def channel_label(index):
+    """Speaker label used for a channel when no names are given"""
+    return f"CHANNEL_{index:02d}"
+
+
+def merge_channels(results, labels):
+    """
+    Merge per-channel Whisper results into one time-ordered result
+
+    Each segment gets its channel's label as ``speaker``; segments that
+    start together keep channel order.
+    """
+    segments = sorted(
+        ({"start": segment["start"], "end": segment["end"], "text": segment["text"], "speaker": label}
+         for result, label in zip(results, labels) for segment in result["segments"]),
+        key=lambda segment: segment["start"])
+    languages = [result.get("language", "unknown") for result in results if result["segments"]]
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": languages[0] if languages else "unknown"
+    }
+
+
+def _check_labels(labels, channels):
+    if labels is not None and len(labels) < channels:
+        raise ValueError(f"{len(labels)} channel label(s) given for {channels} channels")
+
+
+def channel_regions(buffers, crosstalk_db=CROSSTALK_DB):
+    """
+    Return each channel's speech regions, leaving out the other channels' bleed
+
+    A frame counts as speech on a channel when it passes the energy VAD and
+    is within ``crosstalk_db`` of the loudest channel, so both sides of
+    overlapping speech are kept.
+    """
+    levels = [frame_levels(audio) for audio in buffers]
+    count = min(len(level) for level in levels)
+    levels = np.stack([level[:count] for level in levels])
+    loudest = levels.max(axis=0)
+    return [frame_regions(speech_frames(level) & (level >= loudest - crosstalk_db),
+                          FRAME_SECONDS, audio.duration)
+            for level, audio in zip(levels, buffers)]
+
+
+def _transcribe_channel(audio, models, engine, regions=None, loop_guard=False):
+    """Transcribe one channel, only its ``regions`` when given"""
+    transcribe = models.transcribe if models else load_whisper(engine=engine)
+    if loop_guard:
+        transcribe = with_loop_guard(transcribe)
+    with span("transcription", audio_seconds=round(audio.duration, 3)):
+        if regions is None:
+            return transcribe(audio)
+        return transcribe_regions(audio, transcribe, regions)
+
+
+def _transcribe_channels(buffers, models, engine, concurrency, vad, loop_guard):
+    """Transcribe every channel at once and return the results in channel order"""
+    regions = channel_regions(buffers) if vad == "energy" else [None] * len(buffers)
+    print(f"Step 1: Transcribing {len(buffers)} channel(s) with "
+          f"{'Whisper' if models else describe(engine)}...")
+    if concurrency == "process":
+        # Each spawned worker loads its own engine, like the process stages of run_stages
+        executor = ProcessPoolExecutor(max_workers=len(buffers),
+                                       mp_context=multiprocessing.get_context("spawn"))
+        for audio in buffers:
+            audio.share()
+    else:
+        if models is None:
+            # Threads share one engine, loaded once
+            models = Models(load_whisper(engine=engine), None, model_id(engine))
+        executor = ThreadPoolExecutor(max_workers=len(buffers))
+    with executor:
+        futures = [executor.submit(_transcribe_channel, audio, models, engine, channel, loop_guard)
+                   for audio, channel in zip(buffers, regions)]
+        return [future.result() for future in futures]
+
+
+def transcribe_channels(audio_file, concurrency="thread", models=None, cache=None, engine="auto",
+                        labels=None, vad="off", loop_guard=False):
+    """
+    Transcribe each channel separately and label segments by channel
+
+    ``labels`` names the channels in order (default CHANNEL_00,
+    CHANNEL_01...). Channels run in threads, or in processes with
+    ``concurrency="process"``. ``vad="energy"`` skips each channel's
+    silence and crosstalk (see channel_regions), which on a call is most
+    of it, and ``loop_guard`` catches repetition loops in each channel. With a ResultCache the
+    per-channel transcriptions are looked up by the audio's content hash
+    first.
+    """
+    if vad not in ("off", "energy"):
+        raise ValueError("Per-channel transcription supports vad 'off' or 'energy'")
+
+    results = None
+    if cache is not None:
+        transcribe_id = loop_guard_id(vad_id(models.transcribe_id if models else model_id(engine), vad),
+                                      loop_guard)
+        content_hash = audio_hash(audio_file)
+        results = cache.get("transcription", content_hash, transcribe_id, {"channels": True})
+        if results is not None:
+            print("Step 1: Using cached per-channel transcriptions")
+
+    if results is None:
+        buffers = load_channels(audio_file)
+        print(f"Decoded {len(buffers)} channel(s) of {buffers[0].duration:.1f}s from {audio_file} "
+              f"in {buffers[0].decode_seconds:.2f}s")
+        if len(buffers) == 1:
+            print("Warning: the recording has a single channel; every segment gets the same label")
+        try:
+            _check_labels(labels, len(buffers))
+            with span("channel_transcription", channels=len(buffers)):
+                results = _transcribe_channels(buffers, models, engine, concurrency, vad, loop_guard)
+        finally:
+            for audio in buffers:
+                audio.close()
+        if cache is not None:
+            cache.put("transcription", content_hash, transcribe_id, results, {"channels": True})
+
+    _check_labels(labels, len(results))
+    if labels is None:
+        labels = [channel_label(i) for i in range(len(results))]
+
+    print("Step 2: Merging channels (no diarization needed)...")
+    return merge_channels(results, labels)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Bounded-memory transcription of long recordings
+
+The audio is decoded and resampled as a stream and transcribed in fixed
+windows that overlap their neighbours. Each window owns the part of the
+timeline up to the middle of its overlaps, and only words starting in
+that part are kept, so nothing is duplicated or dropped at the seams.
+Peak memory is roughly one window of samples, whatever the input length;
+with speaker labels, plus one window that is being diarized.
+"""
+
+import math
+import shutil
+import subprocess
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from alignment import assign_speakers
+from audio_io import SAMPLE_RATE, AudioBuffer
+from audio_stream import audio_info, stream_audio
+from instrumentation import span
+
+WINDOW_SECONDS = 300.0
+OVERLAP_SECONDS = 10.0
+
+# Samples read from the decoder at a time
+BLOCK_SAMPLES = SAMPLE_RATE * 10
+
+# Trailing text of the previous window handed to Whisper as context
+PROMPT_CHARS = 200
+
+
+def _ffmpeg_blocks(audio_file, sample_rate):
+    """Let ffmpeg downmix and resample, reading its output a block at a time"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", audio_file,
+        "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(sample_rate), "-"
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = proc.stdout.read(BLOCK_SAMPLES * 4)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+        if proc.wait() != 0:
+            raise ValueError(f"Failed to decode '{audio_file}': "
+                             f"{proc.stderr.read().decode(errors='replace').strip()}")
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def read_blocks(audio_file, sample_rate=SAMPLE_RATE):
+    """
+    Yield mono float32 blocks of the file at ``sample_rate``
+
+    Needs ffmpeg, except for WAV files (and FLAC files, with soundfile
+    installed), which the audio_stream front-end reads and resamples itself.
+    """
+    if shutil.which("ffmpeg"):
+        return _ffmpeg_blocks(audio_file, sample_rate)
+    if audio_info(audio_file) is not None:
+        return stream_audio(audio_file, sample_rate, BLOCK_SAMPLES / SAMPLE_RATE)
+    raise ValueError(f"Streaming '{audio_file}' needs ffmpeg, a WAV file, "
+                     f"or a FLAC file with soundfile installed")
+
+
+def read_windows(audio_file, window_seconds=WINDOW_SECONDS, overlap_seconds=OVERLAP_SECONDS,
+                 sample_rate=SAMPLE_RATE):
+    """
+    Yield (start_seconds, samples, is_last) for overlapping windows of the file
+    """
+    if overlap_seconds < 0 or window_seconds <= overlap_seconds:
+        raise ValueError("The window must be longer than its overlap")
+
+    window = int(window_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+    buffer = np.empty(window, dtype=np.float32)
+    filled = 0
+    start = 0
+    pending = None
+
+    blocks = read_blocks(audio_file, sample_rate)
+    while True:
+        with span("decode", source=audio_file):
+            block = next(blocks, None)
+        if block is None:
+            break
+        while len(block):
+            take = min(window - filled, len(block))
+            buffer[filled:filled + take] = block[:take]
+            filled += take
+            block = block[take:]
+            if filled == window:
+                # Hold each full window back until we know whether it is the last one
+                if pending is not None:
+                    yield (*pending, False)
+                pending = (start / sample_rate, buffer)
+                carried = buffer[window - overlap:]
+                buffer = np.empty(window, dtype=np.float32)
+                buffer[:overlap] = carried
+                filled = overlap
+                start += window - overlap
+
+    has_tail = filled > overlap or (pending is None and filled > 0)
+    if pending is not None:
+        yield (*pending, not has_tail)
+    if has_tail:
+        yield start / sample_rate, buffer[:filled], True
+
+
+def owned_segments(segments, offset, own_start, own_end):
+    """
+    Shift a window's segments to file time and keep the part it owns
+
+    Segments with word timestamps are trimmed word by word; without them a
+    segment is kept when its midpoint falls inside the owned span.
+    """
+    kept = []
+    for segment in segments:
+        start = segment["start"] + offset
+        end = segment["end"] + offset
+        words = segment.get("words")
+
+        if not words:
+            if own_start <= (start + end) / 2 < own_end:
+                kept.append({**segment, "start": start, "end": end})
+            continue
+
+        words = [{**word, "start": word["start"] + offset, "end": word["end"] + offset}
+                 for word in words]
+        owned = [word for word in words if own_start <= word["start"] < own_end]
+        if len(owned) == len(words):
+            kept.append({**segment, "start": start, "end": end, "words": words})
+        elif owned:
+            kept.append({
+                **segment,
+                "start": owned[0]["start"],
+                "end": owned[-1]["end"],
+                "text": "".join(word["word"] for word in owned),
+                "words": owned
+            })
+    return kept
+
+
+def _window_name(index):
+    return f"window-{index:05d}"
+
+
+def iter_windows(audio_file, transcribe, window_seconds=WINDOW_SECONDS,
+                 overlap_seconds=OVERLAP_SECONDS, info=None, journal=None):
+    """
+    Transcribe window by window, yielding each window's finalized segments in file time
+
+    ``info`` (a dict) receives the detected language and window counts. With
+    a Journal, each finished window is recorded and windows recorded by an
+    earlier run are replayed instead of transcribed again.
+    """
+    info = {} if info is None else info
+    done = journal.load("transcription") if journal is not None else None
+    if done is not None:
+        # Every window finished last time, so the audio is not even decoded
+        info.update(language=done["language"], windows=done["windows"], resumed=done["windows"])
+        for index in range(done["windows"]):
+            yield journal.load(_window_name(index))["segments"]
+        return
+
+    prompt = None
+    windows = read_windows(audio_file, window_seconds, overlap_seconds)
+    for index, (offset, samples, is_last) in enumerate(windows):
+        saved = journal.load(_window_name(index)) if journal is not None else None
+        if saved is not None:
+            segments, language = saved["segments"], saved["language"]
+            info["resumed"] = info.get("resumed", 0) + 1
+        else:
+            audio = AudioBuffer(samples, SAMPLE_RATE, audio_file, offset=offset)
+            with span("transcription", window=index, audio_seconds=round(audio.duration, 3)):
+                result = transcribe(audio, word_timestamps=True, initial_prompt=prompt)
+
+            own_start = 0.0 if index == 0 else offset + overlap_seconds / 2
+            own_end = math.inf if is_last else offset + window_seconds - overlap_seconds / 2
+            segments = owned_segments(result["segments"], offset, own_start, own_end)
+            language = result.get("language", "unknown")
+            if journal is not None:
+                journal.save(_window_name(index), {"segments": segments, "language": language})
+
+        info.setdefault("language", language)
+        info["windows"] = index + 1
+        prompt = "".join(segment["text"] for segment in segments)[-PROMPT_CHARS:] or None
+        yield segments
+
+    if journal is not None:
+        journal.save("transcription", {"windows": info.get("windows", 0),
+                                       "language": info.get("language", "unknown")})
+
+
+def _windows_done(journal):
+    return journal is not None and journal.load("transcription") is not None
+
+
+def _report_windows(info, window_seconds):
+    resumed = f", {info['resumed']} from the journal" if info.get("resumed") else ""
+    print(f"Transcribed {info.get('windows', 0)} window(s) of {window_seconds:.0f}s{resumed}")
+
+
+def transcribe_chunked(audio_file, transcribe=None, window_seconds=WINDOW_SECONDS,
+                       overlap_seconds=OVERLAP_SECONDS, on_segment=None, engine="auto",
+                       journal=None, vad="off", loop_guard=False):
+    """
+    Transcribe a long file in bounded memory, returning a Whisper-shaped result
+
+    ``on_segment`` is called with each segment as soon as it is final.
+    Without a ``transcribe`` function, ``engine`` is loaded. A Journal makes
+    the job resumable. With ``vad="energy"`` each window is transcribed
+    without its silences, and ``loop_guard`` catches repetition loops in
+    each window.
+    """
+    if transcribe is None and not _windows_done(journal):
+        from transcriber import load_whisper
+        transcribe = load_whisper(engine=engine)
+    if loop_guard and transcribe is not None:
+        from loop_guard import with_loop_guard
+        transcribe = with_loop_guard(transcribe)
+    if vad == "energy" and transcribe is not None:
+        from vad import with_vad
+        transcribe = with_vad(transcribe)
+
+    info = {}
+    segments = []
+    for window_segments in iter_windows(audio_file, transcribe, window_seconds, overlap_seconds,
+                                        info, journal):
+        segments.extend(window_segments)
+        if on_segment is not None:
+            for segment in window_segments:
+                on_segment(segment)
+
+    _report_windows(info, window_seconds)
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": info.get("language", "unknown")
+    }
+
+
+def transcribe_with_speakers_chunked(audio_file, hf_token, models=None, window_seconds=WINDOW_SECONDS,
+                                     overlap_seconds=OVERLAP_SECONDS, on_segment=None, engine="auto",
+                                     journal=None, diarize_workers=1, vad="off", loop_guard=False):
+    """
+    Chunked counterpart of transcriber.transcribe_with_speakers
+
+    Diarization runs in a background thread while the windows are
+    transcribed. It reads the file again in its own (longer) windows and
+    links their speakers (see parallel_diarization.diarize_file), so it is
+    bounded in memory as well. Segments are labelled and passed to
+    ``on_segment`` as soon as both their window and the diarization are
+    done. If transcription fails or is interrupted, the diarization is told
+    to stop and is not waited for. With a Journal, finished windows, the
+    diarization and the speaker labels are recorded as they complete, and
+    a rerun after a crash picks up from there.
+    """
+    from transcriber import load_diarizer, load_whisper
+
+    turns = journal.load("diarization") if journal is not None else None
+    if models:
+        transcribe, diarize = models.transcribe, models.diarize
+    else:
+        # Only load what is still left to do
+        transcribe = None if _windows_done(journal) else load_whisper(engine=engine)
+        diarize = None if turns is not None else load_diarizer(hf_token, diarize_workers)
+    if loop_guard and transcribe is not None:
+        from loop_guard import with_loop_guard
+        transcribe = with_loop_guard(transcribe)
+    if vad == "energy" and transcribe is not None:
+        # Windows are transcribed while diarization runs, so only energy VAD applies here
+        from vad import with_vad
+        transcribe = with_vad(transcribe)
+    known = (journal.load("alignment") if journal is not None else None) or []
+
+    info = {}
+    segments = []
+    labelled = 0
+    stop = threading.Event()
+    if turns is None:
+        print("Step 2: Performing speaker diarization in the background...")
+        turns_future = _in_background(_diarize_file, diarize, audio_file, journal, stop)
+        if not models and hasattr(diarize, "close"):
+            # Worker processes of a windowed diarizer go as soon as the diarization is over
+            turns_future.add_done_callback(lambda _: diarize.close(wait=False))
+    else:
+        print("Step 2: Using the journalled speaker diarization")
+        turns_future = Future()
+        turns_future.set_result(turns)
+
+    try:
+        print("Step 1: Transcribing in windows...")
+        for window_segments in iter_windows(audio_file, transcribe, window_seconds,
+                                            overlap_seconds, info, journal):
+            segments.extend({
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": segment["text"],
+                "speaker": None
+            } for segment in window_segments)
+            if turns_future.done():
+                labelled = _label(segments, labelled, turns_future.result(), on_segment,
+                                  journal, known)
+
+        _report_windows(info, window_seconds)
+        print("Step 3: Combining results...")
+        _label(segments, labelled, turns_future.result(), on_segment, journal, known)
+    except BaseException:
+        # Stop the diarization after its current window instead of waiting for the whole file
+        stop.set()
+        raise
+
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": info.get("language", "unknown")
+    }
+
+
+def _in_background(function, *args):
+    """
+    Run function(*args) in a daemon thread and return a Future of its result
+
+    Unlike a ThreadPoolExecutor's threads, nothing joins it: a caller that
+    fails, or an interpreter that exits, does not wait for it to finish.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = function(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _diarize_file(diarize, audio_file, journal=None, stop=None):
+    from parallel_diarization import diarize_file
+
+    with span("diarization", source=audio_file):
+        turns = diarize_file(audio_file, diarize, stop=stop)
+    if journal is not None:
+        journal.save("diarization", turns)
+    return turns
+
+
+def _label(segments, labelled, turns, on_segment, journal=None, known=()):
+    """
+    Assign speakers to segments[labelled:] and report them; returns the new count
+
+    Labels in ``known`` (from the journal) are reused for the segments they
+    cover, and the labels so far are journalled when new ones were computed.
+    """
+    pending = segments[labelled:]
+    reused = list(known[labelled:len(segments)])
+    with span("alignment", segments=len(pending) - len(reused), turns=len(turns)):
+        speakers = reused + assign_speakers(pending[len(reused):], turns)
+    for segment, speaker in zip(pending, speakers):
+        segment["speaker"] = speaker
+        if on_segment is not None:
+            on_segment(segment)
+    if journal is not None and len(reused) < len(pending):
+        journal.save("alignment", [segment["speaker"] for segment in segments])
+    return len(segments)
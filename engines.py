@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Registry of speech-recognition engines
+
+Every engine loads into a ``transcribe(audio, **options)`` function that
+takes an AudioBuffer and returns the Whisper result shape
+``{"text", "segments", "language"}``, with segment times relative to the
+buffer and per-word timestamps when ``word_timestamps=True`` is asked for
+and the engine supports it. Engines that decode segment by segment call
+``on_segment(segment)`` as each one is ready and stop once it returns
+true. MLX Whisper runs on Apple Silicon; the CTranslate2 (faster-whisper,
+int8) and whisper.cpp engines run on plain x86/ARM CPUs. With ``auto`` the
+first one installed for this platform is used.
+"""
+
+import importlib.util
+import platform
+import sys
+from collections import namedtuple
+from functools import partial
+
+from instrumentation import span
+from model_store import resolve_model
+
+# Engine name -> Engine; load(model) returns a transcribe(audio, **options) function
+Engine = namedtuple("Engine", ["load", "module", "default_model", "description"])
+
+ENGINES = {}
+
+# Quantized weights keep CTranslate2 fast and small on CPUs without a GPU
+FASTER_WHISPER_COMPUTE_TYPE = "int8"
+
+
+def register_engine(name, load, module, default_model, description):
+    """Add an engine; ``module`` is the import that tells whether it is installed"""
+    ENGINES[name] = Engine(load, module, default_model, description)
+
+
+def is_available(name):
+    module = ENGINES[name].module
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def available_engines():
+    return [name for name in ENGINES if is_available(name)]
+
+
+def _apple_silicon():
+    return sys.platform == "darwin" and platform.machine() == "arm64"
+
+
+def detect_engine():
+    """Pick the fastest engine installed for this machine"""
+    preferred = ["mlx", "faster-whisper", "whisper.cpp"] if _apple_silicon() \
+        else ["faster-whisper", "whisper.cpp", "mlx"]
+    for name in preferred:
+        if is_available(name):
+            return name
+    raise RuntimeError("No transcription engine installed; install mlx-whisper (Apple Silicon), "
+                       "faster-whisper or pywhispercpp")
+
+
+def resolve_engine(name="auto"):
+    """Map 'auto' to the detected engine and check that the engine exists"""
+    if name == "auto":
+        return detect_engine()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine '{name}', expected one of: auto, {', '.join(ENGINES)}")
+    return name
+
+
+def model_id(name="auto", model=None):
+    """Identify an engine's results in the cache"""
+    name = resolve_engine(name)
+    model = model or ENGINES[name].default_model
+    if name in ("mlx", "stub"):
+        # Plain ids, as before there was more than one engine
+        return model
+    if name == "faster-whisper":
+        return f"{name}:{model}:{FASTER_WHISPER_COMPUTE_TYPE}"
+    return f"{name}:{model}"
+
+
+def load_engine(name="auto", model=None):
+    """
+    Load an engine's weights and return (transcribe, model_id)
+
+    A model fetched into the model store (see model_store.py) is loaded from
+    its local path; the model id stays the same, so cached results still hit.
+    """
+    name = resolve_engine(name)
+    engine = ENGINES[name]
+    model = model or engine.default_model
+    local_path = resolve_model(name, model)
+    with span("load_whisper", engine=name, model=model, source="store" if local_path else "hub"):
+        transcribe = engine.load(local_path or model)
+    return transcribe, model_id(name, model)
+
+
+def describe(name="auto"):
+    return ENGINES[resolve_engine(name)].description
+
+
+# MLX Whisper
+
+def _mlx_transcribe(model_path, audio, on_segment=None, **options):
+    # mlx_whisper returns all segments at once, so on_segment is not called;
+    # loop_guard checks the finished result instead
+    import mlx_whisper
+
+    return mlx_whisper.transcribe(audio.samples, path_or_hf_repo=model_path, **options)
+
+
+def load_mlx(model):
+    import mlx.core as mx
+    from mlx_whisper.transcribe import ModelHolder
+
+    # mlx_whisper keeps the most recently loaded model in ModelHolder
+    ModelHolder.get_model(model, mx.float16)
+    return partial(_mlx_transcribe, model)
+
+
+# CTranslate2 via faster-whisper
+
+def _faster_whisper_transcribe(model, audio, word_timestamps=False, on_segment=None, **options):
+    segments, info = model.transcribe(audio.samples, word_timestamps=word_timestamps, **options)
+    results = []
+    # The segments are a generator: decoding happens while iterating, so
+    # stopping here (on_segment returned true) stops the decode
+    for i, segment in enumerate(segments):
+        result = {"id": i, "start": segment.start, "end": segment.end, "text": segment.text}
+        if word_timestamps:
+            result["words"] = [{"word": word.word, "start": word.start, "end": word.end,
+                                "probability": word.probability} for word in segment.words]
+        results.append(result)
+        if on_segment is not None and on_segment(result):
+            break
+    return {
+        "text": "".join(segment["text"] for segment in results),
+        "segments": results,
+        "language": info.language
+    }
+
+
+def load_faster_whisper(model):
+    from faster_whisper import WhisperModel
+
+    return partial(_faster_whisper_transcribe,
+                   WhisperModel(model, device="cpu", compute_type=FASTER_WHISPER_COMPUTE_TYPE))
+
+
+# whisper.cpp via pywhispercpp
+
+# pywhispercpp keeps the parameters of the last call on the model, so every
+# call sets all of the ones mapped here. These are whisper.cpp's defaults;
+# no_context only drops text left over from the previous call.
+WHISPERCPP_DEFAULTS = {"language": "auto", "initial_prompt": "", "temperature": 0.0, "temperature_inc": 0.2,
+                       "n_max_text_ctx": 16384, "no_speech_thold": 0.6, "logprob_thold": -1.0,
+                       "no_context": True}
+# Accepted for every engine but not available from whisper.cpp here
+WHISPERCPP_IGNORED = ("word_timestamps", "on_segment")
+
+
+def whispercpp_params(options):
+    """Map Whisper transcribe() options to whisper.cpp parameters; unknown options raise TypeError"""
+    params = dict(WHISPERCPP_DEFAULTS)
+    for name, value in options.items():
+        if name in WHISPERCPP_IGNORED:
+            continue
+        if name == "language":
+            params["language"] = value or "auto"
+        elif name == "initial_prompt":
+            params["initial_prompt"] = value or ""
+        elif name == "temperature":
+            # A sequence is Whisper's fallback schedule; whisper.cpp takes its start and step
+            temperatures = tuple(value) if isinstance(value, (tuple, list)) else (value,)
+            params["temperature"] = float(temperatures[0])
+            params["temperature_inc"] = float(temperatures[1] - temperatures[0]) if len(temperatures) > 1 else 0.0
+        elif name == "condition_on_previous_text":
+            params["n_max_text_ctx"] = WHISPERCPP_DEFAULTS["n_max_text_ctx"] if value else 0
+        elif name == "no_speech_threshold":
+            params["no_speech_thold"] = float(value)
+        elif name == "logprob_threshold":
+            params["logprob_thold"] = float(value)
+        else:
+            raise TypeError(f"whisper.cpp engine does not support the '{name}' option")
+    return params
+
+
+def _whispercpp_transcribe(model, audio, **options):
+    # whisper.cpp has no per-word output here; chunked stitching falls back
+    # to segment midpoints without it. Segments come back all at once, so
+    # on_segment is not called; loop_guard checks the finished result instead
+    params = whispercpp_params(options)
+    segments = model.transcribe(audio.samples, **params)
+    # t0/t1 are in units of 10 ms
+    results = [{"id": i, "start": segment.t0 / 100, "end": segment.t1 / 100, "text": segment.text}
+               for i, segment in enumerate(segments)]
+    return {
+        "text": "".join(segment["text"] for segment in results),
+        "segments": results,
+        "language": options.get("language") or "unknown"
+    }
+
+
+def load_whispercpp(model):
+    from pywhispercpp.model import Model
+
+    return partial(_whispercpp_transcribe, Model(model, print_progress=False, print_realtime=False))
+
+
+register_engine("mlx", load_mlx, "mlx_whisper", "mlx-community/whisper-tiny",
+                "MLX Whisper")
+register_engine("faster-whisper", load_faster_whisper, "faster_whisper", "tiny",
+                "faster-whisper (CTranslate2, int8)")
+register_engine("whisper.cpp", load_whispercpp, "pywhispercpp", "tiny",
+                "whisper.cpp")
+
+ENGINE_CHOICES = ("auto", *ENGINES)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Named timing spans around the pipeline stages
+
+Wrap a stage in ``with span("transcription"):`` to record its wall time,
+CPU time and the process's peak memory. Nothing is recorded until
+``enable()`` is called; while disabled, ``span`` hands back one shared
+no-op context manager. Recorded spans export as plain JSON or as Chrome
+trace events (load the file in chrome://tracing or https://ui.perfetto.dev).
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+_NULL_SPAN = nullcontext()
+_tracer = None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB"""
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class _Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.rss = peak_rss_mb()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        peak = peak_rss_mb()
+        self.tracer.record({
+            "name": self.name,
+            "start": self.wall - self.tracer.origin,
+            "wall_seconds": end - self.wall,
+            "cpu_seconds": time.process_time() - self.cpu,
+            "peak_rss_mb": round(peak, 1),
+            "rss_growth_mb": round(peak - self.rss, 1),
+            "thread": threading.get_ident(),
+            "error": exc_type.__name__ if exc_type else None,
+            **self.args
+        })
+        return False
+
+
+class Tracer:
+    """Collects finished spans; safe to use from several threads"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def span(self, name, args):
+        return _Span(self, name, args)
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def totals(self):
+        """Wall and CPU seconds summed per span name, in first-seen order"""
+        totals = {}
+        for span in self.spans:
+            entry = totals.setdefault(span["name"], {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            entry["count"] += 1
+            entry["wall_seconds"] += span["wall_seconds"]
+            entry["cpu_seconds"] += span["cpu_seconds"]
+        return totals
+
+    def summary(self):
+        lines = [f"{'stage':<24} {'count':>5} {'wall (s)':>9} {'cpu (s)':>9}"]
+        for name, entry in self.totals().items():
+            lines.append(f"{name:<24} {entry['count']:>5} {entry['wall_seconds']:>9.3f} "
+                         f"{entry['cpu_seconds']:>9.3f}")
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({"spans": self.spans, "totals": self.totals()}, f, indent=2)
+        return path
+
+    def write_chrome_trace(self, path):
+        events = [{
+            "name": span["name"],
+            "ph": "X",
+            "ts": round(span["start"] * 1e6, 1),
+            "dur": round(span["wall_seconds"] * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": span["thread"],
+            "args": {key: value for key, value in span.items()
+                     if key not in ("name", "start", "wall_seconds", "thread")}
+        } for span in self.spans]
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+def enable():
+    """Start recording spans and return the tracer"""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable():
+    """Stop recording and return the tracer that was active, if any"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def current():
+    return _tracer
+
+
+def span(name, **args):
+    """Context manager timing one stage; a shared no-op while disabled"""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, args)
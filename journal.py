@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Checkpoint journal that lets an interrupted job resume
+
+Each job gets its own directory holding one JSON file per completed unit of
+work: chunk transcripts, the diarization turns, alignment progress. Every
+file is written to a temporary name, synced and renamed into place, so a
+killed process leaves either the whole unit or nothing. Re-running the same
+command on the same file finds the directory again and skips what is
+already there; the directory is removed once the job finishes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from result_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_JOURNAL_DIR = os.path.join(DEFAULT_CACHE_DIR, "jobs")
+
+
+class Journal:
+    """Completed units of one job, stored as JSON files in ``job_dir``"""
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        os.makedirs(job_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.job_dir, f"{name}.json")
+
+    def load(self, name):
+        """Return a saved unit, or None if it was never completed"""
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save(self, name, value):
+        """Record a completed unit atomically"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.job_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def discard(self):
+        """Delete the journal once its job has finished"""
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+
+
+def open_journal(audio_file, params, root=DEFAULT_JOURNAL_DIR):
+    """
+    Open the journal for this file and job parameters
+
+    The job is identified by the file's path, size and modification time
+    plus ``params`` (models, window sizes...), so editing the file or
+    changing the settings starts a fresh job instead of resuming a stale one.
+    """
+    stat = os.stat(audio_file)
+    key = json.dumps([os.path.abspath(audio_file), stat.st_size, stat.st_mtime_ns, params],
+                     sort_keys=True)
+    journal = Journal(os.path.join(root, hashlib.sha256(key.encode()).hexdigest()[:32]))
+    if journal.load("job") is None:
+        journal.save("job", {"audio_file": os.path.abspath(audio_file), "params": params})
+    return journal
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Repetition-loop guard: stop a decode that loops and re-decode only that stretch
+
+On long silence or noise Whisper can fall into a loop, repeating one
+phrase (or stalling on one timestamp) for minutes while it keeps decoding.
+A LoopMonitor watches the segments as they come out and flags a loop by
+n-gram repetition, compression ratio (Whisper's own 2.4 threshold) or
+timestamps that stop advancing. Repetition alone is not enough, since
+people do say "Yes." three times: the repeating stretch must also last
+MIN_LOOP_SECONDS or compress like a loop. Engines that yield segments as they decode
+(faster-whisper and the looping stand-in) take the monitor as
+``on_segment`` and stop as soon as it fires; MLX Whisper and whisper.cpp
+return everything at once, so their output is checked afterwards.
+
+Either way only the looping stretch is decoded again, without conditioning
+on the previous text or a prompt and with temperature fallback, which is what breaks
+Whisper out of a loop. Output that still loops is dropped, unless it is
+the same text the first decode gave: then the repetition is in the audio
+and is kept. Times stay those of the recording.
+"""
+
+import re
+import zlib
+from functools import partial
+
+from audio_io import AudioBuffer
+from instrumentation import span
+from vad import shift_segment
+
+# Segments and words looked at when checking for a loop
+RECENT_SEGMENTS = 10
+RECENT_WORDS = 24
+# The same text this many segments in a row
+REPEAT_SEGMENTS = 3
+# Share of the recent word n-grams that repeat an earlier one
+NGRAM = 3
+MIN_NGRAMS = 6
+REPEAT_SHARE = 0.5
+# A repeat shorter than this that does not compress like a loop is someone repeating themselves
+MIN_LOOP_SECONDS = 10.0
+# A segment whose text compresses better than this repeats itself; Whisper
+# uses the same threshold (across segments the n-gram check applies)
+COMPRESSION_RATIO = 2.4
+MIN_COMPRESSION_CHARS = 60
+# Segments that are shorter than this, or start less than this after the previous one, stall
+MIN_SEGMENT_SECONDS = 0.1
+STALL_SEGMENTS = 4
+
+# Audio re-decoded after a streamed decode is stopped
+REDECODE_SECONDS = 30.0
+REDECODE_OPTIONS = {"condition_on_previous_text": False, "initial_prompt": None,
+                    "temperature": (0.2, 0.4, 0.6, 0.8, 1.0)}
+# A re-decoded segment ending this close to the window's end may be cut off
+CUT_SECONDS = 0.05
+# Least a re-decode moves the decode on, so a cut at the window's start cannot repeat forever
+MIN_ADVANCE_SECONDS = 1.0
+
+
+def _normalize(text):
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+def compression_ratio(text):
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data))
+
+
+def _sustained(looped):
+    """True when a repeating stretch lasts too long or compresses too well to be speech"""
+    if looped[-1]["end"] - looped[0]["start"] >= MIN_LOOP_SECONDS:
+        return True
+    text = " ".join(segment["text"].strip() for segment in looped)
+    return len(text) >= MIN_COMPRESSION_CHARS and compression_ratio(text) > COMPRESSION_RATIO
+
+
+def _stalled(segment, previous):
+    if segment["end"] - segment["start"] < MIN_SEGMENT_SECONDS:
+        return True
+    return previous is not None and segment["start"] - previous["start"] < MIN_SEGMENT_SECONDS
+
+
+class LoopMonitor:
+    """
+    Checks decoded segments one at a time for a repetition loop
+
+    ``feed(segment)`` returns the reason ("repetition", "compression" or
+    "stall") once the recent segments look like a loop, so it can be given
+    to an engine as ``on_segment`` to stop it. ``first`` is then the index
+    of the first segment of the loop.
+    """
+
+    def __init__(self):
+        self.segments = []
+        self.reason = None
+        self.first = None
+        # Where the repetition seen in the recent segments began, while it lasts
+        self.repeat_start = None
+
+    def feed(self, segment):
+        self.segments.append(segment)
+        if self.reason is None:
+            self.reason = self._check()
+            if self.reason is not None and self.first is None:
+                self.first = self._loop_start()
+        return self.reason
+
+    def _check(self):
+        recent = self.segments[-RECENT_SEGMENTS:]
+        texts = [_normalize(segment["text"]) for segment in recent]
+
+        repeated = len(texts) >= REPEAT_SEGMENTS and texts[-1] and len(set(texts[-REPEAT_SEGMENTS:])) == 1
+        if not repeated:
+            words = " ".join(texts).split()[-RECENT_WORDS:]
+            ngrams = list(zip(*(words[i:] for i in range(NGRAM))))
+            repeated = len(ngrams) >= MIN_NGRAMS and 1 - len(set(ngrams)) / len(ngrams) >= REPEAT_SHARE
+        if not repeated:
+            self.repeat_start = None
+        else:
+            if self.repeat_start is None:
+                self.repeat_start = self._loop_start()
+            if _sustained(self.segments[self.repeat_start:]):
+                self.first = self.repeat_start
+                return "repetition"
+
+        text = recent[-1]["text"].strip()
+        if len(text) >= MIN_COMPRESSION_CHARS and compression_ratio(text) > COMPRESSION_RATIO:
+            return "compression"
+
+        if len(self.segments) >= STALL_SEGMENTS:
+            tail = self.segments[-STALL_SEGMENTS:]
+            before = self.segments[-STALL_SEGMENTS - 1] if len(self.segments) > STALL_SEGMENTS else None
+            if all(_stalled(segment, previous) for previous, segment in zip([before] + tail[:-1], tail)):
+                return "stall"
+        return None
+
+    def _loop_start(self):
+        """Walk back from the last segment over segments the loop repeats"""
+        first = len(self.segments) - 1
+        limit = max(len(self.segments) - RECENT_SEGMENTS, 0)
+        while first > limit:
+            segment = self.segments[first - 1]
+            text = _normalize(segment["text"])
+            later = " ".join(_normalize(s["text"]) for s in self.segments[first:])
+            previous = self.segments[first - 2] if first >= 2 else None
+            if (text and f" {text} " in f" {later} ") or _stalled(segment, previous):
+                first -= 1
+            else:
+                break
+        return first
+
+    def continues(self, segment, previous):
+        """True when a later segment still belongs to the detected loop"""
+        loop_words = set(" ".join(_normalize(s["text"]) for s in self.segments[self.first:]).split())
+        words = _normalize(segment["text"]).split()
+        return (bool(words) and set(words) <= loop_words) or _stalled(segment, previous)
+
+
+def find_loops(segments):
+    """Return (reason, first, last) for each loop in a finished list of segments, ``last`` exclusive"""
+    loops = []
+    monitor = LoopMonitor()
+    base = index = 0
+    while index < len(segments):
+        if monitor.feed(segments[index]):
+            first, last = base + monitor.first, index + 1
+            while last < len(segments) and monitor.continues(segments[last], segments[last - 1]):
+                last += 1
+            loops.append((monitor.reason, first, last))
+            monitor = LoopMonitor()
+            base = index = last
+            continue
+        index += 1
+    return loops
+
+
+def _piece(audio, start, end):
+    rate = audio.sample_rate
+    return AudioBuffer(audio.samples[int(start * rate):int(end * rate)], rate, audio.source,
+                       offset=audio.offset + start)
+
+
+def _decode(transcribe, audio, **options):
+    """Decode with a LoopMonitor and return (result, monitor, whether the engine streamed)"""
+    monitor = LoopMonitor()
+    result = transcribe(audio, on_segment=monitor.feed, **options)
+    streamed = bool(monitor.segments)
+    if not streamed:
+        # The engine returned everything at once
+        for segment in result["segments"]:
+            if monitor.feed(segment):
+                break
+    return result, monitor, streamed
+
+
+def _agrees(segments, looped):
+    """True when a re-decode starts with the same text as the segments flagged as a loop"""
+    texts = [_normalize(segment["text"]) for segment in looped]
+    return [_normalize(segment["text"]) for segment in segments[:len(texts)]] == texts
+
+
+def _redecode(transcribe, audio, start, end, reason, options, cut, looped):
+    """
+    Decode [start, end) again with loop-breaking settings
+
+    Returns the segments in the recording's timeline and where decoding
+    should resume, at least MIN_ADVANCE_SECONDS past ``start``. With
+    ``cut`` a segment running into ``end`` is left to the next pass.
+    ``looped`` are the first decode's segments flagged as the loop.
+    """
+    print(f"Loop guard: {reason} loop at {audio.offset + start:.1f}s, "
+          f"re-decoding {audio.offset + start:.1f}-{audio.offset + end:.1f}s")
+    with span("loop_redecode", reason=reason, start=round(audio.offset + start, 3),
+              audio_seconds=round(end - start, 3)):
+        result, monitor, _ = _decode(transcribe, _piece(audio, start, end), **{**options, **REDECODE_OPTIONS})
+    segments = result["segments"]
+    if monitor.reason is not None:
+        if _agrees(segments, looped):
+            # Decoded the same way twice: the repetition is in the audio
+            print("Loop guard: the re-decode gives the same text, keeping it")
+        else:
+            print(f"Loop guard: still looping, dropping {len(segments) - monitor.first} segment(s)")
+            segments = segments[:monitor.first]
+    resume = end
+    if (cut and len(segments) > 1 and segments[-1]["end"] >= end - start - CUT_SECONDS
+            and segments[-1]["start"] >= MIN_ADVANCE_SECONDS):
+        resume = start + segments[-1]["start"]
+        segments = segments[:-1]
+    return [shift_segment(segment, start) for segment in segments], resume
+
+
+def transcribe_guarded(audio, transcribe, **options):
+    """
+    Transcribe an AudioBuffer, stopping and re-decoding repetition loops
+
+    A streamed decode is stopped at the first loop; REDECODE_SECONDS from
+    the loop's start are decoded again and the decode carries on from
+    there. Output that arrived all at once is searched for loops, and each
+    one is re-decoded up to the segment after it.
+    """
+    segments = []
+    language = None
+    cursor = 0.0
+    while cursor < audio.duration:
+        result, monitor, streamed = _decode(transcribe, _piece(audio, cursor, audio.duration), **options)
+        language = language or result.get("language")
+        found = result["segments"]
+
+        if not streamed or monitor.reason is None:
+            kept = 0
+            for reason, first, last in find_loops(found):
+                segments += [shift_segment(segment, cursor) for segment in found[kept:first]]
+                start = cursor + max(found[first]["start"], 0.0)
+                end = cursor + found[last]["start"] if last < len(found) else audio.duration
+                redecoded, _ = _redecode(transcribe, audio, start, end, reason, options, cut=False,
+                                         looped=found[first:last])
+                segments += redecoded
+                kept = last
+            segments += [shift_segment(segment, cursor) for segment in found[kept:]]
+            break
+
+        segments += [shift_segment(segment, cursor) for segment in found[:monitor.first]]
+        start = cursor + max(found[monitor.first]["start"], 0.0)
+        end = min(start + REDECODE_SECONDS, audio.duration)
+        redecoded, cursor = _redecode(transcribe, audio, start, end, monitor.reason, options,
+                                      cut=end < audio.duration, looped=found[monitor.first:])
+        segments += redecoded
+
+    segments = [{**segment, "id": i} for i, segment in enumerate(segments)]
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": language or "unknown"
+    }
+
+
+def _guarded_transcribe(transcribe, audio, **options):
+    return transcribe_guarded(audio, transcribe, **options)
+
+
+def with_loop_guard(transcribe):
+    """Wrap a transcribe(audio, **options) function so repetition loops are caught"""
+    return partial(_guarded_transcribe, transcribe)
+
+
+def loop_guard_id(model, loop_guard):
+    """Cache/journal id of a transcription made with or without the loop guard"""
+    return f"{model}:loop-guard" if loop_guard else model
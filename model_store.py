@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Local store of model weights, fetched once and loaded without the hub
+
+``python model_store.py prefetch`` downloads the Whisper weights for an
+engine and the pyannote pipeline (with the segmentation and embedding
+models its config.yaml names) into one directory, and records every file's
+size and SHA-256 in ``manifest.json``. Once a model is in the store,
+engines.load_engine and transcriber.load_diarizer load it from its local
+path: no hub lookups, no network. Models that are not in the store load
+from the hub as before.
+
+Loading only checks that the manifest's files exist with the right sizes,
+which costs a few stat calls; ``verify`` re-hashes everything. ``--from``
+copies the models from a local directory laid out by repo id (e.g.
+``DIR/mlx-community/whisper-tiny``) instead of downloading them, for
+machines without network access.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from instrumentation import span
+from result_cache import DEFAULT_CACHE_DIR
+
+STORE_ENV = "WHISPER_MODEL_STORE"
+DEFAULT_STORE_DIR = os.path.join(DEFAULT_CACHE_DIR, "models")
+MANIFEST = "manifest.json"
+
+DIARIZATION_KIND = "pyannote"
+# Stands for the store directory in a stored pipeline config, so the store can be moved
+STORE_PLACEHOLDER = "${MODEL_STORE}"
+# Sub-models named by repo id in a pyannote pipeline config
+PIPELINE_MODEL_LINE = re.compile(r"^(\s*(?:segmentation|embedding):\s*)([\w.-]+/[\w.-]+)\s*$", re.MULTILINE)
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def store_dir():
+    """The store used by the loaders: $WHISPER_MODEL_STORE, or the default under the cache"""
+    return os.environ.get(STORE_ENV) or DEFAULT_STORE_DIR
+
+
+def model_key(kind, model):
+    return f"{kind}/{model}"
+
+
+def _local_name(repo_id):
+    return repo_id.replace("/", "--")
+
+
+def model_files(kind, model):
+    """Return (repo_id, file patterns or None for all, path loaded) for an engine's model"""
+    if kind == "faster-whisper":
+        # faster-whisper's size names are CTranslate2 conversions published by Systran
+        return (model if "/" in model else f"Systran/faster-whisper-{model}"), None, ""
+    if kind == "whisper.cpp":
+        name = f"ggml-{model}.bin"
+        return "ggerganov/whisper.cpp", [name], name
+    if kind == DIARIZATION_KIND:
+        return model, None, "config.yaml"
+    return model, None, ""
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """
+    Directory of fetched models plus a manifest of their files
+
+    Each manifest entry records the model's kind (an engine name or
+    ``pyannote``), the path to hand its loader and, for every file, its
+    size and SHA-256. Paths are relative to the store.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or store_dir()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+    def entries(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_entries(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _fetch(self, repo_id, patterns, hf_token, source):
+        """Copy or download one repo into the store and return its directory relative to the store"""
+        relative = os.path.join("repos", _local_name(repo_id))
+        target = os.path.join(self.directory, relative)
+        if source:
+            origin = os.path.join(source, repo_id)
+            if not os.path.isdir(origin):
+                raise FileNotFoundError(f"'{repo_id}' not found under {source}")
+            ignore = None
+            if patterns:
+                ignore = lambda folder, names: [name for name in names
+                                                if not os.path.isdir(os.path.join(folder, name))
+                                                and not any(fnmatch.fnmatch(name, p) for p in patterns)]
+            shutil.copytree(origin, target, ignore=ignore, dirs_exist_ok=True)
+        else:
+            from huggingface_hub import snapshot_download
+
+            snapshot_download(repo_id, local_dir=target, allow_patterns=patterns, token=hf_token)
+        return relative
+
+    def _localize_pipeline(self, config_path, hf_token, source):
+        """Fetch the sub-models a pyannote config names and point the config at them"""
+        with open(config_path) as f:
+            config = f.read()
+
+        def local_checkpoint(match):
+            relative = self._fetch(match.group(2), None, hf_token, source)
+            return match.group(1) + "/".join([STORE_PLACEHOLDER, relative, "pytorch_model.bin"])
+
+        config = PIPELINE_MODEL_LINE.sub(local_checkpoint, config)
+        with open(config_path, "w") as f:
+            f.write(config)
+        # Also finds the sub-models of a config localized by an earlier prefetch
+        return sorted(set(re.findall(re.escape(STORE_PLACEHOLDER) + r"/(repos/[^/\s]+)/", config)))
+
+    def prefetch(self, kind, model, hf_token=None, source=None):
+        """Fetch a model into the store, record it in the manifest and return its entry"""
+        repo_id, patterns, load_path = model_files(kind, model)
+        print(f"Fetching {model_key(kind, model)} from {source or 'the HuggingFace Hub'}...")
+        start = time.perf_counter()
+        repos = [self._fetch(repo_id, patterns, hf_token, source)]
+        if kind == DIARIZATION_KIND:
+            repos += self._localize_pipeline(os.path.join(self.directory, repos[0], load_path),
+                                             hf_token, source)
+
+        files = {}
+        for relative in repos:
+            for folder, dirs, names in os.walk(os.path.join(self.directory, relative)):
+                # snapshot_download keeps its own bookkeeping in .cache
+                dirs[:] = [name for name in dirs if name != ".cache"]
+                for name in names:
+                    path = os.path.join(folder, name)
+                    files[os.path.relpath(path, self.directory)] = {
+                        "size": os.path.getsize(path), "sha256": file_hash(path)}
+        if not files:
+            raise FileNotFoundError(f"No files fetched for {model_key(kind, model)}")
+
+        entry = {
+            "kind": kind,
+            "model": model,
+            "path": os.path.join(repos[0], load_path) if load_path else repos[0],
+            "files": files,
+            "bytes": sum(info["size"] for info in files.values()),
+            "fetched": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        entries = self.entries()
+        entries[model_key(kind, model)] = entry
+        self._write_entries(entries)
+        print(f"Stored {len(files)} file(s), {entry['bytes'] / 1024 ** 2:.1f} MB "
+              f"in {time.perf_counter() - start:.1f}s")
+        return entry
+
+    def resolve(self, kind, model):
+        """
+        Return the local path to load a model from, or None if it is not stored
+
+        Checks that every file in the manifest exists with its recorded size;
+        a damaged entry raises rather than quietly falling back to the hub.
+        """
+        entry = self.entries().get(model_key(kind, model))
+        if entry is None:
+            return None
+        with span("resolve_model", kind=kind, model=model, files=len(entry["files"]), bytes=entry["bytes"]):
+            for relative, info in entry["files"].items():
+                try:
+                    size = os.path.getsize(os.path.join(self.directory, relative))
+                except OSError:
+                    size = None
+                if size != info["size"]:
+                    raise RuntimeError(f"Model store entry {model_key(kind, model)} is damaged "
+                                       f"({relative}); run model_store.py prefetch again")
+        return os.path.join(self.directory, entry["path"])
+
+    def verify(self, keys=None):
+        """Re-hash stored files and return {key: [files that are missing or differ]}"""
+        problems = {}
+        for key, entry in self.entries().items():
+            if keys and key not in keys:
+                continue
+            bad = []
+            for relative, info in entry["files"].items():
+                path = os.path.join(self.directory, relative)
+                if not os.path.exists(path) or file_hash(path) != info["sha256"]:
+                    bad.append(relative)
+            problems[key] = bad
+        return problems
+
+
+def resolve_model(kind, model):
+    """Local path of a model in the default store, or None to load it from the hub"""
+    return ModelStore().resolve(kind, model)
+
+
+def pipeline_config(path):
+    """Write a stored pipeline config with the store's real location and return its path"""
+    with open(path) as f:
+        config = f.read()
+    store = os.path.dirname(os.path.dirname(os.path.dirname(path)))
+    fd, resolved = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(fd, "w") as f:
+        f.write(config.replace(STORE_PLACEHOLDER, store))
+    return resolved
+
+
+def _load_model(kind, model):
+    """Load a model the way the pipeline does, so it goes through the store"""
+    if kind == DIARIZATION_KIND:
+        from transcriber import load_diarizer
+
+        return load_diarizer(None)
+    from engines import load_engine
+
+    return load_engine(kind, model)
+
+
+def main():
+    from engines import ENGINE_CHOICES, ENGINES, resolve_engine
+    from transcriber import DIARIZATION_MODEL
+
+    parser = argparse.ArgumentParser(description="Fetch models into a local store and load them offline")
+    parser.add_argument("--store", default=store_dir(),
+                        help=f"store directory (default: ${STORE_ENV} or {DEFAULT_STORE_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prefetch = commands.add_parser("prefetch", help="fetch models into the store")
+    prefetch.add_argument("--engine", default="auto", choices=ENGINE_CHOICES,
+                          help="transcription engine whose weights to fetch (default: auto)")
+    prefetch.add_argument("--model", help="model name for the engine (default: the engine's default)")
+    prefetch.add_argument("--no-diarization", action="store_true", help="skip the pyannote pipeline")
+    prefetch.add_argument("--from", dest="source", metavar="DIR",
+                          help="copy from a local directory laid out by repo id instead of downloading")
+    prefetch.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"),
+                          help="HuggingFace token with access to the pyannote models (default: $HF_TOKEN)")
+    commands.add_parser("list", help="list the stored models")
+    commands.add_parser("verify", help="re-hash every stored file against the manifest")
+    commands.add_parser("load", help="load every stored model and report the load times")
+    args = parser.parse_args()
+
+    store = ModelStore(args.store)
+    if args.command == "prefetch":
+        try:
+            engine = resolve_engine(args.engine)
+            targets = [(engine, args.model or ENGINES[engine].default_model)]
+            if not args.no_diarization:
+                targets.append((DIARIZATION_KIND, DIARIZATION_MODEL))
+            for kind, model in targets:
+                store.prefetch(kind, model, args.hf_token, args.source)
+        except Exception as e:
+            print(f"Error: {type(e).__name__}: {e}")
+            sys.exit(1)
+        print(f"Model store: {store.directory}")
+        return
+
+    entries = store.entries()
+    if not entries:
+        print(f"No models in {store.directory}; run model_store.py prefetch first")
+        sys.exit(1)
+
+    if args.command == "list":
+        for key, entry in sorted(entries.items()):
+            print(f"{key:<50} {len(entry['files']):>5} file(s) {entry['bytes'] / 1024 ** 2:>9.1f} MB  "
+                  f"{entry['fetched']}")
+    elif args.command == "verify":
+        problems = store.verify()
+        for key, bad in sorted(problems.items()):
+            print(f"{key:<50} {'ok' if not bad else f'{len(bad)} damaged, e.g. {bad[0]}'}")
+        if any(problems.values()):
+            sys.exit(1)
+    else:
+        # The loaders find the store through the environment, as they would in a real run
+        os.environ[STORE_ENV] = store.directory
+        failed = False
+        print(f"{'model':<50} {'resolve ms':>10} {'load s':>8}")
+        for key, entry in sorted(entries.items()):
+            start = time.perf_counter()
+            store.resolve(entry["kind"], entry["model"])
+            resolved = time.perf_counter()
+            try:
+                _load_model(entry["kind"], entry["model"])
+            except Exception as e:
+                print(f"{key:<50} {(resolved - start) * 1000:>10.2f}   failed: {type(e).__name__}: {e}")
+                failed = True
+                continue
+            print(f"{key:<50} {(resolved - start) * 1000:>10.2f} {time.perf_counter() - resolved:>8.2f}")
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
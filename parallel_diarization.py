@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Diarize long recordings in overlapping windows on several processes
+
+One pyannote call on a multi-hour file runs on a single worker and is the
+slowest stage. Here the audio is cut into windows that overlap their
+neighbours, each window is diarized in a pool of worker processes (each
+holding its own pipeline), and the per-window speaker labels are linked
+into file-wide ones:
+
+- two labels are the same speaker when their turns agree in the overlap
+  shared by consecutive windows;
+- a speaker who is silent in that overlap is matched to the closest
+  earlier speaker by a long-term average spectrum of their turns, or
+  becomes a new speaker when none is close enough.
+
+The result is the usual list of (start, end, "SPEAKER_xx") turns.
+Given a file path, the windows are read from disk as they are needed, so
+only a few windows of samples are held at once. diarize_file does the
+same in the calling process, so the chunked pipeline can diarize in
+bounded memory with or without workers.
+"""
+
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE, AudioBuffer
+from instrumentation import span
+
+DIARIZATION_WINDOW_SECONDS = 600.0
+DIARIZATION_OVERLAP_SECONDS = 60.0
+
+# module:function that loads a diarize(audio) function in each worker
+DEFAULT_DIARIZER = "transcriber:load_diarizer"
+
+# Seconds two labels must speak together in an overlap to be linked
+MIN_AGREEMENT_SECONDS = 2.0
+# Cosine similarity of voice signatures needed to link labels without overlap evidence
+MIN_SIGNATURE_SIMILARITY = 0.95
+
+# Audio per label that goes into its voice signature
+SIGNATURE_SECONDS = 30.0
+SIGNATURE_FRAME = 512
+
+# Per-process diarizer set up by _init_worker
+_diarize = None
+
+
+def plan_windows(duration, window_seconds=DIARIZATION_WINDOW_SECONDS,
+                 overlap_seconds=DIARIZATION_OVERLAP_SECONDS):
+    """Return (start, end) seconds of windows covering ``duration`` with the given overlap"""
+    if overlap_seconds < 0 or window_seconds <= overlap_seconds:
+        raise ValueError("The window must be longer than its overlap")
+    windows = []
+    start = 0.0
+    while start + window_seconds < duration:
+        windows.append((start, start + window_seconds))
+        start += window_seconds - overlap_seconds
+    windows.append((start, duration))
+    return windows
+
+
+def _init_worker(loader_spec, hf_token):
+    """Pool initializer: load the diarizer once per worker process"""
+    from worker import resolve_loader
+
+    global _diarize
+    _diarize = resolve_loader(loader_spec)(hf_token)
+
+
+def window_result(diarize, window):
+    """
+    Diarize one window AudioBuffer
+
+    Returns its turns relative to the window and a voice signature per
+    label, so the windows can be linked without the rest of the audio.
+    """
+    turns = diarize(window)
+    by_label = {}
+    for turn in turns:
+        by_label.setdefault(turn[2], []).append(turn)
+    return turns, {label: voice_signature(window, label_turns) for label, label_turns in by_label.items()}
+
+
+def _diarize_window(audio, start, end):
+    """Diarize one window of a shared AudioBuffer in a worker"""
+    first = int(round(start * audio.sample_rate))
+    last = int(round(end * audio.sample_rate))
+    window = AudioBuffer(audio.samples[first:last], audio.sample_rate, audio.source,
+                         offset=audio.offset + start)
+    return window_result(_diarize, window)
+
+
+def _diarize_buffer(window):
+    """Diarize a window AudioBuffer sent to a worker"""
+    return window_result(_diarize, window)
+
+
+def voice_signature(audio, turns, seconds=SIGNATURE_SECONDS, frame=SIGNATURE_FRAME):
+    """
+    Long-term average log spectrum of the audio under ``turns``, or None
+
+    A coarse voice print: cheap, needs no model, and stable across windows.
+    The vector is centred and normalised, so signatures compare by dot product.
+    """
+    rate = audio.sample_rate
+    limit = int(seconds * rate)
+    pieces = []
+    total = 0
+    for start, end, _ in turns:
+        piece = audio.samples[int(start * rate):int(end * rate)][:limit - total]
+        piece = piece[:len(piece) // frame * frame]
+        pieces.append(piece)
+        total += len(piece)
+        if limit - total < frame:
+            break
+    if total < frame:
+        return None
+    frames = np.concatenate(pieces).reshape(-1, frame) * np.hanning(frame).astype(np.float32)
+    power = np.mean(np.abs(np.fft.rfft(frames, axis=1)) ** 2, axis=0)
+    signature = np.log(power + 1e-10)
+    signature -= signature.mean()
+    norm = np.linalg.norm(signature)
+    return signature / norm if norm else None
+
+
+def _agreement(turns_a, turns_b, lo, hi):
+    """Seconds each (label_a, label_b) pair speaks at the same time within [lo, hi]"""
+    seconds = {}
+    for start_a, end_a, label_a in turns_a:
+        start_a, end_a = max(start_a, lo), min(end_a, hi)
+        if end_a <= start_a:
+            continue
+        for start_b, end_b, label_b in turns_b:
+            both = min(end_a, end_b) - max(start_a, start_b)
+            if both > 0:
+                seconds[label_a, label_b] = seconds.get((label_a, label_b), 0.0) + both
+    return seconds
+
+
+def link_windows(windows, window_turns, signatures=None, min_agreement=MIN_AGREEMENT_SECONDS,
+                 min_similarity=MIN_SIGNATURE_SIMILARITY):
+    """
+    Map each window's local labels to file-wide speaker numbers
+
+    ``window_turns`` holds each window's turns in file time and
+    ``signatures`` (optional) one {label: signature} dict per window.
+    Returns one {local label: speaker number} dict per window.
+    """
+    mappings = []
+    centroids = []
+    for w, turns in enumerate(window_turns):
+        mapping = {}
+        if w:
+            previous = [(start, end, mappings[-1][label]) for start, end, label in window_turns[w - 1]]
+            pairs = _agreement(previous, turns, windows[w][0], windows[w - 1][1])
+            for (speaker, label), seconds in sorted(pairs.items(), key=lambda item: -item[1]):
+                if seconds < min_agreement:
+                    break
+                if label not in mapping and speaker not in mapping.values():
+                    mapping[label] = speaker
+
+        local_signatures = signatures[w] if signatures else {}
+        for label in dict.fromkeys(label for _, _, label in turns):
+            if label in mapping:
+                continue
+            signature = local_signatures.get(label)
+            taken = set(mapping.values())
+            best, best_similarity = None, min_similarity
+            if signature is not None:
+                for speaker, centroid in enumerate(centroids):
+                    if speaker in taken or centroid is None:
+                        continue
+                    similarity = float(signature @ centroid) / float(np.linalg.norm(centroid))
+                    if similarity >= best_similarity:
+                        best, best_similarity = speaker, similarity
+            if best is None:
+                best = len(centroids)
+                centroids.append(None)
+            mapping[label] = best
+
+        for label, speaker in mapping.items():
+            signature = local_signatures.get(label)
+            if signature is not None:
+                centroids[speaker] = signature if centroids[speaker] is None else centroids[speaker] + signature
+        mappings.append(mapping)
+    return mappings
+
+
+def stitch(windows, window_turns, mappings):
+    """
+    Join the windows' turns under file-wide labels
+
+    Each window keeps the part of the timeline up to the middle of its
+    overlaps; a speaker's turns that meet at a seam are merged, and speakers
+    are numbered SPEAKER_00, SPEAKER_01... in order of first appearance.
+    """
+    turns = []
+    for w, ((start, end), local_turns, mapping) in enumerate(zip(windows, window_turns, mappings)):
+        own_start = start if w == 0 else (start + windows[w - 1][1]) / 2
+        own_end = end if w == len(windows) - 1 else (windows[w + 1][0] + end) / 2
+        for turn_start, turn_end, label in local_turns:
+            turn_start, turn_end = max(turn_start, own_start), min(turn_end, own_end)
+            if turn_end > turn_start:
+                turns.append((turn_start, turn_end, mapping[label]))
+    turns.sort()
+
+    merged = []
+    for start, end, speaker in turns:
+        if merged and merged[-1][2] == speaker and merged[-1][1] >= start - 1e-6:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end), speaker)
+        else:
+            merged.append((start, end, speaker))
+
+    names = {}
+    return [(start, end, names.setdefault(speaker, f"SPEAKER_{len(names):02d}"))
+            for start, end, speaker in merged]
+
+
+def link_results(windows, results):
+    """Put each window's turns in file time and link their labels into file-wide turns"""
+    window_turns = [[(turn_start + start, turn_end + start, label) for turn_start, turn_end, label in turns]
+                    for (start, _), (turns, _) in zip(windows, results)]
+    with span("speaker_linking", windows=len(windows)):
+        mappings = link_windows(windows, window_turns, [signatures for _, signatures in results])
+        return stitch(windows, window_turns, mappings)
+
+
+def diarize_windowed(audio, executor, window_seconds=DIARIZATION_WINDOW_SECONDS,
+                     overlap_seconds=DIARIZATION_OVERLAP_SECONDS):
+    """
+    Diarize an AudioBuffer window by window on ``executor``
+
+    The executor's workers must have been set up by _init_worker, as
+    WindowedDiarizer does.
+    """
+    windows = plan_windows(audio.duration, window_seconds, overlap_seconds)
+    # Workers attach to the decoded samples instead of receiving a pickled copy
+    audio.share()
+    futures = [executor.submit(_diarize_window, audio, start, end) for start, end in windows]
+    return link_results(windows, [future.result() for future in futures])
+
+
+def _file_windows(audio_file, window_seconds, overlap_seconds, stop=None):
+    """Yield window AudioBuffers read from disk; CancelledError once ``stop`` is set"""
+    from chunked import read_windows
+
+    for start, samples, _ in read_windows(audio_file, window_seconds, overlap_seconds):
+        if stop is not None and stop.is_set():
+            raise CancelledError(f"Diarization of '{audio_file}' stopped")
+        yield AudioBuffer(samples, SAMPLE_RATE, audio_file, offset=start)
+
+
+def diarize_file(audio_file, diarize, window_seconds=DIARIZATION_WINDOW_SECONDS,
+                 overlap_seconds=DIARIZATION_OVERLAP_SECONDS, stop=None):
+    """
+    Diarize a file in windows read from disk one at a time, in bounded memory
+
+    ``diarize(audio)`` runs on each window in the calling thread and the
+    windows are linked as in diarize_windowed, so only one window of
+    samples is held at once. A WindowedDiarizer runs the windows on its
+    workers instead, with its own window settings. ``stop`` (a
+    threading.Event) abandons the job between windows with CancelledError.
+    """
+    if isinstance(diarize, WindowedDiarizer):
+        return diarize(audio_file, stop=stop)
+
+    windows = []
+    results = []
+    for window in _file_windows(audio_file, window_seconds, overlap_seconds, stop):
+        windows.append((window.offset, window.offset + window.duration))
+        with span("diarization", window=len(results), audio_seconds=round(window.duration, 3)):
+            results.append(window_result(diarize, window))
+    return link_results(windows, results)
+
+
+class WindowedDiarizer:
+    """
+    diarize(audio) backed by a pool of diarizer processes
+
+    Workers start on first use and each loads its own pipeline through
+    ``loader_spec``, so memory grows with the worker count. Call close(),
+    or use it in a with block, to shut the workers down.
+    """
+
+    def __init__(self, hf_token, workers, loader_spec=DEFAULT_DIARIZER,
+                 window_seconds=DIARIZATION_WINDOW_SECONDS, overlap_seconds=DIARIZATION_OVERLAP_SECONDS):
+        self.workers = workers
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(loader_spec, hf_token)
+        )
+
+    def __call__(self, audio, stop=None):
+        """Diarize an AudioBuffer, or a file path read from disk window by window"""
+        if isinstance(audio, str):
+            return self._diarize_file(audio, stop)
+        return diarize_windowed(audio, self.executor, self.window_seconds, self.overlap_seconds)
+
+    def _diarize_file(self, audio_file, stop=None):
+        windows = []
+        futures = []
+        waited = 0
+        try:
+            for window in _file_windows(audio_file, self.window_seconds, self.overlap_seconds, stop):
+                windows.append((window.offset, window.offset + window.duration))
+                futures.append(self.executor.submit(_diarize_buffer, window))
+                # At most one window per worker is in flight while the next one is read
+                while len(futures) - waited > self.workers:
+                    futures[waited].result()
+                    waited += 1
+            return link_results(windows, [future.result() for future in futures])
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def close(self, wait=True):
+        """Shut the worker processes down, dropping windows that have not started"""
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_windowed_diarizer(hf_token, workers, loader_spec=DEFAULT_DIARIZER,
+                           window_seconds=DIARIZATION_WINDOW_SECONDS,
+                           overlap_seconds=DIARIZATION_OVERLAP_SECONDS):
+    """Return a WindowedDiarizer with ``workers`` diarizer processes; close it when done"""
+    return WindowedDiarizer(hf_token, workers, loader_spec, window_seconds, overlap_seconds)
+
+
+def diarization_id(model, workers, window_seconds=DIARIZATION_WINDOW_SECONDS,
+                   overlap_seconds=DIARIZATION_OVERLAP_SECONDS):
+    """Cache/journal id of the diarization produced with ``workers`` processes"""
+    if workers <= 1:
+        return model
+    return f"{model}:windows={window_seconds:g}/{overlap_seconds:g}"
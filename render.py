@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Re-render a saved result in other formats without running the models
+
+Reads a result written earlier as JSON (or .npz, or JSON-Lines) and writes
+the requested formats next to it, named as the original run would have
+named them: ``meeting_with_speakers.json`` becomes
+``meeting_with_speakers.srt`` and so on.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from segment_table import SegmentTable
+from transcribe_only import transcription_path
+from transcriber import results_path
+from writers import FORMATS, parse_formats, write_results
+
+SUFFIXES = {"_with_speakers": results_path, "_transcription": transcription_path}
+
+
+def load_result(result_file):
+    """Read a result saved as .json, .npz or .jsonl"""
+    if not result_file.endswith((".json", ".npz", ".jsonl")):
+        raise ValueError("expected a .json, .npz or .jsonl file")
+    if result_file.endswith(".npz"):
+        return SegmentTable.load_npz(result_file).to_result()
+    with open(result_file) as f:
+        if result_file.endswith(".jsonl"):
+            segments = [json.loads(line) for line in f if line.strip()]
+            # JSON-Lines only has the segments; the full text is rebuilt from them
+            return {"text": "".join(segment["text"] for segment in segments), "segments": segments,
+                    "language": "unknown"}
+        return json.load(f)
+
+
+def output_namer(result_file, output_dir=None):
+    """Return output_path(fmt) naming files like the run that saved ``result_file``"""
+    stem = os.path.splitext(result_file)[0]
+    if output_dir:
+        stem = os.path.join(output_dir, os.path.basename(stem))
+    for suffix, path_function in SUFFIXES.items():
+        if stem.endswith(suffix):
+            base = stem[:-len(suffix)]
+            return lambda fmt: path_function(base + ".audio", fmt)
+    return lambda fmt: f"{stem}.{fmt}"
+
+
+def render(result_file, formats, output_dir=None, speakers=None):
+    """
+    Write ``formats`` from a saved result and return the files written
+
+    ``speakers`` picks the speaker-labelled layouts; by default it is used
+    when the segments carry speakers. A format that would overwrite the
+    input is skipped.
+    """
+    result = load_result(result_file)
+    if speakers is None:
+        # Tables from .npz files give every segment a "speaker" key, None when it has none
+        speakers = any(segment.get("speaker") is not None for segment in result["segments"])
+    output_path = output_namer(result_file, output_dir)
+    source = os.path.abspath(result_file)
+    formats = [fmt for fmt in formats if os.path.abspath(output_path(fmt)) != source]
+    return write_results(result, formats, output_path, speakers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a saved result in other formats")
+    parser.add_argument("result_file", help="result saved as .json, .npz or .jsonl")
+    parser.add_argument("output_format", type=parse_formats, metavar="FORMATS",
+                        help=f"formats separated by commas, e.g. srt,vtt; one of {', '.join(FORMATS)}")
+    parser.add_argument("--output-dir", help="write here instead of next to the result file")
+    layout = parser.add_mutually_exclusive_group()
+    layout.add_argument("--speakers", dest="speakers", action="store_const", const=True,
+                        help="use the speaker-labelled layouts (default: when segments have speakers)")
+    layout.add_argument("--plain", dest="speakers", action="store_const", const=False,
+                        help="use the plain transcription layouts")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.result_file):
+        print(f"Error: '{args.result_file}' not found")
+        sys.exit(1)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    try:
+        output_files = render(args.result_file, args.output_format, args.output_dir, args.speakers)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: cannot read '{args.result_file}' as a result: {e}")
+        sys.exit(1)
+    for output_file in output_files:
+        print(f"Results saved to: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
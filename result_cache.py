@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of transcription and diarization results
+
+Entries are keyed by the SHA-256 of the audio file contents plus the model
+id and decoding parameters, and the two stages are stored separately so
+either one can be reused on its own. The least recently used entries are
+evicted once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "whisper-speech-to-text"
+)
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def audio_hash(audio_file):
+    """SHA-256 of the file contents, so renamed or copied files still hit"""
+    digest = hashlib.sha256()
+    with open(audio_file, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of JSON-serializable stage results
+
+    With ``refresh`` set, lookups always miss but new results are still
+    stored, replacing the old entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, refresh=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, kind, content_hash, model_id, params):
+        key = json.dumps([kind, content_hash, model_id, params or {}], sort_keys=True)
+        return os.path.join(self.cache_dir, f"{kind}-{hashlib.sha256(key.encode()).hexdigest()}.json")
+
+    def get(self, kind, content_hash, model_id, params=None):
+        """Return the cached value, or None on a miss"""
+        if self.refresh:
+            return None
+        path = self._path(kind, content_hash, model_id, params)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        # Bump the modification time so eviction sees this entry as recently used
+        os.utime(path)
+        return value
+
+    def put(self, kind, content_hash, model_id, value, params=None):
+        """Store a value atomically, then evict old entries if over the limit"""
+        path = self._path(kind, content_hash, model_id, params)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Columnar storage of speaker-labelled transcripts
+
+A result from transcribe_with_speakers is a list of small dicts, which
+costs several hundred bytes per segment in memory and is slow to dump and
+re-parse as indented JSON. SegmentTable keeps the same data as columns:
+float64 start and end times, speaker codes into an interned label list,
+and all segment texts as one UTF-8 buffer with offsets. It saves to and
+loads from a NumPy ``.npz`` file without pickling, and writes JSON-Lines
+directly from the columns.
+"""
+
+import json
+import math
+
+import numpy as np
+
+# Result shape the table stores; other keys are not kept
+FIELDS = ("start", "end", "text", "speaker")
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+class SegmentTable:
+    """
+    Segments as columns, plus the result's full text and language
+
+    ``speaker_codes`` index into ``speakers``; -1 means no speaker.
+    ``text_offsets`` has one more entry than there are segments, and
+    segment i's text is ``text_data[text_offsets[i]:text_offsets[i + 1]]``.
+    """
+
+    def __init__(self, starts, ends, speaker_codes, speakers, text_offsets, text_data,
+                 text="", language="unknown"):
+        self.starts = starts
+        self.ends = ends
+        self.speaker_codes = speaker_codes
+        self.speakers = speakers
+        self.text_offsets = text_offsets
+        self.text_data = text_data
+        self.text = text
+        self.language = language
+
+    @classmethod
+    def from_result(cls, result):
+        """Build a table from a transcribe_with_speakers-shaped result"""
+        segments = result["segments"]
+        labels = {}
+        codes = np.fromiter(
+            (-1 if segment.get("speaker") is None else labels.setdefault(segment["speaker"], len(labels))
+             for segment in segments), dtype=np.int32, count=len(segments))
+        encoded = [segment["text"].encode() for segment in segments]
+        offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return cls(
+            np.fromiter((segment["start"] for segment in segments), dtype=np.float64, count=len(segments)),
+            np.fromiter((segment["end"] for segment in segments), dtype=np.float64, count=len(segments)),
+            codes,
+            list(labels),
+            offsets,
+            np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            result.get("text", ""),
+            result.get("language", "unknown")
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def texts(self):
+        """Decode every segment's text"""
+        data = self.text_data.tobytes()
+        offsets = self.text_offsets.tolist()
+        return [data[a:b].decode() for a, b in zip(offsets, offsets[1:])]
+
+    def speaker_labels(self):
+        """Speaker label (or None) of every segment"""
+        labels = [*self.speakers, None]
+        return [labels[code] for code in self.speaker_codes.tolist()]
+
+    def to_result(self):
+        """Rebuild the list-of-dicts result the table was made from"""
+        return {
+            "text": self.text,
+            "segments": [{
+                "start": start,
+                "end": end,
+                "text": text,
+                "speaker": speaker
+            } for start, end, text, speaker in zip(self.starts.tolist(), self.ends.tolist(),
+                                                   self.texts(), self.speaker_labels())],
+            "language": self.language
+        }
+
+    def jsonl_lines(self):
+        """
+        Yield the JSON-Lines form of each segment
+
+        The same bytes as ``json.dumps(segment) + "\\n"`` for every segment of
+        to_result(), built from the columns without creating the dicts.
+        """
+        labels = [_encode_string(label) for label in self.speakers] + ["null"]
+        for start, end, text, code in zip(self.starts.tolist(), self.ends.tolist(), self.texts(),
+                                          self.speaker_codes.tolist()):
+            yield (f'{{"start": {_number(start)}, "end": {_number(end)}, '
+                   f'"text": {_encode_string(text)}, "speaker": {labels[code]}}}\n')
+
+    def save_npz(self, file, compressed=False):
+        """Write the table to an .npz file (a path or a binary file object)"""
+        save = np.savez_compressed if compressed else np.savez
+        save(file,
+             start=self.starts,
+             end=self.ends,
+             speaker=self.speaker_codes,
+             speakers=np.array(self.speakers, dtype=str),
+             text_offsets=self.text_offsets,
+             text_data=self.text_data,
+             text=np.frombuffer(self.text.encode(), dtype=np.uint8),
+             language=np.array(self.language))
+
+    @classmethod
+    def load_npz(cls, file):
+        """Read a table written by save_npz"""
+        with np.load(file, allow_pickle=False) as data:
+            return cls(data["start"], data["end"], data["speaker"], data["speakers"].tolist(),
+                       data["text_offsets"], data["text_data"], data["text"].tobytes().decode(),
+                       str(data["language"]))
+
+
+def _number(value):
+    # json.dumps writes floats with repr, and non-finite ones as NaN/Infinity
+    if math.isfinite(value):
+        return repr(value)
+    return "NaN" if value != value else ("Infinity" if value > 0 else "-Infinity")
+
+
+def jsonl_line(segment):
+    """JSON-Lines form of one segment, with a fast path for the table's shape"""
+    speaker = segment.get("speaker")
+    if (tuple(segment) == FIELDS and type(segment["start"]) is float and type(segment["end"]) is float
+            and type(segment["text"]) is str and (speaker is None or type(speaker) is str)):
+        return (f'{{"start": {_number(segment["start"])}, "end": {_number(segment["end"])}, '
+                f'"text": {_encode_string(segment["text"])}, '
+                f'"speaker": {"null" if speaker is None else _encode_string(speaker)}}}\n')
+    return json.dumps(segment) + "\n"
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Local HTTP transcription service with resident models
+
+POST /transcribe with either a JSON body {"audio_file": "/path/to/file"} or
+the raw audio bytes. The reply streams JSON lines as the job progresses:
+{"event": "queued"}, one {"event": "segment", ...} per segment, then
+{"event": "done", "text": ..., "language": ...} or {"event": "error", ...}.
+GET /health reports the queue. Jobs wait in a bounded queue (503 with
+Retry-After when it is full) and at most --max-concurrency of them run at
+once. With --language, short clips that are queued together, from any
+clients, are packed into batches by length and each batch is transcribed
+in one engine call (see batching.py); longer files go through
+the chunked pipeline, so their segments stream out window by window.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from audio_io import load_audio, probe_duration
+from batching import BATCH_CLIP_SECONDS, MAX_BATCH, plan_batches, transcribe_batch
+from chunked import transcribe_with_speakers_chunked
+from worker import DEFAULT_LOADER, resolve_loader
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# How long a short clip waits for company before running on its own
+BATCH_WAIT_SECONDS = 0.05
+
+MAX_QUEUE = 64
+# Uploads are streamed to disk in chunks; JSON bodies only hold a path
+MAX_BODY_BYTES = 1024 ** 3
+MAX_JSON_BYTES = 64 * 1024
+UPLOAD_CHUNK_BYTES = 1024 ** 2
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class Job:
+    """One queued request; its events are read by the connection that sent it"""
+
+    def __init__(self, audio_file, duration, upload_dir=None):
+        self.audio_file = audio_file
+        self.duration = duration
+        self.upload_dir = upload_dir
+        self.events = asyncio.Queue()
+        self.queued_at = time.perf_counter()
+
+    @property
+    def short(self):
+        return self.duration is not None and self.duration <= BATCH_CLIP_SECONDS
+
+
+class TranscriptionService:
+    """
+    Job queue, batching dispatcher and engine threads around one set of models
+    """
+
+    def __init__(self, models, hf_token=None, max_concurrency=1, max_queue=MAX_QUEUE,
+                 max_batch=MAX_BATCH, batch_wait=BATCH_WAIT_SECONDS, language=None):
+        self.models = models
+        self.hf_token = hf_token
+        self.max_concurrency = max_concurrency
+        self.language = language
+        # Clips batched together share one language detection, so they are
+        # only batched when the language is known
+        self.max_batch = max_batch if language else 1
+        self.batch_wait = batch_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.running = 0
+        self.completed = 0
+        self.batches = 0
+        self._tasks = set()
+        self.loop = None
+
+    def submit(self, job):
+        """Queue a job; raises asyncio.QueueFull when the service is saturated"""
+        self.queue.put_nowait(job)
+
+    async def dispatch(self):
+        """Take jobs off the queue as engine slots free up, batching short clips"""
+        self.loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            # Waiting for a slot first keeps jobs in the bounded queue while all slots are busy
+            await self.slots.acquire()
+            job = carry or await self.queue.get()
+            carry = None
+            batch = [job]
+            if job.short:
+                deadline = self.loop.time() + self.batch_wait
+                while len(batch) < self.max_batch:
+                    try:
+                        if self.queue.empty():
+                            following = await asyncio.wait_for(self.queue.get(),
+                                                               deadline - self.loop.time())
+                        else:
+                            following = self.queue.get_nowait()
+                    except asyncio.TimeoutError:
+                        break
+                    if not following.short:
+                        carry = following
+                        break
+                    batch.append(following)
+
+            # The clips gathered are packed by length, like any other batch of clips
+            if job.short:
+                groups = plan_batches([(queued, queued.duration) for queued in batch], self.max_batch)
+            else:
+                groups = [batch]
+            for i, group in enumerate(groups):
+                if i:
+                    await self.slots.acquire()
+                task = self.loop.create_task(self._run(group))
+                self._tasks.add(task)
+                task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._tasks.discard(task)
+        self.slots.release()
+
+    def _emit(self, job, event):
+        """Hand an event from an engine thread to the job's connection"""
+        self.loop.call_soon_threadsafe(job.events.put_nowait, event)
+
+    async def _run(self, batch):
+        self.running += len(batch)
+        try:
+            if batch[0].short:
+                self.batches += 1
+                await self.loop.run_in_executor(self.executor, self._run_batch, batch)
+            else:
+                await self.loop.run_in_executor(self.executor, self._run_long, batch[0])
+        finally:
+            self.running -= len(batch)
+            self.completed += len(batch)
+            for job in batch:
+                if job.upload_dir:
+                    shutil.rmtree(job.upload_dir, ignore_errors=True)
+
+    def _run_batch(self, batch):
+        """Engine thread: decode each clip, then transcribe the good ones together"""
+        jobs, buffers = [], []
+        for job in batch:
+            try:
+                buffers.append(load_audio(job.audio_file))
+                jobs.append(job)
+            except Exception as e:
+                self._emit(job, {"event": "error", "error": f"{type(e).__name__}: {e}"})
+        try:
+            results = transcribe_batch(buffers, self.models.transcribe, self.models.diarize,
+                                       language=self.language)
+        except Exception as e:
+            for job in jobs:
+                self._emit(job, {"event": "error", "error": f"{type(e).__name__}: {e}"})
+            return
+        for job, result in zip(jobs, results):
+            for segment in result["segments"]:
+                self._emit(job, {"event": "segment", **segment})
+            self._emit(job, {"event": "done", "text": result["text"], "language": result["language"],
+                             "batch_size": len(jobs)})
+
+    def _run_long(self, job):
+        """Engine thread: run one file through the chunked pipeline, streaming its segments"""
+        try:
+            result = transcribe_with_speakers_chunked(
+                job.audio_file, self.hf_token, self.models,
+                on_segment=lambda segment: self._emit(job, {"event": "segment", **segment}))
+        except Exception as e:
+            self._emit(job, {"event": "error", "error": f"{type(e).__name__}: {e}"})
+        else:
+            self._emit(job, {"event": "done", "text": result["text"], "language": result["language"],
+                             "batch_size": 1})
+
+    def health(self):
+        return {"ok": True, "queued": self.queue.qsize(), "running": self.running,
+                "completed": self.completed, "batches": self.batches,
+                "max_concurrency": self.max_concurrency, "max_queue": self.queue.maxsize}
+
+
+async def _read_request(reader):
+    """Parse the request line and headers of one HTTP/1.1 request into (method, path, headers)"""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None
+    parts = request_line.split(" ")
+    if len(parts) != 3:
+        raise ValueError(f"Malformed request line: {request_line!r}")
+    method, path, _ = parts
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return method, urlsplit(path).path, headers
+
+
+async def _send_json(writer, status, body, extra_headers=()):
+    data = json.dumps(body).encode()
+    head = [f"HTTP/1.1 {status} {REASONS[status]}", "Content-Type: application/json",
+            f"Content-Length: {len(data)}", "Connection: close", *extra_headers]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+    await writer.drain()
+
+
+async def _stream_events(writer, job):
+    """Send the job's events as chunked JSON lines until it is done"""
+    head = ["HTTP/1.1 200 OK", "Content-Type: application/x-ndjson",
+            "Transfer-Encoding: chunked", "Connection: close"]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+    event = {"event": "queued", "audio_seconds": job.duration}
+    while True:
+        line = (json.dumps(event) + "\n").encode()
+        writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        await writer.drain()
+        if event["event"] in ("done", "error"):
+            break
+        event = await job.events.get()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def _save_upload(reader, length, audio_file):
+    """Copy ``length`` body bytes to ``audio_file`` a chunk at a time"""
+    with open(audio_file, "wb") as f:
+        while length:
+            chunk = await reader.readexactly(min(length, UPLOAD_CHUNK_BYTES))
+            f.write(chunk)
+            length -= len(chunk)
+
+
+async def _new_job(reader, headers):
+    """Build a Job from a JSON path or an uploaded body; returns (job, error)"""
+    if "content-length" not in headers:
+        return None, (411, "Content-Length is required")
+    length = int(headers["content-length"])
+    if length < 0:
+        raise ValueError(f"Invalid Content-Length: {length}")
+
+    if headers.get("content-type", "").startswith("application/json"):
+        if length > MAX_JSON_BYTES:
+            return None, (413, f"JSON bodies are limited to {MAX_JSON_BYTES} bytes")
+        body = await reader.readexactly(length)
+        try:
+            audio_file = json.loads(body)["audio_file"]
+        except (ValueError, KeyError, TypeError):
+            audio_file = None
+        if not isinstance(audio_file, str):
+            return None, (400, 'Expected a JSON body like {"audio_file": "/path/to/audio"}')
+        if not os.path.exists(audio_file):
+            return None, (400, f"Audio file '{audio_file}' not found")
+        # Only regular files: not directories, devices or pipes
+        if not os.path.isfile(audio_file):
+            return None, (400, f"'{audio_file}' is not a regular file")
+        return Job(audio_file, probe_duration(audio_file)), None
+
+    if length > MAX_BODY_BYTES:
+        return None, (413, f"Uploads are limited to {MAX_BODY_BYTES} bytes")
+    # Raw audio: keep it in a private directory until the job is finished
+    upload_dir = tempfile.mkdtemp(prefix="transcribe-")
+    audio_file = os.path.join(upload_dir, "upload")
+    try:
+        await _save_upload(reader, length, audio_file)
+    except BaseException:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise
+    return Job(audio_file, probe_duration(audio_file), upload_dir), None
+
+
+def make_handler(service):
+    async def handle(reader, writer):
+        try:
+            request = await _read_request(reader)
+            if request is None:
+                return
+            method, path, headers = request
+            if path == "/health":
+                await _send_json(writer, 200, service.health())
+            elif path != "/transcribe":
+                await _send_json(writer, 404, {"error": f"No such endpoint: {path}"})
+            elif method != "POST":
+                await _send_json(writer, 405, {"error": "Use POST"})
+            else:
+                job, error = await _new_job(reader, headers)
+                if error:
+                    await _send_json(writer, error[0], {"error": error[1]})
+                    return
+                try:
+                    service.submit(job)
+                except asyncio.QueueFull:
+                    if job.upload_dir:
+                        shutil.rmtree(job.upload_dir, ignore_errors=True)
+                    await _send_json(writer, 503, {"error": "Too many queued jobs, retry later"},
+                                     ["Retry-After: 1"])
+                    return
+                await _stream_events(writer, job)
+        except ValueError as e:
+            await _send_json(writer, 400, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(models, hf_token=None, host=DEFAULT_HOST, port=DEFAULT_PORT, max_concurrency=1,
+                max_queue=MAX_QUEUE, ready=None, language=None):
+    """Run the service until cancelled; ``ready`` (an asyncio.Event) is set once listening"""
+    service = TranscriptionService(models, hf_token, max_concurrency, max_queue, language=language)
+    server = await asyncio.start_server(make_handler(service), host, port)
+    dispatcher = asyncio.get_running_loop().create_task(service.dispatch())
+    print(f"Listening on http://{host}:{server.sockets[0].getsockname()[1]}", file=sys.stderr)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        dispatcher.cancel()
+        service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_transcription(url, audio_file, upload=False):
+    """
+    Client side: send one job and yield its events as they arrive
+
+    By default only the path is sent, which works when the service runs on
+    the same machine; ``upload`` sends the file contents instead.
+    """
+    parts = urlsplit(url)
+    conn = HTTPConnection(parts.hostname, parts.port or 80)
+    try:
+        if upload:
+            # Sent from the open file in blocks, never held whole in memory
+            with open(audio_file, "rb") as f:
+                conn.request("POST", "/transcribe", f, {"Content-Type": "application/octet-stream",
+                                                        "Content-Length": str(os.fstat(f.fileno()).st_size)})
+        else:
+            body = json.dumps({"audio_file": os.path.abspath(audio_file)})
+            conn.request("POST", "/transcribe", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"Service returned {response.status}: {response.read().decode()}")
+        for line in response:
+            yield json.loads(line)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve transcription with speaker labels over local HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"),
+                        help="HuggingFace token (default: $HF_TOKEN)")
+    parser.add_argument("--loader", default=DEFAULT_LOADER,
+                        help="model loader as module:function, e.g. stub_engines:load_stub_models")
+    parser.add_argument("--max-concurrency", type=int, default=1,
+                        help="jobs or batches running on the engines at once (default: 1)")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE,
+                        help=f"queued jobs before new ones get 503 (default: {MAX_QUEUE})")
+    parser.add_argument("--language",
+                        help="language of every clip, e.g. en; short clips are only batched "
+                             "together when it is given")
+    args = parser.parse_args()
+
+    # Stage progress goes to stderr, set once for all engine threads
+    with redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        models = resolve_loader(args.loader)(args.hf_token)
+        print(f"Models loaded in {time.perf_counter() - start:.2f}s")
+        try:
+            asyncio.run(serve(models, args.hf_token, args.host, args.port, args.max_concurrency,
+                              args.max_queue, language=args.language))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -4,162 +4,143 @@ Combine MLX Whisper transcription with pyannote speaker diarization
 Fixed version with proper audio preprocessing
 """
 
-import mlx_whisper
-from pyannote.audio import Pipeline
-import json
-import sys
+import argparse
 import os
-import torchaudio
-import torch
 
-def transcribe_with_speakers(audio_file, hf_token):
-    """
-    Transcribe audio with speaker diarization
-    """
-    print("Step 1: Transcribing with MLX Whisper...")
-    # Transcribe with MLX Whisper
-    result = mlx_whisper.transcribe(audio_file)
-    
-    print("Step 2: Performing speaker diarization...")
-    # Load diarization pipeline
-    pipeline = Pipeline.from_pretrained(
-        "pyannote/speaker-diarization-3.1",
-        use_auth_token=hf_token
-    )
-    
-    # Perform diarization
-    try:
-        diarization = pipeline(audio_file)
-    except Exception as e:
-        print(f"Diarization failed with direct file: {e}")
-        print("Trying with audio preprocessing...")
-        
-        # Load and preprocess audio for pyannote
-        waveform, sample_rate = torchaudio.load(audio_file)
-        
-        # Ensure mono audio
-        if waveform.shape[0] > 1:
-            waveform = torch.mean(waveform, dim=0, keepdim=True)
-        
-        # Resample to 16kHz if needed (pyannote expects 16kHz)
-        if sample_rate != 16000:
-            resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-            waveform = resampler(waveform)
-            sample_rate = 16000
-        
-        # Create temporary audio dict for pyannote
-        audio_dict = {
-            "waveform": waveform,
-            "sample_rate": sample_rate
-        }
-        
-        diarization = pipeline(audio_dict)
-    
-    print("Step 3: Combining results...")
-    # Combine transcription with speaker labels
-    segments_with_speakers = []
-    
-    for segment in result["segments"]:
-        start_time = segment["start"]
-        end_time = segment["end"]
-        text = segment["text"]
-        
-        # Find the dominant speaker for this segment
-        speaker_time = {}
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            # Check overlap with current segment
-            overlap_start = max(start_time, turn.start)
-            overlap_end = min(end_time, turn.end)
-            
-            if overlap_start < overlap_end:
-                overlap_duration = overlap_end - overlap_start
-                if speaker in speaker_time:
-                    speaker_time[speaker] += overlap_duration
-                else:
-                    speaker_time[speaker] = overlap_duration
-        
-        # Assign dominant speaker
-        if speaker_time:
-            dominant_speaker = max(speaker_time, key=speaker_time.get)
-        else:
-            dominant_speaker = "SPEAKER_UNKNOWN"
-        
-        segments_with_speakers.append({
-            "start": start_time,
-            "end": end_time,
-            "text": text,
-            "speaker": dominant_speaker
-        })
-    
-    return {
-        "text": result["text"],
-        "segments": segments_with_speakers,
-        "language": result.get("language", "unknown")
-    }
+import instrumentation
+from channels import transcribe_channels
+from chunked import OVERLAP_SECONDS, WINDOW_SECONDS, transcribe_with_speakers_chunked
+from engines import ENGINE_CHOICES, model_id
+from journal import open_journal
+from parallel_diarization import diarization_id
+from result_cache import DEFAULT_CACHE_DIR, ResultCache
+from transcriber import CONCURRENCY_MODES, DIARIZATION_MODEL, results_path, save_results, transcribe_with_speakers
+from vad import VAD_MODES
+from writers import FORMATS, open_streaming, parse_formats
+from worker import request_transcription
 
-def format_time_srt(seconds):
-    """Convert seconds to SRT time format"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds % 1) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
-
-def save_results(result, audio_file, output_format="txt"):
-    """Save transcription results in various formats"""
-    base_name = os.path.splitext(audio_file)[0]
-    
-    if output_format == "txt":
-        output_file = f"{base_name}_with_speakers.txt"
-        with open(output_file, 'w') as f:
-            f.write("=== TRANSCRIPTION WITH SPEAKERS ===\n\n")
-            current_speaker = None
-            for segment in result["segments"]:
-                if segment["speaker"] != current_speaker:
-                    current_speaker = segment["speaker"]
-                    f.write(f"\n{current_speaker}:\n")
-                f.write(f"{segment['text'].strip()}\n")
-            
-            f.write(f"\n\n=== FULL TEXT ===\n\n")
-            f.write(result["text"])
-            
-    elif output_format == "srt":
-        output_file = f"{base_name}_with_speakers.srt"
-        with open(output_file, 'w') as f:
-            for i, segment in enumerate(result["segments"], 1):
-                start_time = format_time_srt(segment["start"])
-                end_time = format_time_srt(segment["end"])
-                text = f"{segment['speaker']}: {segment['text'].strip()}"
-                f.write(f"{i}\n{start_time} --> {end_time}\n{text}\n\n")
-                
-    elif output_format == "json":
-        output_file = f"{base_name}_with_speakers.json"
-        with open(output_file, 'w') as f:
-            json.dump(result, f, indent=2)
-    
-    print(f"Results saved to: {output_file}")
-    return output_file
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Transcribe audio with Whisper and label speakers with pyannote"
+    )
+    parser.add_argument("audio_file", help="audio file to transcribe")
+    parser.add_argument("hf_token", help="HuggingFace token with access to the pyannote models")
+    parser.add_argument("output_format", nargs="?", default=["txt"], type=parse_formats, metavar="FORMATS",
+                        help="output format, or several separated by commas and written from the "
+                             f"one run, e.g. txt,srt,vtt; one of {', '.join(FORMATS)} (default: txt)")
+    parser.add_argument("--engine", default="auto", choices=ENGINE_CHOICES,
+                        help="transcription engine (default: auto, MLX on Apple Silicon, "
+                             "otherwise the first installed CPU engine)")
+    parser.add_argument("--concurrency", default="sequential", choices=CONCURRENCY_MODES,
+                        help="run transcription and diarization one after the other (default), "
+                             "or in parallel threads or processes")
+    parser.add_argument("--diarize-workers", type=int, default=1, metavar="N",
+                        help="diarize overlapping windows of the audio on N processes and link "
+                             "their speakers (default: 1, a single diarization call)")
+    parser.add_argument("--vad", default="off", choices=VAD_MODES,
+                        help="skip non-speech before transcribing: by frame energy, or by the "
+                             "diarization's speech turns (default: off)")
+    parser.add_argument("--loop-guard", action="store_true",
+                        help="stop decoding when Whisper loops on one phrase and re-decode just "
+                             "that stretch")
+    parser.add_argument("--channels", action="store_true",
+                        help="transcribe each channel on its own and label segments by channel instead "
+                             "of diarizing, for recordings with one speaker per channel")
+    parser.add_argument("--channel-labels", metavar="NAMES",
+                        help="comma-separated names for the channels with --channels, e.g. agent,customer "
+                             "(default: CHANNEL_00, CHANNEL_01...)")
+    parser.add_argument("--worker", metavar="SOCKET",
+                        help="send the job to a resident worker.py listening on this socket")
+    parser.add_argument("--chunked", action="store_true",
+                        help="transcribe in overlapping windows with bounded memory, for long recordings")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS,
+                        help=f"window length in seconds for --chunked (default: {WINDOW_SECONDS:.0f})")
+    parser.add_argument("--trace-json", metavar="PATH",
+                        help="record per-stage timings and write them as JSON")
+    parser.add_argument("--chrome-trace", metavar="PATH",
+                        help="record per-stage timings as a Chrome trace-event file")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write the result cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore cached results but store the new ones")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"result cache and job journal location (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="don't checkpoint progress, so an interrupted run starts over")
+    args = parser.parse_args()
+    if args.chunked and args.vad == "diarization":
+        parser.error("--vad diarization needs the whole-file path; use --vad energy with --chunked")
+    if args.channels and (args.chunked or args.worker or args.vad == "diarization"):
+        parser.error("--channels cannot be combined with --chunked, --worker or --vad diarization")
+    if args.channel_labels and not args.channels:
+        parser.error("--channel-labels needs --channels")
+    return args
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python script.py <audio_file> <hf_token> [output_format]")
-        print("Output formats: txt, srt, json")
-        return
-    
-    audio_file = sys.argv[1]
-    hf_token = sys.argv[2]
-    output_format = sys.argv[3] if len(sys.argv) > 3 else "txt"
-    
+    args = parse_args()
+    audio_file = args.audio_file
+    hf_token = args.hf_token
+    output_format = args.output_format
+
     print(f"HF_TOKEN:{hf_token}")
-    
+
     if not os.path.exists(audio_file):
         print(f"Error: Audio file '{audio_file}' not found")
         return
-    
+
+    tracer = instrumentation.enable() if args.trace_json or args.chrome_trace else None
+
+    journal = None
     try:
-        result = transcribe_with_speakers(audio_file, hf_token)
-        output_file = save_results(result, audio_file, output_format)
-        
+        if not args.worker and not args.channels and not args.no_journal:
+            # Re-running the same command after a crash resumes from the last finished unit
+            params = {"engine": model_id(args.engine),
+                      "diarization": diarization_id(DIARIZATION_MODEL, args.diarize_workers),
+                      "chunked": args.chunked}
+            if args.chunked:
+                params.update(window=args.window, overlap=OVERLAP_SECONDS)
+            if args.vad != "off":
+                params["vad"] = args.vad
+            if args.loop_guard:
+                params["loop_guard"] = True
+            journal = open_journal(audio_file, params, os.path.join(args.cache_dir, "jobs"))
+
+        if args.worker:
+            result = request_transcription(args.worker, audio_file)
+            save_results(result, audio_file, output_format)
+        elif args.channels:
+            cache = None if args.no_cache else ResultCache(args.cache_dir, refresh=args.refresh)
+            labels = args.channel_labels.split(",") if args.channel_labels else None
+            # Channels always run in parallel: in processes with --concurrency process, else threads
+            result = transcribe_channels(audio_file, "process" if args.concurrency == "process" else "thread",
+                                         cache=cache, engine=args.engine, labels=labels, vad=args.vad,
+                                         loop_guard=args.loop_guard)
+            save_results(result, audio_file, output_format)
+        elif args.chunked:
+            # Write each segment as soon as it is final, so long jobs can be tailed
+            output = open_streaming(output_format, lambda fmt: results_path(audio_file, fmt))
+            try:
+                result = transcribe_with_speakers_chunked(audio_file, hf_token, window_seconds=args.window,
+                                                          on_segment=output.write_segment,
+                                                          engine=args.engine, journal=journal,
+                                                          diarize_workers=args.diarize_workers,
+                                                          vad=args.vad, loop_guard=args.loop_guard)
+            except BaseException:
+                output.abort()
+                raise
+            for output_file in output.close(result):
+                print(f"Results saved to: {output_file}")
+        else:
+            cache = None if args.no_cache else ResultCache(args.cache_dir, refresh=args.refresh)
+            result = transcribe_with_speakers(audio_file, hf_token, args.concurrency, cache=cache,
+                                              engine=args.engine, journal=journal,
+                                              diarize_workers=args.diarize_workers, vad=args.vad,
+                                              loop_guard=args.loop_guard)
+            save_results(result, audio_file, output_format)
+        if journal is not None:
+            # Everything is written out, so there is nothing left to resume
+            journal.discard()
+
         print("\n=== TRANSCRIPTION WITH SPEAKERS ===")
         current_speaker = None
         for segment in result["segments"]:
@@ -167,11 +148,18 @@ def main():
                 current_speaker = segment["speaker"]
                 print(f"\n{current_speaker}:")
             print(f"{segment['text'].strip()}")
-            
+
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
 
+    if tracer is not None:
+        print(f"\n=== STAGE TIMINGS ===\n{tracer.summary()}")
+        if args.trace_json:
+            print(f"Trace saved to: {tracer.write_json(args.trace_json)}")
+        if args.chrome_trace:
+            print(f"Chrome trace saved to: {tracer.write_chrome_trace(args.chrome_trace)}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
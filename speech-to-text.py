@@ -3,16 +3,20 @@
 Combine MLX Whisper transcription with pyannote speaker diarization
 """
 
-import mlx_whisper
-from pyannote.audio import Pipeline
 import json
 import sys
 import os
 
+from alignment import assign_speakers
+
 def transcribe_with_speakers(audio_file, hf_token):
     """
     Transcribe audio with speaker diarization
     """
+    # Imported here so the usage message and argument checks don't wait for MLX and torch
+    import mlx_whisper
+    from pyannote.audio import Pipeline
+    
     print("Step 1: Transcribing with MLX Whisper...")
     # Transcribe with MLX Whisper - correct API (Method 1 works!)
     result = mlx_whisper.transcribe(audio_file)
@@ -29,38 +33,15 @@ def transcribe_with_speakers(audio_file, hf_token):
     
     print("Step 3: Combining results...")
     # Combine transcription with speaker labels
+    speakers = assign_speakers(result["segments"], diarization, unknown="UNKNOWN")
     segments_with_speakers = []
     
-    for segment in result["segments"]:
-        start_time = segment["start"]
-        end_time = segment["end"]
-        text = segment["text"]
-        
-        # Find the dominant speaker for this segment
-        speaker_time = {}
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            # Check overlap with current segment
-            overlap_start = max(start_time, turn.start)
-            overlap_end = min(end_time, turn.end)
-            
-            if overlap_start < overlap_end:
-                overlap_duration = overlap_end - overlap_start
-                if speaker in speaker_time:
-                    speaker_time[speaker] += overlap_duration
-                else:
-                    speaker_time[speaker] = overlap_duration
-        
-        # Assign speaker with most time in this segment
-        if speaker_time:
-            dominant_speaker = max(speaker_time, key=speaker_time.get)
-        else:
-            dominant_speaker = "UNKNOWN"
-        
+    for segment, speaker in zip(result["segments"], speakers):
         segments_with_speakers.append({
-            "start": start_time,
-            "end": end_time,
-            "speaker": dominant_speaker,
-            "text": text.strip()
+            "start": segment["start"],
+            "end": segment["end"],
+            "speaker": speaker,
+            "text": segment["text"].strip()
         })
     
     return segments_with_speakers
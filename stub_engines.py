@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-ins for the Whisper and pyannote engines
+
+They produce fixed-rhythm words and alternating speaker turns from the
+audio timing alone, so the pipeline can run on a CPU-only machine with
+no network and no model weights. Importing this module also registers
+stub_transcribe as the "stub" engine in engines.py, for the benchmarks;
+the command-line scripts do not offer it.
+"""
+
+import math
+import os
+import time
+
+import numpy as np
+
+from audio_io import load_audio, probe_duration
+from engines import register_engine
+from transcriber import Models
+
+WORD_SECONDS = 0.5
+SEGMENT_SECONDS = 3.0
+TURN_SECONDS = 5.0
+SPEAKERS = 2
+
+# pitch_diarize: analysis frame, loudness of a voiced frame, and pitch spread of one voice
+PITCH_FRAME = 1024
+VOICED_RMS = 0.02
+PITCH_TOLERANCE_HZ = 20.0
+# voiced_transcribe: time resolution, and the longest dip bridged inside one word
+VOICED_STEP = 0.01
+VOICED_GAP_STEPS = 5
+# looping_transcribe: silence that sends the decode into a loop, the audio the loop
+# then covers, and how often it repeats itself
+LOOP_SILENCE_SECONDS = 4.0
+LOOP_SECONDS = 60.0
+LOOP_SEGMENT_SECONDS = 0.5
+
+
+def _duration(audio):
+    """Duration of an AudioBuffer or of an audio file path"""
+    return probe_duration(audio) if isinstance(audio, str) else audio.duration
+
+
+def stub_transcribe(audio, word_timestamps=False, **options):
+    """
+    Return a Whisper-shaped result with one word every WORD_SECONDS
+
+    Words are numbered by their position in the source file (using the
+    buffer's offset), so overlapping windows of one file agree on them the
+    way a real engine would. They are grouped into SEGMENT_SECONDS segments.
+    """
+    first = math.ceil(round(audio.offset / WORD_SECONDS, 6))
+    words = []
+    index = first
+    while True:
+        start = index * WORD_SECONDS - audio.offset
+        if start >= audio.duration:
+            break
+        end = min(start + WORD_SECONDS, audio.duration)
+        words.append({"word": f" w{index}", "start": start, "end": end})
+        index += 1
+
+    segments = []
+    for word in words:
+        group = int(word["start"] // SEGMENT_SECONDS)
+        if not segments or segments[-1][0] != group:
+            segments.append((group, []))
+        segments[-1][1].append(word)
+
+    results = []
+    for i, (_, group_words) in enumerate(segments):
+        segment = {
+            "id": i,
+            "start": group_words[0]["start"],
+            "end": group_words[-1]["end"],
+            "text": "".join(word["word"] for word in group_words)
+        }
+        if word_timestamps:
+            segment["words"] = group_words
+        results.append(segment)
+    return {
+        "text": "".join(segment["text"] for segment in results),
+        "segments": results,
+        "language": "en"
+    }
+
+
+def voiced_transcribe(audio, word_timestamps=False, **options):
+    """
+    Return one word per run of voiced audio, timed to VOICED_STEP
+
+    Unlike stub_transcribe the words follow the audio, so silence yields
+    nothing and skipping it (VAD) or splitting channels changes the output
+    the way it would with Whisper.
+    """
+    segments = []
+    for start, end in _voiced_runs(audio):
+        word = {"word": " speech", "start": start, "end": end}
+        segment = {"id": len(segments), "start": start, "end": end, "text": word["word"]}
+        if word_timestamps:
+            segment["words"] = [word]
+        segments.append(segment)
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": "en"}
+
+
+def _voiced_runs(audio):
+    """(start, end) seconds of each run of voiced audio, to VOICED_STEP"""
+    if isinstance(audio, str):
+        audio = load_audio(audio)
+    frame = int(VOICED_STEP * audio.sample_rate)
+    count = len(audio.samples) // frame
+    frames = audio.samples[:count * frame].reshape(count, frame)
+    voiced = np.sqrt(np.mean(np.square(frames), axis=1)) > VOICED_RMS
+    # Bridge the dips of the syllable modulation so one turn is one word
+    runs = []
+    for index in np.flatnonzero(voiced).tolist():
+        if runs and index - runs[-1][1] <= VOICED_GAP_STEPS:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return [(first * VOICED_STEP, last * VOICED_STEP) for first, last in runs]
+
+
+def looping_transcribe(audio, word_timestamps=False, on_segment=None, condition_on_previous_text=True,
+                       segment_cost=0.0, **options):
+    """
+    voiced_transcribe that falls into a repetition loop after long silences
+
+    Words are named by their place in the recording. When decoding is
+    conditioned on the previous text (Whisper's default), a silence of
+    LOOP_SILENCE_SECONDS after some text makes it repeat the last segment
+    every LOOP_SEGMENT_SECONDS for LOOP_SECONDS of audio, speech included.
+    Each segment costs ``segment_cost`` seconds, as decoding is paid per
+    token, and is passed to ``on_segment`` as soon as it is made; a true
+    return stops the decode.
+    """
+    segments = []
+
+    def emit(start, end, text):
+        time.sleep(segment_cost)
+        segment = {"id": len(segments), "start": start, "end": end, "text": text}
+        if word_timestamps:
+            segment["words"] = [{"word": text, "start": start, "end": end}]
+        segments.append(segment)
+        return on_segment is not None and on_segment(segment)
+
+    def run():
+        loop_end = 0.0
+        for start, end in _voiced_runs(audio):
+            if start < loop_end:
+                continue
+            if condition_on_previous_text and segments and start - segments[-1]["end"] >= LOOP_SILENCE_SECONDS:
+                text, t = segments[-1]["text"], segments[-1]["end"]
+                loop_end = min(t + LOOP_SECONDS, audio.duration)
+                while t < loop_end:
+                    if emit(t, min(t + LOOP_SEGMENT_SECONDS, loop_end), text):
+                        return
+                    t += LOOP_SEGMENT_SECONDS
+                if start < loop_end:
+                    continue
+            if emit(start, end, f" w{round((audio.offset + start) / VOICED_STEP)}"):
+                return
+
+    run()
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": "en"}
+
+
+def stub_diarize(audio):
+    """Return speaker turns that alternate every TURN_SECONDS"""
+    duration = _duration(audio)
+    turns = []
+    start = 0.0
+    while start < duration:
+        end = min(start + TURN_SECONDS, duration)
+        turns.append((start, end, f"SPEAKER_{len(turns) % SPEAKERS:02d}"))
+        start = end
+    return turns
+
+
+def pitch_diarize(audio):
+    """
+    Diarize synthetic_audio recordings by the pitch of each voice
+
+    Every synthetic speaker is a tone at its own fundamental, so loud frames
+    are grouped by their strongest 60-400 Hz peak and speakers are numbered
+    in order of first appearance. Unlike stub_diarize the labels depend on
+    the audio, so diarizing a window labels it independently of the rest of
+    the file, the way a real diarizer does.
+    """
+    if isinstance(audio, str):
+        audio = load_audio(audio)
+    rate = audio.sample_rate
+    count = len(audio.samples) // PITCH_FRAME
+    window = np.hanning(PITCH_FRAME).astype(np.float32)
+    freqs = np.fft.rfftfreq(4 * PITCH_FRAME, 1 / rate)
+    band = (freqs >= 60) & (freqs <= 400)
+
+    pitches = np.zeros(count)
+    for first in range(0, count, 4096):
+        frames = audio.samples[first * PITCH_FRAME:min(first + 4096, count) * PITCH_FRAME]
+        frames = frames.reshape(-1, PITCH_FRAME)
+        spectrum = np.abs(np.fft.rfft(frames * window, 4 * PITCH_FRAME, axis=1))[:, band]
+        voiced = np.sqrt(np.mean(frames ** 2, axis=1)) > VOICED_RMS
+        pitches[first:first + len(frames)] = np.where(voiced, freqs[band][spectrum.argmax(axis=1)], 0.0)
+
+    centres = []
+    turns = []
+    for i, pitch in enumerate(pitches):
+        if not pitch:
+            continue
+        speaker = next((s for s, centre in enumerate(centres) if abs(pitch - centre) < PITCH_TOLERANCE_HZ),
+                       None)
+        if speaker is None:
+            speaker = len(centres)
+            centres.append(pitch)
+        start, end = i * PITCH_FRAME / rate, (i + 1) * PITCH_FRAME / rate
+        if turns and turns[-1][2] == speaker and turns[-1][1] == start:
+            turns[-1] = (turns[-1][0], end, speaker)
+        else:
+            turns.append((start, end, speaker))
+
+    # Single stray frames (pitch glides at turn changes) are not speakers
+    names = {}
+    return [(start, end, f"SPEAKER_{names.setdefault(speaker, len(names)):02d}")
+            for start, end, speaker in turns if end - start > 1.5 * PITCH_FRAME / rate]
+
+
+def load_pitch_diarizer(hf_token=None):
+    """Diarizer loader with the same signature as transcriber.load_diarizer"""
+    return pitch_diarize
+
+
+def load_stub_models(hf_token=None):
+    """Model loader with the same signature as transcriber.load_models"""
+    return Models(stub_transcribe, stub_diarize, "stub-whisper", "stub-diarization")
+
+
+def load_voiced_models(hf_token=None):
+    """Audio-driven stand-ins (voiced_transcribe, pitch_diarize) for synthetic_audio recordings"""
+    return Models(voiced_transcribe, pitch_diarize, "voiced-whisper", "pitch-diarization")
+
+
+def crashing_transcribe(audio, **options):
+    """stub_transcribe that kills its whole process on files with 'crash' in the name"""
+    if "crash" in os.path.basename(str(audio.source)):
+        os._exit(1)
+    return stub_transcribe(audio, **options)
+
+
+def load_crashing_models(hf_token=None):
+    """Stub models whose worker process dies on files named like '*crash*', to test recovery"""
+    return Models(crashing_transcribe, stub_diarize, "stub-whisper", "stub-diarization")
+
+
+def load_stub(model):
+    """Engine loader for the "stub" engine; the model is ignored"""
+    return stub_transcribe
+
+
+register_engine("stub", load_stub, None, "stub-whisper", "stub engine")
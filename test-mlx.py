@@ -3,13 +3,14 @@
 Test MLX Whisper API first, then add diarization
 """
 
-import mlx_whisper
 import sys
 
 def test_transcribe(audio_file):
     """
     Test MLX Whisper transcription with different API calls
     """
+    import mlx_whisper
+    
     print("Testing MLX Whisper API...")
     
     try:
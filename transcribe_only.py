@@ -1,45 +1,52 @@
 #!/usr/bin/env python3
 """
-Simple MLX Whisper transcription without speaker diarization
+Simple Whisper transcription without speaker diarization
 """
 
-import mlx_whisper
-import sys
-import json
+import argparse
 import os
 
-def transcribe_audio(audio_file, output_format="txt"):
-    """
-    Transcribe audio with MLX Whisper only
+from audio_io import load_audio, probe_duration
+from batching import MAX_BATCH, plan_batches, transcribe_batch
+from engines import ENGINE_CHOICES, describe
+from loop_guard import with_loop_guard
+from vad import with_vad
+from writers import FORMATS, open_streaming, parse_formats, write_results
+
+def transcribe_audio(audio_file, output_format="txt", chunked=False, engine="auto", vad="off",
+                     loop_guard=False):
     """
-    print(f"Transcribing {audio_file} with MLX Whisper...")
-    
-    # Transcribe with MLX Whisper
-    result = mlx_whisper.transcribe(audio_file)
+    Transcribe audio with a Whisper engine only
     
-    # Generate output filename
-    base_name = os.path.splitext(audio_file)[0]
+    With ``vad="energy"`` silent stretches are skipped before transcribing,
+    and ``loop_guard`` stops and re-decodes repetition loops.
+    """
+    print(f"Transcribing {audio_file} with {describe(engine)}...")
     
-    if output_format == "txt":
-        output_file = f"{base_name}_transcription.txt"
-        with open(output_file, 'w') as f:
-            f.write(result['text'])
-        print(f"\nTranscription saved to: {output_file}")
-        
-    elif output_format == "json":
-        output_file = f"{base_name}_transcription.json"
-        with open(output_file, 'w') as f:
-            json.dump(result, f, indent=2)
-        print(f"\nFull result saved to: {output_file}")
-        
-    elif output_format == "srt":
-        output_file = f"{base_name}_transcription.srt"
-        with open(output_file, 'w') as f:
-            for i, segment in enumerate(result['segments'], 1):
-                start_time = format_time(segment['start'])
-                end_time = format_time(segment['end'])
-                f.write(f"{i}\n{start_time} --> {end_time}\n{segment['text'].strip()}\n\n")
-        print(f"\nSRT file saved to: {output_file}")
+    if chunked:
+        # Overlapping windows keep memory flat on multi-hour recordings, and
+        # each segment is written out as soon as its window is done
+        from chunked import transcribe_chunked
+        output = open_streaming(output_format, lambda fmt: transcription_path(audio_file, fmt),
+                                speakers=False)
+        try:
+            result = transcribe_chunked(audio_file, on_segment=output.write_segment, engine=engine,
+                                        vad=vad, loop_guard=loop_guard)
+        except BaseException:
+            output.abort()
+            raise
+        for output_file in output.close(result):
+            print(f"\nTranscription saved to: {output_file}")
+    else:
+        from transcriber import load_whisper
+        transcribe = load_whisper(engine=engine)
+        if loop_guard:
+            transcribe = with_loop_guard(transcribe)
+        if vad == "energy":
+            transcribe = with_vad(transcribe)
+        audio = load_audio(audio_file)
+        result = transcribe(audio)
+        save_transcription(result, audio_file, output_format)
     
     # Always print the transcription
     print('\n=== TRANSCRIPTION ===')
@@ -47,25 +54,111 @@ def transcribe_audio(audio_file, output_format="txt"):
     
     return result
 
-def format_time(seconds):
-    """Convert seconds to SRT time format"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds % 1) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+def transcribe_many(audio_files, output_format="txt", engine="auto", max_batch=MAX_BATCH, language=None):
+    """
+    Transcribe many files, packing short clips into shared engine calls
+    
+    Clips of up to 30 s are grouped by length and each group is transcribed
+    in one call, with the results split back per file; longer files are
+    transcribed one by one. A call detects one language for all its clips,
+    so packing needs the clips' ``language``. Each file gets its own output
+    as with transcribe_audio. Returns {audio_file: result} for the files
+    that worked.
+    """
+    if language is None and max_batch > 1:
+        raise ValueError("Packing clips into one engine call needs their language")
+    from transcriber import load_whisper
+    transcribe = load_whisper(engine=engine)
+    options = {"language": language} if language else {}
+    
+    results = {}
+    batches = plan_batches([(audio_file, probe_duration(audio_file)) for audio_file in audio_files],
+                           max_batch)
+    print(f"Transcribing {len(audio_files)} file(s) in {len(batches)} engine call(s) "
+          f"with {describe(engine)}...")
+    for batch in batches:
+        files, buffers = [], []
+        for audio_file in batch:
+            try:
+                buffers.append(load_audio(audio_file))
+                files.append(audio_file)
+            except (OSError, ValueError) as e:
+                print(f"Error: skipping '{audio_file}': {e}")
+        if len(buffers) == 1:
+            batch_results = [transcribe(buffers[0], **options)]
+        else:
+            batch_results = transcribe_batch(buffers, transcribe, language=language)
+        for audio_file, result in zip(files, batch_results):
+            save_transcription(result, audio_file, output_format)
+            results[audio_file] = result
+    
+    return results
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python transcribe_only.py <audio_file> [output_format]")
-        print("Output formats: txt (default), srt, json")
-        sys.exit(1)
+def transcription_path(audio_file, output_format="txt"):
+    """Return the file save_transcription writes for this audio file"""
+    base_name = os.path.splitext(audio_file)[0]
+    return f"{base_name}_transcription.{output_format}"
+
+def save_transcription(result, audio_file, output_format="txt"):
+    """
+    Save a Whisper result in one format, or a list of formats in one pass
     
-    audio_file = sys.argv[1]
-    output_format = sys.argv[2] if len(sys.argv) > 2 else "txt"
+    Returns the file written, or the list of files for a list of formats.
+    """
+    formats = [output_format] if isinstance(output_format, str) else output_format
+    output_files = write_results(result, formats, lambda fmt: transcription_path(audio_file, fmt),
+                                 speakers=False)
+    
+    for fmt, output_file in zip(formats, output_files):
+        if fmt == "txt":
+            print(f"\nTranscription saved to: {output_file}")
+        elif fmt == "json":
+            print(f"\nFull result saved to: {output_file}")
+        else:
+            print(f"\n{fmt.upper()} file saved to: {output_file}")
+    
+    return output_files[0] if isinstance(output_format, str) else output_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe audio with Whisper only")
+    parser.add_argument("audio_file", help="audio file to transcribe, or with --batch a directory "
+                                           "or manifest of files")
+    parser.add_argument("output_format", nargs="?", default=["txt"], type=parse_formats,
+                        metavar="FORMATS",
+                        help="output format, or several separated by commas, e.g. txt,srt,vtt; "
+                             f"one of {', '.join(FORMATS)} (default: txt)")
+    parser.add_argument("--chunked", action="store_true",
+                        help="transcribe in overlapping windows with bounded memory")
+    parser.add_argument("--engine", default="auto", choices=ENGINE_CHOICES,
+                        help="transcription engine (default: auto)")
+    parser.add_argument("--vad", default="off", choices=["off", "energy"],
+                        help="skip silent stretches before transcribing (default: off)")
+    parser.add_argument("--loop-guard", action="store_true",
+                        help="stop decoding when Whisper loops on one phrase and re-decode just "
+                             "that stretch")
+    parser.add_argument("--batch", action="store_true",
+                        help="transcribe every file in a directory or manifest, packing short clips "
+                             "into shared engine calls")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                        help=f"clips per engine call with --batch (default: {MAX_BATCH})")
+    parser.add_argument("--language",
+                        help="language of every clip, e.g. en; needed by --batch, since the clips "
+                             "of one engine call share its language detection")
+    args = parser.parse_args()
+    if args.batch and args.loop_guard:
+        parser.error("--loop-guard works on single files; clips in a --batch call are too short to loop")
+    if args.batch and args.max_batch > 1 and not args.language:
+        parser.error("--batch needs --language (or --max-batch 1): the clips of one engine call "
+                     "share its language detection")
     
-    if not os.path.exists(audio_file):
-        print(f"Error: Audio file '{audio_file}' not found")
-        sys.exit(1)
+    if not os.path.exists(args.audio_file):
+        print(f"Error: Audio file '{args.audio_file}' not found")
+        parser.exit(1)
     
-    transcribe_audio(audio_file, output_format)
\ No newline at end of file
+    if args.batch:
+        from batch import find_audio_files
+        transcribe_many(find_audio_files(args.audio_file), args.output_format, args.engine,
+                        args.max_batch, args.language)
+    else:
+        transcribe_audio(args.audio_file, args.output_format, args.chunked, args.engine, args.vad,
+                         args.loop_guard)
\ No newline at end of file
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Transcription and speaker diarization stages shared by the CLI scripts
+
+The two stages are independent until alignment, so they can run one after
+the other or concurrently in a thread or process pool.
+"""
+
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+
+from alignment import assign_speakers, diarization_turns
+from audio_io import load_audio
+from engines import describe, load_engine, model_id
+from instrumentation import span
+from loop_guard import loop_guard_id, with_loop_guard
+from model_store import DIARIZATION_KIND, pipeline_config, resolve_model
+from parallel_diarization import diarization_id
+from result_cache import audio_hash
+from vad import energy_regions, transcribe_regions, turn_regions, vad_id
+from writers import write_results
+
+WHISPER_MODEL = "mlx-community/whisper-tiny"
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+
+# How the transcription and diarization stages are run
+CONCURRENCY_MODES = ("sequential", "thread", "process")
+
+# Loaded engines: transcribe(audio, **options) -> Whisper result and
+# diarize(audio or file path) -> turns, plus the model ids that identify
+# their results in the cache
+Models = namedtuple("Models", ["transcribe", "diarize", "transcribe_id", "diarize_id"],
+                    defaults=(WHISPER_MODEL, DIARIZATION_MODEL))
+
+
+def _pipeline_diarize(pipeline, audio):
+    if isinstance(audio, str):
+        # A file path: pyannote reads it itself
+        diarization = pipeline(audio)
+    else:
+        # The decoded waveform is passed in memory, so pyannote never re-reads the file
+        diarization = pipeline(audio.as_pyannote())
+    # Plain tuples are cheap to send back from a worker process
+    return diarization_turns(diarization)
+
+
+def load_whisper(model_path=None, engine="auto"):
+    """Load a Whisper engine (see engines.py) and return a transcribe(audio) function"""
+    # Engines are imported on load so stub models work without MLX or pyannote
+    transcribe, _ = load_engine(engine, model_path)
+    return transcribe
+
+
+def load_diarizer(hf_token, workers=1):
+    """
+    Load the pyannote pipeline and return a diarize(audio) function
+
+    With more than one worker, long audio is diarized in parallel windows
+    whose speakers are linked afterwards (see parallel_diarization.py); that
+    diarizer has a close() method that shuts its worker processes down. A
+    pipeline in the model store is loaded from there.
+    """
+    if workers > 1:
+        from parallel_diarization import load_windowed_diarizer
+        return load_windowed_diarizer(hf_token, workers)
+
+    from pyannote.audio import Pipeline
+
+    local_path = resolve_model(DIARIZATION_KIND, DIARIZATION_MODEL)
+    with span("load_diarization", model=DIARIZATION_MODEL, source="store" if local_path else "hub"):
+        if local_path:
+            # Stored pipelines load from their config, with no token or hub lookups
+            config = pipeline_config(local_path)
+            try:
+                pipeline = Pipeline.from_pretrained(config)
+            finally:
+                os.remove(config)
+        else:
+            pipeline = Pipeline.from_pretrained(
+                DIARIZATION_MODEL,
+                use_auth_token=hf_token
+            )
+    return partial(_pipeline_diarize, pipeline)
+
+
+def load_models(hf_token, engine="auto", model_path=None):
+    """Load both engines so they can be reused across many files"""
+    transcribe, transcribe_id = load_engine(engine, model_path)
+    return Models(transcribe, load_diarizer(hf_token), transcribe_id)
+
+
+def load_transcription_models(hf_token=None, engine="auto", model_path=None):
+    """Load only the Whisper engine, for transcription-only jobs (``diarize`` is None)"""
+    transcribe, transcribe_id = load_engine(engine, model_path)
+    return Models(transcribe, None, transcribe_id)
+
+
+def run_transcription(audio, models=None, engine="auto", vad="off", turns=None, loop_guard=False):
+    """
+    Step 1: transcribe an AudioBuffer with preloaded models or the given engine
+
+    ``vad`` ("energy" or "diarization", with the diarization ``turns``)
+    transcribes only the speech regions; times stay those of the recording.
+    ``loop_guard`` stops and re-decodes repetition loops (see loop_guard.py).
+    """
+    print(f"Step 1: Transcribing with {'Whisper' if models else describe(engine)}...")
+    transcribe = models.transcribe if models else load_whisper(engine=engine)
+    if loop_guard:
+        transcribe = with_loop_guard(transcribe)
+    with span("transcription", audio_seconds=round(audio.duration, 3)):
+        if vad == "energy":
+            return transcribe_regions(audio, transcribe, energy_regions(audio))
+        if vad == "diarization":
+            return transcribe_regions(audio, transcribe, turn_regions(turns, audio.duration))
+        return transcribe(audio)
+
+
+def run_diarization(audio, hf_token, models=None, diarize_workers=1):
+    """
+    Step 2: diarize an AudioBuffer with pyannote and return (start, end, speaker) turns
+    """
+    print("Step 2: Performing speaker diarization...")
+    diarize = models.diarize if models else load_diarizer(hf_token, diarize_workers)
+    try:
+        with span("diarization", audio_seconds=round(audio.duration, 3)):
+            return diarize(audio)
+    finally:
+        # A windowed diarizer loaded here owns worker processes
+        if not models and hasattr(diarize, "close"):
+            diarize.close()
+
+
+def run_stages(audio, hf_token, concurrency="sequential", models=None,
+               transcribe=True, diarize=True, engine="auto", on_done=None, diarize_workers=1,
+               vad="off", turns=None, loop_guard=False):
+    """
+    Run transcription and diarization on an AudioBuffer, returning (result, turns)
+
+    With ``thread`` or ``process`` concurrency both stages start at once and
+    the first failure is re-raised as soon as it happens. Preloaded ``models``
+    are reused instead of loading the engines; in process mode they have to
+    be picklable, so resident models are best paired with threads. Without
+    them, ``engine`` picks the transcription engine and ``diarize_workers``
+    how many processes diarize windows of the audio. A stage switched off
+    with ``transcribe``/``diarize`` returns None. ``on_done(kind, value)``
+    is called as soon as each stage finishes, e.g. to checkpoint it.
+    ``vad`` and ``loop_guard`` are passed to run_transcription; with
+    ``diarization`` the transcription uses ``turns``, or waits for the
+    diarization stage.
+    """
+    if concurrency not in CONCURRENCY_MODES:
+        raise ValueError(f"Unknown concurrency mode '{concurrency}', "
+                         f"expected one of: {', '.join(CONCURRENCY_MODES)}")
+
+    if vad == "diarization" and transcribe and diarize:
+        # The transcription needs the speech regions, so the stages run in turn
+        _, turns = run_stages(audio, hf_token, concurrency, models, transcribe=False, engine=engine,
+                              on_done=on_done, diarize_workers=diarize_workers)
+        result, _ = run_stages(audio, hf_token, concurrency, models, diarize=False, engine=engine,
+                               on_done=on_done, vad=vad, turns=turns, loop_guard=loop_guard)
+        return result, turns
+
+    stages = []
+    if transcribe:
+        stages.append(("Transcription", run_transcription, (audio, models, engine, vad, turns, loop_guard)))
+    if diarize:
+        stages.append(("Diarization", run_diarization, (audio, hf_token, models, diarize_workers)))
+
+    if concurrency == "sequential" or len(stages) < 2:
+        outputs = []
+        for name, stage, args in stages:
+            outputs.append(stage(*args))
+            if on_done is not None:
+                on_done(name.lower(), outputs[-1])
+        outputs = iter(outputs)
+        return (next(outputs) if transcribe else None), (next(outputs) if diarize else None)
+
+    if concurrency == "thread":
+        executor = ThreadPoolExecutor(max_workers=2)
+    else:
+        # Spawned workers avoid forking a process that already holds torch/MLX threads
+        executor = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+        # Workers attach to the decoded samples instead of receiving a pickled copy
+        audio.share()
+
+    try:
+        futures = {executor.submit(stage, *args): name for name, stage, args in stages}
+        if on_done is not None:
+            for future, name in futures.items():
+                future.add_done_callback(partial(_stage_done, on_done, name.lower()))
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                print(f"{futures[future]} failed, cancelling the other stage")
+                raise future.exception()
+        transcription, diarization = (future.result() for future in futures)
+    finally:
+        # Don't block on a stage that is still running after the other one failed
+        executor.shutdown(wait=False, cancel_futures=True)
+    return transcription, diarization
+
+
+def _stage_done(on_done, kind, future):
+    if not future.cancelled() and future.exception() is None:
+        on_done(kind, future.result())
+
+
+def transcribe_with_speakers(audio_file, hf_token, concurrency="sequential", models=None,
+                             cache=None, engine="auto", journal=None, diarize_workers=1, vad="off",
+                             loop_guard=False):
+    """
+    Transcribe audio with speaker diarization
+
+    With a ResultCache, each stage is looked up by the audio's content hash
+    first and only the missing stages run; the file is not decoded at all
+    when both are cached. With a Journal, each stage is checkpointed as soon
+    as it finishes, and stages checkpointed by an interrupted run are reused.
+    ``diarize_workers`` above 1 diarizes windows of the audio in parallel,
+    ``vad`` skips non-speech before transcribing (see vad.py) and
+    ``loop_guard`` catches repetition loops (see loop_guard.py).
+    """
+    result = turns = None
+    if cache is not None:
+        # Without preloaded models the default engines will run
+        transcribe_id = loop_guard_id(vad_id(models.transcribe_id if models else model_id(engine), vad),
+                                      loop_guard)
+        diarize_id = models.diarize_id if models else diarization_id(DIARIZATION_MODEL, diarize_workers)
+        content_hash = audio_hash(audio_file)
+        result = cache.get("transcription", content_hash, transcribe_id)
+        turns = cache.get("diarization", content_hash, diarize_id)
+        if result is not None:
+            print("Step 1: Using cached transcription")
+        if turns is not None:
+            print("Step 2: Using cached diarization")
+
+    new_result = new_turns = None
+    if journal is not None:
+        if result is None:
+            new_result = journal.load("transcription")
+            if new_result is not None:
+                print("Step 1: Using the journalled transcription")
+        if turns is None:
+            new_turns = journal.load("diarization")
+            if new_turns is not None:
+                print("Step 2: Using the journalled diarization")
+
+    need_result = result is None and new_result is None
+    need_turns = turns is None and new_turns is None
+    if need_result or need_turns:
+        # Decode once up front; a bad file fails here, before any model is loaded
+        audio = load_audio(audio_file)
+        print(audio.report())
+        try:
+            ran_result, ran_turns = run_stages(audio, hf_token, concurrency, models,
+                                               transcribe=need_result, diarize=need_turns,
+                                               engine=engine,
+                                               on_done=journal.save if journal is not None else None,
+                                               diarize_workers=diarize_workers, vad=vad,
+                                               loop_guard=loop_guard,
+                                               turns=turns if new_turns is None else new_turns)
+        finally:
+            audio.close()
+        new_result = new_result if ran_result is None else ran_result
+        new_turns = new_turns if ran_turns is None else ran_turns
+
+    if cache is not None:
+        if new_result is not None:
+            cache.put("transcription", content_hash, transcribe_id, new_result)
+        if new_turns is not None:
+            cache.put("diarization", content_hash, diarize_id, new_turns)
+    result = result if new_result is None else new_result
+    turns = turns if new_turns is None else new_turns
+
+    print("Step 3: Combining results...")
+    # Combine transcription with speaker labels
+    with span("alignment", segments=len(result["segments"]), turns=len(turns)):
+        speakers = assign_speakers(result["segments"], turns)
+    segments_with_speakers = []
+
+    for segment, speaker in zip(result["segments"], speakers):
+        segments_with_speakers.append({
+            "start": segment["start"],
+            "end": segment["end"],
+            "text": segment["text"],
+            "speaker": speaker
+        })
+
+    return {
+        "text": result["text"],
+        "segments": segments_with_speakers,
+        "language": result.get("language", "unknown")
+    }
+
+
+def results_path(audio_file, output_format="txt"):
+    """Return the file save_results writes for this audio file"""
+    base_name = os.path.splitext(audio_file)[0]
+    return f"{base_name}_with_speakers.{output_format}"
+
+
+def save_results(result, audio_file, output_format="txt"):
+    """
+    Save transcription results in one format, or a list of formats
+
+    A list is rendered in a single pass over the segments, and the list of
+    files written is returned.
+    """
+    formats = [output_format] if isinstance(output_format, str) else output_format
+    output_files = write_results(result, formats, lambda fmt: results_path(audio_file, fmt))
+    for output_file in output_files:
+        print(f"Results saved to: {output_file}")
+    return output_files[0] if isinstance(output_format, str) else output_files
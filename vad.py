@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Voice-activity pre-pass: transcribe only the parts of a recording with speech
+
+Speech regions come from frame energy (no model needed) or from the
+diarization turns when diarization has already run. The regions are laid
+end to end with a short silence between them, as batching.py does for
+separate clips, transcribed in one call, and every segment and word is
+shifted back to its place in the original recording. Long silences cost
+nothing and SRT times still match the source.
+
+The energy detector cannot tell speech from music or loud noise; hold
+music is kept, and only true quiet is skipped.
+"""
+
+from functools import partial
+
+import numpy as np
+
+from audio_io import AudioBuffer
+from batching import concatenate, split_segments
+from instrumentation import span
+
+VAD_MODES = ("off", "energy", "diarization")
+
+FRAME_SECONDS = 0.03
+# Speech threshold, as a fraction of the way from the noise floor to the speech level (in dB)
+THRESHOLD = 0.3
+# Pauses shorter than this stay inside a region; shorter bursts are dropped
+MIN_SILENCE_SECONDS = 0.5
+MIN_SPEECH_SECONDS = 0.2
+# Context kept around each region so word onsets and endings are not clipped
+PAD_SECONDS = 0.2
+# Silence laid between regions; shorter than batching's gap since every region
+# already carries PAD_SECONDS of its own audio on each side
+GAP_SECONDS = 0.3
+# Below this saving the recording is transcribed whole
+MIN_SKIPPED = 0.1
+
+
+def energy_regions(audio, frame_seconds=FRAME_SECONDS, threshold=THRESHOLD,
+                   min_silence=MIN_SILENCE_SECONDS, min_speech=MIN_SPEECH_SECONDS, pad=PAD_SECONDS):
+    """Return (start, end) seconds of the loud parts of an AudioBuffer"""
+    active = speech_frames(frame_levels(audio, frame_seconds), threshold)
+    return frame_regions(active, frame_seconds, audio.duration, min_silence, min_speech, pad)
+
+
+def frame_levels(audio, frame_seconds=FRAME_SECONDS):
+    """Level in dB of each whole frame of an AudioBuffer"""
+    frame = max(int(frame_seconds * audio.sample_rate), 1)
+    count = len(audio.samples) // frame
+    frames = audio.samples[:count * frame].reshape(count, frame)
+    return 10 * np.log10(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10)
+
+
+def speech_frames(level, threshold=THRESHOLD):
+    """Mask of the frames above a threshold between the noise floor and the speech level"""
+    if not len(level):
+        return np.zeros(0, dtype=bool)
+    floor, loud = np.percentile(level, [10, 95])
+    if loud - floor < 6:
+        # No contrast: all speech or all silence; the absolute level decides
+        return np.full(len(level), loud > -50)
+    return level > floor + threshold * (loud - floor)
+
+
+def frame_regions(active, frame_seconds, duration, min_silence=MIN_SILENCE_SECONDS,
+                  min_speech=MIN_SPEECH_SECONDS, pad=PAD_SECONDS):
+    """Turn a mask of active frames into merged, padded (start, end) regions"""
+    # Start and end frame of every run of active frames
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+    runs = [(start * frame_seconds, end * frame_seconds)
+            for start, end in zip(edges[::2].tolist(), edges[1::2].tolist())]
+    return merge_regions(runs, duration, min_silence, min_speech, pad)
+
+
+def turn_regions(turns, duration, min_silence=MIN_SILENCE_SECONDS, pad=PAD_SECONDS):
+    """Return speech regions from diarization turns"""
+    return merge_regions(sorted((start, end) for start, end, _ in turns), duration, min_silence, 0.0, pad)
+
+
+def merge_regions(regions, duration, min_silence=MIN_SILENCE_SECONDS, min_speech=MIN_SPEECH_SECONDS,
+                  pad=PAD_SECONDS):
+    """Bridge short pauses, drop short bursts and pad sorted (start, end) regions"""
+    merged = []
+    for start, end in regions:
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    padded = []
+    for start, end in merged:
+        if end - start < min_speech:
+            continue
+        start, end = max(start - pad, 0.0), min(end + pad, duration)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], end)
+        else:
+            padded.append((start, end))
+    return padded
+
+
+def shift_segment(segment, offset):
+    """Move a segment and its words by ``offset`` seconds"""
+    shifted = {**segment, "start": segment["start"] + offset, "end": segment["end"] + offset}
+    if segment.get("words"):
+        shifted["words"] = [{**word, "start": word["start"] + offset, "end": word["end"] + offset}
+                            for word in segment["words"]]
+    return shifted
+
+
+def transcribe_regions(audio, transcribe, regions, **options):
+    """
+    Transcribe only ``regions`` of an AudioBuffer; times are in the original timeline
+
+    Falls back to transcribing the whole buffer when the regions would skip
+    less than MIN_SKIPPED of it.
+    """
+    speech = sum(end - start for start, end in regions)
+    if audio.duration and speech > (1 - MIN_SKIPPED) * audio.duration:
+        return transcribe(audio, **options)
+    if not regions:
+        return {"text": "", "segments": [], "language": "unknown"}
+
+    rate = audio.sample_rate
+    pieces = [AudioBuffer(audio.samples[int(start * rate):int(end * rate)], rate, audio.source,
+                          offset=audio.offset + start)
+              for start, end in regions]
+    combined, spans = concatenate(pieces, GAP_SECONDS, rate)
+    with span("vad_transcription", regions=len(regions), speech_seconds=round(combined.duration, 3)):
+        # Word times let segments that run across a gap be cut where the speech stops
+        result = transcribe(combined, **{**options, "word_timestamps": True})
+
+    per_region, unsplit = split_segments(result["segments"], spans)
+    for region in unsplit:
+        # A segment without word times ran across a gap; this region is decoded alone
+        with span("vad_transcription", regions=1, speech_seconds=round(pieces[region].duration, 3)):
+            per_region[region] = transcribe(pieces[region], **{**options, "word_timestamps": True})["segments"]
+
+    segments = []
+    for (start, _), region_segments in zip(regions, per_region):
+        for segment in region_segments:
+            segment = shift_segment(segment, start)
+            if not options.get("word_timestamps"):
+                segment.pop("words", None)
+            segments.append({**segment, "id": len(segments)})
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": result.get("language", "unknown")
+    }
+
+
+def _vad_transcribe(transcribe, audio, **options):
+    return transcribe_regions(audio, transcribe, energy_regions(audio), **options)
+
+
+def with_vad(transcribe):
+    """Wrap a transcribe(audio, **options) function so it skips non-speech by energy"""
+    return partial(_vad_transcribe, transcribe)
+
+
+def vad_id(model, vad):
+    """Cache/journal id of a transcription made with the given VAD mode"""
+    return model if vad == "off" else f"{model}:vad={vad}"
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Watch-folder daemon: transcribe recordings as they are dropped into a folder
+
+Watches one or more directories (inotify on Linux, polling elsewhere or
+with --poll) with the models loaded once. A new audio file is queued once
+its size and modification time have not changed for --settle seconds, so
+files still being copied are left alone. Queued files run in priority
+order: files from --priority folders first, then shortest first. Each
+recording is moved with its output into the folder's ``done/``
+subfolder, or into ``failed/`` when it cannot be processed, and the
+queue, recent jobs and lag metrics are kept in a JSON status file (and
+served at /metrics with --metrics-port).
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import heapq
+import json
+import os
+import select
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from audio_io import load_audio, probe_duration
+from batch import AUDIO_EXTENSIONS, BYTES_PER_SECOND_ESTIMATE, MODES, TRANSCRIBE_LOADER
+from transcribe_only import save_transcription
+from transcriber import save_results, transcribe_with_speakers
+from worker import DEFAULT_LOADER, resolve_loader
+from writers import FORMATS, parse_formats
+
+DONE_DIR = "done"
+FAILED_DIR = "failed"
+
+# A file must keep the same size and mtime this long before it is queued
+SETTLE_SECONDS = 5.0
+POLL_SECONDS = 2.0
+# Finished jobs kept in the status file
+STATUS_HISTORY = 1000
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Changed paths in the watched directories, from the kernel via ctypes"""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"Cannot watch '{directory}'")
+            self.directories[wd] = directory
+
+    def wait(self, timeout):
+        """
+        Return the paths that changed within ``timeout`` seconds
+
+        None means events were lost and the directories must be rescanned.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name and wd in self.directories:
+                paths.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback for systems without inotify: rescan every ``interval`` seconds"""
+
+    def __init__(self, directories, interval=POLL_SECONDS):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        return None
+
+    def close(self):
+        pass
+
+
+def open_watcher(directories, poll=False):
+    """An InotifyWatcher where the platform has one, else a PollingWatcher"""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directories)
+        except OSError as e:
+            print(f"inotify unavailable ({e}), polling every {POLL_SECONDS:g}s")
+    return PollingWatcher(directories)
+
+
+def list_audio(directory):
+    """Audio files directly inside ``directory``; dot-files are skipped as partial uploads"""
+    return [os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith(AUDIO_EXTENSIONS) and not name.startswith(".")]
+
+
+def move_into(path, directory):
+    """Move a file into ``directory``, adding a number to the name if it is taken"""
+    os.makedirs(directory, exist_ok=True)
+    base, ext = os.path.splitext(os.path.basename(path))
+    target = os.path.join(directory, base + ext)
+    n = 1
+    while os.path.exists(target):
+        target = os.path.join(directory, f"{base}.{n}{ext}")
+        n += 1
+    shutil.move(path, target)
+    return target
+
+
+def write_json_atomic(path, value):
+    """Write JSON to a temporary file and rename it into place"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class WatchDaemon:
+    """
+    Settling, priority queue and processing thread for the watched folders
+
+    The watching thread (run) finds settled files and queues them; one
+    processing thread runs them with the resident models.
+    """
+
+    def __init__(self, directories, models, hf_token=None, output_format=("txt",), mode="speakers",
+                 priority_dirs=(), settle=SETTLE_SECONDS, status_file=None, concurrency="sequential"):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.priority_dirs = {os.path.abspath(directory) for directory in priority_dirs}
+        self.models = models
+        self.hf_token = hf_token
+        self.formats = [output_format] if isinstance(output_format, str) else list(output_format)
+        self.mode = mode
+        self.settle = settle
+        self.status_file = status_file
+        self.concurrency = concurrency
+
+        # path -> (size, mtime_ns, unchanged since) for files still settling
+        self.settling = {}
+        # Paths queued or running, so repeated events do not queue them twice
+        self.known = set()
+        self.queue = []
+        self.sequence = 0
+        self.running = None
+        self.history = []
+        self.processed = 0
+        self.failed = 0
+        self.lags = []
+        self.condition = threading.Condition()
+        self.stopping = False
+
+    def priority(self, path, duration):
+        """Sort key: flagged folders first, then shorter recordings"""
+        return (0 if os.path.dirname(path) in self.priority_dirs else 1, duration)
+
+    def check(self, paths, now):
+        """Update settling state for ``paths`` and queue the files that have settled"""
+        ready = []
+        for path in paths:
+            if path in self.known or not path.lower().endswith(AUDIO_EXTENSIONS) \
+                    or os.path.basename(path).startswith("."):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted or renamed before it settled
+                self.settling.pop(path, None)
+                continue
+            seen = self.settling.get(path)
+            if seen is None or seen[:2] != (stat.st_size, stat.st_mtime_ns):
+                self.settling[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - seen[2] >= self.settle and stat.st_size:
+                del self.settling[path]
+                ready.append(path)
+        if ready:
+            self.enqueue(ready, now)
+
+    def enqueue(self, paths, now):
+        """Queue files in one step, so files that settle together are ordered by priority"""
+        jobs = []
+        for path in paths:
+            duration = probe_duration(path)
+            if duration is None:
+                duration = os.path.getsize(path) / BYTES_PER_SECOND_ESTIMATE
+            jobs.append((path, duration))
+        with self.condition:
+            for path, duration in jobs:
+                self.known.add(path)
+                heapq.heappush(self.queue, (self.priority(path, duration), self.sequence, path, duration, now))
+                self.sequence += 1
+            self.condition.notify()
+            waiting = len(self.queue)
+        for path, duration in jobs:
+            print(f"Queued {path} ({duration:.0f}s)")
+        print(f"{waiting} file(s) waiting")
+
+    def rescan(self):
+        paths = set()
+        for directory in self.directories:
+            paths.update(list_audio(directory))
+        # Files that disappeared while settling are dropped by check()
+        return paths | set(self.settling)
+
+    def run(self, watcher):
+        """Watch until stop() is called; returns after the processing thread has finished"""
+        processor = threading.Thread(target=self.process_forever, name="watch-processor")
+        processor.start()
+        try:
+            paths = self.rescan()
+            while not self.stopping:
+                self.check(paths, time.monotonic())
+                self.write_status()
+                # Wake up when the next settling file is due, or once a second for the status
+                timeout = min([self.settle] + [max(seen[2] + self.settle - time.monotonic(), 0.05)
+                                               for seen in self.settling.values()])
+                changed = watcher.wait(min(timeout, 1.0))
+                paths = self.rescan() if changed is None else changed | set(self.settling)
+        finally:
+            self.stop()
+            processor.join()
+            self.write_status()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+    def process_forever(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                _, _, path, duration, queued_at = heapq.heappop(self.queue)
+                self.running = {"audio_file": path, "audio_seconds": round(duration, 3),
+                                "started": time.time()}
+            started = time.monotonic()
+            record = self.process(path)
+            finished = time.monotonic()
+            record.update(audio_seconds=round(duration, 3), wait_seconds=round(started - queued_at, 3),
+                          seconds=round(finished - started, 3), finished=time.time())
+            with self.condition:
+                self.running = None
+                self.known.discard(path)
+                self.lags.append(finished - queued_at)
+                self.history.append(record)
+                del self.history[:-STATUS_HISTORY]
+                del self.lags[:-STATUS_HISTORY]
+                if record["status"] == "done":
+                    self.processed += 1
+                else:
+                    self.failed += 1
+            print(f"{record['status']}: {path} in {record['seconds']:.1f}s "
+                  f"(waited {record['wait_seconds']:.1f}s)")
+
+    def process(self, path):
+        """Transcribe one file and move it with its output to done/, or to failed/"""
+        directory = os.path.dirname(path)
+        record = {"audio_file": path}
+        # Where each output file this attempt wrote is now, so a failure removes only those
+        written = []
+        try:
+            if self.mode == "speakers":
+                result = transcribe_with_speakers(path, self.hf_token, self.concurrency, self.models)
+                written[:] = save_results(result, path, self.formats)
+            else:
+                audio = load_audio(path)
+                try:
+                    result = self.models.transcribe(audio)
+                finally:
+                    audio.close()
+                written[:] = save_transcription(result, path, self.formats)
+            record["moved_to"] = move_into(path, os.path.join(directory, DONE_DIR))
+            for i, output_file in enumerate(written):
+                written[i] = move_into(output_file, os.path.join(directory, DONE_DIR))
+            record["output_files"] = list(written)
+            record["status"] = "done"
+            record["segments"] = len(result["segments"])
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = f"{type(e).__name__}: {e}"
+            for output_file in written:
+                if os.path.exists(output_file):
+                    os.unlink(output_file)
+            if os.path.exists(path):
+                record["moved_to"] = move_into(path, os.path.join(directory, FAILED_DIR))
+        return record
+
+    def metrics(self):
+        """Queue depth and lag, in seconds"""
+        now = time.monotonic()
+        with self.condition:
+            lags = list(self.lags)
+            return {
+                "queue_depth": len(self.queue),
+                "settling": len(self.settling),
+                "running": 1 if self.running else 0,
+                "processed": self.processed,
+                "failed": self.failed,
+                "oldest_wait_seconds": round(max((now - item[4] for item in self.queue), default=0.0), 3),
+                "queued_audio_seconds": round(sum(item[3] for item in self.queue), 3),
+                "last_lag_seconds": round(lags[-1], 3) if lags else None,
+                "mean_lag_seconds": round(sum(lags) / len(lags), 3) if lags else None,
+                "max_lag_seconds": round(max(lags), 3) if lags else None,
+            }
+
+    def status(self):
+        """Metrics plus the queued, running and recently finished files"""
+        metrics = self.metrics()
+        with self.condition:
+            queued = [{"audio_file": path, "audio_seconds": round(duration, 3)}
+                      for _, _, path, duration, _ in sorted(self.queue)]
+            return {"directories": self.directories, "metrics": metrics, "running": self.running,
+                    "queued": queued, "recent": list(reversed(self.history))}
+
+    def write_status(self):
+        if self.status_file:
+            write_json_atomic(self.status_file, self.status())
+
+
+def serve_metrics(daemon, port, host="127.0.0.1"):
+    """Serve GET /metrics (queue and lag) and GET /status (full index) as JSON in a thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, status = daemon.metrics(), 200
+            elif self.path == "/status":
+                body, status = daemon.status(), 200
+            else:
+                body, status = {"error": f"No such endpoint: {self.path}"}, 404
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="watch-metrics", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe recordings as they arrive in watched folders")
+    parser.add_argument("directories", nargs="+", help="folders to watch")
+    parser.add_argument("--priority", action="append", default=[], metavar="DIR",
+                        help="also watch DIR and run its files before the others (repeatable)")
+    parser.add_argument("--format", dest="output_format", default=["txt"], type=parse_formats,
+                        help=f"output format, or several separated by commas; one of {', '.join(FORMATS)} "
+                             "(default: txt)")
+    parser.add_argument("--mode", default="speakers", choices=MODES,
+                        help="transcribe with speaker labels (default) or transcription only")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help=f"seconds a file must stay unchanged before it is queued "
+                             f"(default: {SETTLE_SECONDS:g})")
+    parser.add_argument("--poll", action="store_true", help="poll the folders instead of using inotify")
+    parser.add_argument("--status", default="watch_status.json",
+                        help="JSON status index (default: watch_status.json)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve /metrics and /status as JSON on this localhost port")
+    parser.add_argument("--concurrency", default="sequential", choices=["sequential", "thread"],
+                        help="how each job runs its two stages (default: sequential)")
+    parser.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"),
+                        help="HuggingFace token (default: $HF_TOKEN)")
+    parser.add_argument("--loader", default=DEFAULT_LOADER,
+                        help="model loader as module:function, e.g. stub_engines:load_stub_models")
+    args = parser.parse_args()
+
+    directories = list(dict.fromkeys(args.directories + args.priority))
+    missing = [directory for directory in directories if not os.path.isdir(directory)]
+    if missing:
+        print(f"Error: folder '{missing[0]}' not found")
+        sys.exit(1)
+
+    if args.mode == "transcribe" and args.loader == DEFAULT_LOADER:
+        # No diarization in this mode, so pyannote (and a token) isn't needed
+        args.loader = TRANSCRIBE_LOADER
+
+    start = time.perf_counter()
+    models = resolve_loader(args.loader)(args.hf_token)
+    print(f"Models loaded in {time.perf_counter() - start:.2f}s")
+
+    daemon = WatchDaemon(directories, models, args.hf_token, args.output_format, args.mode,
+                         args.priority, args.settle, args.status, args.concurrency)
+    if args.metrics_port is not None:
+        serve_metrics(daemon, args.metrics_port)
+        print(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+    watcher = open_watcher(daemon.directories, args.poll)
+    print(f"Watching {', '.join(daemon.directories)} with {type(watcher).__name__}")
+    # A service manager's stop lets the current file finish, like Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    try:
+        daemon.run(watcher)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    print("Stopped; files still waiting are picked up again on the next start")
+
+
+if __name__ == "__main__":
+    main()
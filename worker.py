@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Resident transcription worker that keeps the models loaded between jobs
+
+Requests and replies are JSON lines. A job is {"id": ..., "audio_file": ...}
+and its reply carries the same id plus either the transcribe_with_speakers
+result or an error message. {"command": "ping"} and {"command": "shutdown"}
+are also understood. The worker reads stdin by default, or serves one
+client connection at a time on a Unix socket with --socket.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import socket
+import sys
+import time
+from contextlib import redirect_stdout
+
+from transcriber import transcribe_with_speakers
+
+DEFAULT_LOADER = "transcriber:load_models"
+
+
+def resolve_loader(spec):
+    """Turn 'module:function' into the model loader it names"""
+    module_name, _, function_name = spec.partition(":")
+    if not function_name:
+        raise ValueError(f"Loader '{spec}' must look like module:function")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def handle_request(request, models, hf_token, concurrency="thread"):
+    """
+    Run one request and return (reply, keep_running)
+    """
+    command = request.get("command", "transcribe")
+    reply = {"id": request.get("id")}
+
+    if command == "ping":
+        reply["ok"] = True
+        return reply, True
+    if command == "shutdown":
+        reply["ok"] = True
+        return reply, False
+    if command != "transcribe":
+        reply.update(ok=False, error=f"Unknown command '{command}'")
+        return reply, True
+
+    start = time.perf_counter()
+    try:
+        result = transcribe_with_speakers(request["audio_file"], hf_token, concurrency, models)
+    except Exception as e:
+        reply.update(ok=False, error=f"{type(e).__name__}: {e}")
+    else:
+        reply.update(ok=True, result=result)
+    reply["seconds"] = round(time.perf_counter() - start, 3)
+    return reply, True
+
+
+def handle_line(line, models, hf_token, concurrency):
+    """Decode one JSON line and handle it, reporting malformed input as an error"""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": None, "ok": False, "error": f"Invalid JSON: {e}"}, True
+    return handle_request(request, models, hf_token, concurrency)
+
+
+def serve_stdio(models, hf_token, concurrency="thread"):
+    """Answer requests from stdin on stdout; stage progress goes to stderr"""
+    out = sys.stdout
+    with redirect_stdout(sys.stderr):
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            reply, running = handle_line(line, models, hf_token, concurrency)
+            out.write(json.dumps(reply) + "\n")
+            out.flush()
+            if not running:
+                break
+
+
+def serve_socket(socket_path, models, hf_token, concurrency="thread"):
+    """Answer requests on a Unix socket until a shutdown command arrives"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        print(f"Worker listening on {socket_path}")
+        running = True
+        try:
+            while running:
+                conn, _ = server.accept()
+                with conn, conn.makefile("rw") as stream:
+                    for line in stream:
+                        if not line.strip():
+                            continue
+                        reply, running = handle_line(line, models, hf_token, concurrency)
+                        stream.write(json.dumps(reply) + "\n")
+                        stream.flush()
+                        if not running:
+                            break
+        finally:
+            os.unlink(socket_path)
+
+
+def request_transcription(socket_path, audio_file):
+    """
+    Client side: send one job to a running worker and return its result
+    """
+    request = {"id": 1, "audio_file": os.path.abspath(audio_file)}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        with conn.makefile("rw") as stream:
+            stream.write(json.dumps(request) + "\n")
+            stream.flush()
+            line = stream.readline()
+
+    if not line:
+        raise RuntimeError(f"Worker at {socket_path} closed the connection without replying")
+    reply = json.loads(line)
+    if not reply["ok"]:
+        raise RuntimeError(f"Worker failed: {reply['error']}")
+    return reply["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep transcription models loaded and serve jobs")
+    parser.add_argument("--socket", help="listen on this Unix socket instead of stdin/stdout")
+    parser.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"),
+                        help="HuggingFace token (default: $HF_TOKEN)")
+    parser.add_argument("--loader", default=DEFAULT_LOADER,
+                        help="model loader as module:function, e.g. stub_engines:load_stub_models")
+    parser.add_argument("--concurrency", default="thread", choices=["sequential", "thread"],
+                        help="how each job runs its two stages (default: thread)")
+    args = parser.parse_args()
+
+    loader = resolve_loader(args.loader)
+    start = time.perf_counter()
+    with redirect_stdout(sys.stderr):
+        models = loader(args.hf_token)
+    print(f"Models loaded in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    if args.socket:
+        serve_socket(args.socket, models, args.hf_token, args.concurrency)
+    else:
+        serve_stdio(models, args.hf_token, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Output writers that emit each segment as soon as it is final
+
+Every writer flushes after each segment so long jobs can be tailed and a
+crash keeps everything written so far. The finished files are
+byte-identical to what save_results and save_transcription have always
+written. JSON can only be written at the end because the full text comes
+first, so JSON-Lines is the streaming form of it; the columnar .npz form
+is also written at the end. write_results renders several formats from
+one result in a single pass over its segments.
+"""
+
+import argparse
+import json
+
+from instrumentation import span
+from segment_table import SegmentTable, jsonl_line
+
+
+def format_time_srt(seconds):
+    """Convert seconds to SRT time format"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millis = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def format_time_vtt(seconds):
+    """Convert seconds to WebVTT time format"""
+    return format_time_srt(seconds).replace(",", ".")
+
+
+def _vtt_escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class SegmentWriter:
+    """
+    Base writer: ``write_segment`` for each segment, then ``close(result)``
+
+    ``speakers`` selects the speaker-labelled layout of save_results rather
+    than the plain transcription layout of save_transcription.
+    """
+
+    mode = 'w'
+
+    def __init__(self, output_file, speakers=True):
+        self.output_file = output_file
+        self.speakers = speakers
+        self.file = open(output_file, self.mode)
+        self.start()
+        self.file.flush()
+
+    def start(self):
+        pass
+
+    def write_segment(self, segment):
+        self.segment(segment)
+        self.file.flush()
+
+    def segment(self, segment):
+        raise NotImplementedError
+
+    def finish(self, result):
+        pass
+
+    def close(self, result):
+        """Write whatever needs the full result, then close the file"""
+        try:
+            self.finish(result)
+        finally:
+            self.file.close()
+        return self.output_file
+
+    def abort(self):
+        """Close without finishing, keeping what was written so far"""
+        self.file.close()
+
+
+class TxtWriter(SegmentWriter):
+    """Speaker blocks followed by the full text, or just the full text"""
+
+    def start(self):
+        self.current_speaker = None
+        self.written = []
+        if self.speakers:
+            self.file.write("=== TRANSCRIPTION WITH SPEAKERS ===\n\n")
+
+    def segment(self, segment):
+        if self.speakers:
+            if segment["speaker"] != self.current_speaker:
+                self.current_speaker = segment["speaker"]
+                self.file.write(f"\n{self.current_speaker}:\n")
+            self.file.write(f"{segment['text'].strip()}\n")
+        else:
+            self.file.write(segment["text"])
+            self.written.append(segment["text"])
+
+    def finish(self, result):
+        if self.speakers:
+            self.file.write(f"\n\n=== FULL TEXT ===\n\n")
+            self.file.write(result["text"])
+        elif "".join(self.written) != result["text"]:
+            # Whisper's full text can differ slightly from its joined segments
+            self.file.seek(0)
+            self.file.truncate()
+            self.file.write(result["text"])
+
+
+class SrtWriter(SegmentWriter):
+    """One numbered cue per segment"""
+
+    def start(self):
+        self.index = 0
+
+    def segment(self, segment):
+        self.index += 1
+        start_time = format_time_srt(segment["start"])
+        end_time = format_time_srt(segment["end"])
+        if self.speakers:
+            text = f"{segment['speaker']}: {segment['text'].strip()}"
+        else:
+            text = segment['text'].strip()
+        self.file.write(f"{self.index}\n{start_time} --> {end_time}\n{text}\n\n")
+
+
+class VttWriter(SegmentWriter):
+    """WebVTT cues, with the speaker as a voice span"""
+
+    def start(self):
+        self.file.write("WEBVTT\n\n")
+
+    def segment(self, segment):
+        start_time = format_time_vtt(segment["start"])
+        end_time = format_time_vtt(segment["end"])
+        text = _vtt_escape(segment["text"].strip())
+        if self.speakers and segment.get("speaker") is not None:
+            text = f"<v {_vtt_escape(segment['speaker'])}>{text}"
+        self.file.write(f"{start_time} --> {end_time}\n{text}\n\n")
+
+
+class JsonLinesWriter(SegmentWriter):
+    """One JSON object per segment per line"""
+
+    def segment(self, segment):
+        self.file.write(jsonl_line(segment))
+
+
+class JsonWriter(SegmentWriter):
+    """The full result as indented JSON, written on close"""
+
+    def segment(self, segment):
+        pass
+
+    def finish(self, result):
+        json.dump(result, self.file, indent=2)
+
+
+class NpzWriter(SegmentWriter):
+    """The result as a columnar SegmentTable in a NumPy .npz file, written on close"""
+
+    mode = 'wb'
+
+    def segment(self, segment):
+        pass
+
+    def finish(self, result):
+        SegmentTable.from_result(result).save_npz(self.file)
+
+
+WRITERS = {
+    "txt": TxtWriter,
+    "srt": SrtWriter,
+    "vtt": VttWriter,
+    "json": JsonWriter,
+    "jsonl": JsonLinesWriter,
+    "npz": NpzWriter,
+}
+
+
+FORMATS = tuple(WRITERS)
+
+
+def parse_formats(value):
+    """
+    Parse a comma-separated list of formats such as "txt,srt,vtt"
+
+    Usable as an argparse ``type``; duplicates are dropped.
+    """
+    formats = list(dict.fromkeys(fmt.strip().lower() for fmt in value.split(",") if fmt.strip()))
+    unknown = [fmt for fmt in formats if fmt not in WRITERS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(f"unknown output format '{','.join(unknown) or value}', "
+                                         f"expected one or more of: {', '.join(WRITERS)}")
+    return formats
+
+
+def open_writer(output_format, output_file, speakers=True):
+    """Create the writer for an output format"""
+    try:
+        writer_class = WRITERS[output_format]
+    except KeyError:
+        raise ValueError(f"Unknown output format '{output_format}', "
+                         f"expected one of: {', '.join(WRITERS)}") from None
+    return writer_class(output_file, speakers)
+
+
+class WriterGroup:
+    """Send each segment to several writers"""
+
+    def __init__(self, writers):
+        self.writers = writers
+
+    def write_segment(self, segment):
+        for writer in self.writers:
+            writer.write_segment(segment)
+
+    def close(self, result):
+        """Finish every writer and return their output files"""
+        with span("output", formats=[type(writer).__name__ for writer in self.writers]):
+            return [writer.close(result) for writer in self.writers]
+
+    def abort(self):
+        for writer in self.writers:
+            writer.abort()
+
+
+def open_streaming(output_format, output_path, speakers=True):
+    """
+    Open the writers for streaming one format or a list of formats
+
+    ``output_path(fmt)`` names the file for a format. JSON is only written
+    on close, so a JSON-Lines file is streamed alongside it.
+    """
+    formats = [output_format] if isinstance(output_format, str) else list(output_format)
+    if "json" in formats and "jsonl" not in formats:
+        formats.append("jsonl")
+    writers = []
+    try:
+        for fmt in formats:
+            writers.append(open_writer(fmt, output_path(fmt), speakers))
+    except BaseException:
+        WriterGroup(writers).abort()
+        raise
+    return WriterGroup(writers)
+
+
+def write_results(result, formats, output_path, speakers=True):
+    """
+    Write a complete result in several formats with one pass over its segments
+
+    ``output_path(fmt)`` names the file for a format. Returns the files
+    written, in the order of ``formats``.
+    """
+    with span("output", formats=list(formats)):
+        writers = []
+        try:
+            for fmt in formats:
+                writers.append(open_writer(fmt, output_path(fmt), speakers))
+            for segment in result["segments"]:
+                for writer in writers:
+                    writer.segment(segment)
+        except BaseException:
+            WriterGroup(writers).abort()
+            raise
+        return [writer.close(result) for writer in writers]
+
+
+def write_result(result, output_format, output_file, speakers=True):
+    """Write a complete result in one go"""
+    return write_results(result, [output_format], lambda fmt: output_file, speakers)[0]